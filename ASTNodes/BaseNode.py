@@ -3,7 +3,7 @@ from abc import ABC, abstractmethod
 from DataManager import data_manager
 from Exceptions import PreProcessorError, RegretDBError
 from Operators.LogicalOperators import Operator
-from TokenTypes import Identifier, Literal
+from TokenTypes import Identifier
 
 
 class ASTNode(ABC):
@@ -92,7 +92,7 @@ class ASTNode(ABC):
         return table_name, col_name
 
     def check_expression(self, tables, where_expr):
-        """checks all columns and qualifies them"""
+        """checks all columns and qualifies them, literals are left in place"""
 
         def recurse(node):
             if isinstance(node, Operator):
@@ -104,9 +104,7 @@ class ASTNode(ABC):
                 column = self.check_column(tables, node.value)
                 return column
 
-            elif isinstance(node, Literal):
-                return node.value
-
+            # Literals are kept as objects, so a cached plan can re-bind their values
             return node
 
         return recurse(where_expr)
@@ -159,4 +157,4 @@ class ASTNode(ABC):
                     f"ERROR: Column type mismatch for foreign key: '{qualified_col_name}' in '{table_name}' should match the type of '{referenced_column}' in '{referenced_table}'")
 
             # Add the foreign key relationship to the manager
-            data_manager.foreign_key_manager.add_foreign_key(qualified_col_name, referenced_qualified_col)  # todo this must be moved outside
+            data_manager.foreign_key_manager.add_foreign_key(qualified_col_name, referenced_qualified_col, *(constraint.arg2 or ()))  # todo this must be moved outside
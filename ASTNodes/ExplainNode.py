@@ -0,0 +1,21 @@
+from ASTNodes.BaseNode import ASTNode
+
+
+class ExplainStmt(ASTNode):
+    def __init__(self, statement, analyze):
+        self.statement = statement  # the explained SELECT, INSERT, UPDATE or DELETE
+        self.analyze = analyze  # EXPLAIN ANALYZE executes the statement
+        super().__init__()
+
+    def __repr__(self):
+        return f"ExplainStmt(analyze={self.analyze}, statement={self.statement})"
+
+    def set_sql_text(self, sql_text):
+        super().set_sql_text(sql_text)
+        self.statement.set_sql_text(sql_text)
+
+    def perform_checks(self):
+        self.statement.verify()
+
+    def result_type(self, column):
+        return 'TEXT'
@@ -1,16 +1,24 @@
 from ASTNodes.BaseNode import ASTNode
 from DataManager import data_manager
 from Exceptions import PreProcessorError
+from TokenTypes import Identifier
 
 
 class InsertStmt(ASTNode):
-    def __init__(self, table, columns, values):
+    def __init__(self, table, columns, values, conflict_column=None, conflict_action=None, conflict_assignments=()):
         self.table = table
         self.columns = columns  # list of column names (or None)
         self.values = values  # list of values
+        # ON CONFLICT (conflict_column) DO NOTHING | DO UPDATE SET conflict_assignments
+        self.conflict_column = conflict_column
+        self.conflict_action = conflict_action  # None, 'NOTHING' or 'UPDATE'
+        self.conflict_assignments = conflict_assignments  # list of (column, Literal or EXCLUDED Identifier)
         super().__init__()
 
     def __repr__(self):
+        if self.conflict_action:
+            return (f"InsertStmt(table={self.table}, columns={self.columns}, values={self.values}, "
+                    f"on_conflict={self.conflict_column}, action={self.conflict_action}, assignments={self.conflict_assignments})")
         return f"InsertStmt(table={self.table}, columns={self.columns}, values={self.values})"
 
     def perform_checks(self):
@@ -38,3 +46,24 @@ class InsertStmt(ASTNode):
                 for constraint in table_constraints[col]:
                     if constraint.type == "NOT NULL":
                         raise PreProcessorError(f"ERROR: Column '{col}' must be specified (NOT NULL constraint)")
+
+        if self.conflict_action:
+            self.check_on_conflict(tables, table_constraints)
+
+    def check_on_conflict(self, tables, table_constraints):
+        self.conflict_column = self.check_column(tables, self.conflict_column.value)
+        if not any(constraint.type in ('PRIMARY KEY', 'UNIQUE') for constraint in table_constraints[self.conflict_column]):
+            raise PreProcessorError(f"ON CONFLICT column '{self.conflict_column}' must be PRIMARY KEY or UNIQUE")
+
+        column_types = data_manager.get_column_types_for_table(self.table)
+        assignments = []
+        for column, value in self.conflict_assignments:
+            column = self.check_column(tables, column.value)
+            if isinstance(value, Identifier):
+                value.value = self.check_column(tables, value.value)
+                if column_types[value.value] != column_types[column]:
+                    raise PreProcessorError(f"Expected type: {column_types[column]} got: {column_types[value.value]} in column: '{column}'")
+            else:
+                self.check_type(self.table, column, value)
+            assignments.append((column, value))
+        self.conflict_assignments = assignments
@@ -1,26 +1,37 @@
 from ASTNodes.BaseNode import ASTNode
 from DataManager import data_manager
 from Exceptions import PreProcessorError
+from TokenTypes import Aggregate
 
 
 class SelectStmt(ASTNode):
-    def __init__(self, columns, tables, where_expr, order_by):
-        self.columns = columns
+    def __init__(self, columns, tables, where_expr, order_by, group_by=None):
+        self.columns = columns  # names of the result columns after verify(), aggregates are named like COUNT(*)
         self.tables = tables
         self.where_expr = where_expr
         self.order_by = order_by
+        self.group_by = group_by
+        self.aggregates = []  # Aggregate objects of the select list
         super().__init__()
 
     def __repr__(self):
-        return f"SelectStmt(columns={self.columns}, tables={self.tables}, where={self.where_expr}, order_by={self.order_by})"
+        return f"SelectStmt(columns={self.columns}, tables={self.tables}, where={self.where_expr}, group_by={self.group_by}, order_by={self.order_by})"
+
+    @property
+    def is_aggregate(self):
+        return bool(self.aggregates or self.group_by)
 
     def perform_checks(self):
         # Normalizing table and columns
         self.tables = [table.value for table in self.tables]
-        self.columns = [column.value for column in self.columns]
-
         self.check_tables(self.tables)
 
+        self.aggregates = [column for column in self.columns if isinstance(column, Aggregate)]
+        if self.aggregates or self.group_by:
+            self.check_aggregates()
+        else:
+            self.columns = [column.value for column in self.columns]
+
         # expanding *
         expanded_columns = []
         for col in self.columns:
@@ -32,12 +43,13 @@ class SelectStmt(ASTNode):
                 self.check_table(table_name)
                 expanded_columns.extend([col_name for col_name in data_manager.get_columns_for_table(table_name)])
             else:
-                PreProcessorError(f"Unable to expand: {col}")
+                expanded_columns.append(col)
 
         self.columns = expanded_columns
 
         # Checking columns and qualifying them
-        self.columns = self.check_columns(self.tables, self.columns)
+        if not self.is_aggregate:
+            self.columns = self.check_columns(self.tables, self.columns)
 
         # Checking the expression and qualifying column names in the where expr
         if self.where_expr:
@@ -47,11 +59,51 @@ class SelectStmt(ASTNode):
         if self.order_by:
             self.order_by = self.check_order_by()
 
+    def check_aggregates(self):
+        """Qualifies the columns of the aggregates and of GROUP BY, plain columns of the select list must be grouped"""
+        self.group_by = self.check_columns(self.tables, [column.value for column in self.group_by or []])
+
+        columns = []
+        for item in self.columns:
+            if not isinstance(item, Aggregate):
+                if item.value == '*' or item.value.endswith('.*'):
+                    raise PreProcessorError("'*' can't be selected together with aggregates or GROUP BY", word='*')
+                column = self.check_column(self.tables, item.value)
+                if column not in self.group_by:
+                    raise PreProcessorError(f"Column '{column}' must appear in the GROUP BY clause or be used in an aggregate function", word=item.value)
+                columns.append(column)
+                continue
+
+            if item.column.value != '*':
+                column = self.check_column(self.tables, item.column.value)
+                item.column = column
+                if item.function in ('SUM', 'AVG'):
+                    table_name = column.split('.')[0]
+                    if data_manager.get_column_types_for_table(table_name)[column] != 'NUMBER':
+                        raise PreProcessorError(f"{item.function} requires a NUMBER column, '{column}' is not", word=column.split('.')[1])
+            else:
+                item.column = '*'
+            if item.name in columns:
+                raise PreProcessorError(f"Duplicate column '{item.name}' found")
+            columns.append(item.name)
+        self.columns = columns
+
+    def result_type(self, column):
+        """Declared type of a result column"""
+        for aggregate in self.aggregates:
+            if aggregate.name == column:
+                if aggregate.function in ('COUNT', 'SUM', 'AVG'):
+                    return 'NUMBER'
+                column = aggregate.column
+        return data_manager.get_column_types_for_table(column.split('.')[0])[column]
+
     def check_order_by(self):
         seen = []
         new_order_by = []
         for element in self.order_by:
             column = self.check_column(self.tables, element[0].value)
+            if self.is_aggregate and column not in self.group_by:
+                raise PreProcessorError(f"ORDER BY column '{column}' must appear in the GROUP BY clause", word=element[0].value)
             if column in seen:
                 raise PreProcessorError(f"Duplicate column '{column}' found", word=column)
             seen.append(column)
@@ -0,0 +1,20 @@
+from ASTNodes.BaseNode import ASTNode
+from MemoryStats import STATS_COLUMNS
+
+
+class ShowTableStatsStmt(ASTNode):
+    def __init__(self, table=None):
+        self.table = table  # None shows every table
+        self.columns = STATS_COLUMNS
+        super().__init__()
+
+    def __repr__(self):
+        return f"ShowTableStatsStmt(table={self.table})"
+
+    def perform_checks(self):
+        if self.table is not None:
+            self.table = self.table.value
+            self.check_table(self.table)
+
+    def result_type(self, column):
+        return 'TEXT' if column == 'table' else 'NUMBER'
@@ -0,0 +1,13 @@
+from ASTNodes.BaseNode import ASTNode
+
+
+class TransactionStmt(ASTNode):
+    def __init__(self, action):
+        self.action = action  # BEGIN, COMMIT or ROLLBACK
+        super().__init__()
+
+    def __repr__(self):
+        return f"TransactionStmt(action={self.action})"
+
+    def perform_checks(self):
+        pass
@@ -23,7 +23,7 @@ class UpdateStmt(ASTNode):
 
             self.check_type(self.table, column, assignment[1])
 
-            new_assignments.append((column, assignment[1].value))
+            new_assignments.append((column, assignment[1]))
 
         self.assignments = new_assignments
 
@@ -0,0 +1,255 @@
+import asyncio
+import contextlib
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from DataManager import data_manager
+from Exceptions import ProgrammingError
+from LALR import Parser
+from RegretDB import RegretDB
+
+"""
+asyncio front-end:
+
+    db = AsyncRegretDB()
+    await db.execute("INSERT INTO users (id, name) VALUES (?, ?)", (1, 'Alice'))
+    async with await db.execute("SELECT * FROM users") as cursor:
+        async for row in cursor:
+            ...
+    async with db.transaction() as transaction:
+        await transaction.execute("UPDATE users SET name = 'Bob' WHERE id = 1")
+    await db.close()
+
+Statements never run on the event loop thread:
+- SELECTs run on a pool of reader threads, each one reads its own MVCC snapshot, so they run concurrently
+  with each other and with the writer. Rows are fetched in batches of `batch_size`, every batch is a
+  separate await, so a large scan doesn't hold back other coroutines.
+- All other statements are put on a queue consumed by a single writer task, which runs them on one
+  writer thread. Statements queued while the writer is busy are run together in one hop to the thread,
+  each one is still committed (or fails) on its own.
+
+A transaction runs on the writer thread too, plain writes issued meanwhile wait until it ends.
+"""
+
+TRANSACTION_KEYWORDS = ('BEGIN', 'COMMIT', 'ROLLBACK')
+
+
+class AsyncRegretDB:
+    def __init__(self, max_readers=4, batch_size=1000, write_batch_size=100, **engine_options):
+        self.batch_size = batch_size  # rows fetched per await
+        self.write_batch_size = write_batch_size  # max statements run per hop to the writer thread
+        self.engine_options = engine_options  # passed to the RegretDB of every thread
+        self.parser = Parser()
+        self.closed = False
+
+        self._local = threading.local()
+        self._readers = ThreadPoolExecutor(max_readers, thread_name_prefix='regretdb-reader')
+        self._writer = ThreadPoolExecutor(1, thread_name_prefix='regretdb-writer')
+        self._queue = asyncio.Queue()
+        self._writer_task = None
+        self._transaction_lock = asyncio.Lock()
+        self._transaction_task = None  # task running the block of db.transaction()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def execute(self, sql_stmt, parameters=None):
+        """Executes a statement and returns an AsyncCursor"""
+        self._check_open()
+        tokens = self.parser.tokenize(sql_stmt)
+        kind = tokens[0].type if tokens else None
+        if kind in TRANSACTION_KEYWORDS:
+            raise ProgrammingError("Transactions must be run with 'async with db.transaction()'")
+
+        if kind == 'SELECT':
+            loop = asyncio.get_running_loop()
+            cursor = await loop.run_in_executor(self._readers, self._execute, sql_stmt, parameters, tokens)
+            return AsyncCursor(cursor, self._read, self.batch_size)
+
+        await self._wait_for_transaction()
+        cursor = await self._write(self._execute, sql_stmt, parameters, tokens)
+        return AsyncCursor(cursor, self._write, self.batch_size)
+
+    async def executemany(self, sql_stmt, seq_of_parameters):
+        """Executes a statement for every parameter sequence on the writer, returns the number of affected rows"""
+        self._check_open()
+        await self._wait_for_transaction()
+        return await self._write(lambda: self._engine().executemany(sql_stmt, list(seq_of_parameters)))
+
+    @contextlib.asynccontextmanager
+    async def transaction(self):
+        """Runs the statements of the block in one transaction, committed at the end of the block
+           and rolled back if the block raises"""
+        self._check_open()
+        async with self._transaction_lock:
+            await self._write(self._execute, 'BEGIN', None, None)
+            self._transaction_task = asyncio.current_task()
+            try:
+                yield AsyncTransaction(self)
+            except BaseException:
+                await self._write(self._rollback)
+                raise
+            finally:
+                self._transaction_task = None
+            await self._write(self._execute, 'COMMIT', None, None)
+
+    async def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self._writer_task is not None:
+            self._queue.put_nowait(None)
+            await self._writer_task
+        self._readers.shutdown(wait=False)
+        self._writer.shutdown(wait=False)
+
+    def _check_open(self):
+        if self.closed:
+            raise ProgrammingError("Database is closed")
+
+    # Runs on the reader and writer threads, every thread uses its own RegretDB
+    def _engine(self):
+        engine = getattr(self._local, 'engine', None)
+        if engine is None:
+            engine = self._local.engine = RegretDB(**self.engine_options)
+        return engine
+
+    def _execute(self, sql_stmt, parameters, tokens):
+        return self._engine().execute(sql_stmt, parameters, tokens)
+
+    def _rollback(self):
+        # A deadlock or a failed COMMIT already rolled the transaction back
+        if data_manager.in_transaction():
+            self._engine().execute('ROLLBACK')
+
+    @staticmethod
+    def _run_batch(batch):
+        results = []
+        for func, args in batch:
+            try:
+                results.append((True, func(*args)))
+            except Exception as e:
+                results.append((False, e))
+        return results
+
+    # Scheduling
+    async def _read(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._readers, func, *args)
+
+    async def _write(self, func, *args):
+        """Queues a call for the writer thread and waits for its result"""
+        if self._writer_task is None:
+            self._writer_task = asyncio.create_task(self._write_loop())
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((func, args, future))
+        return await future
+
+    async def _wait_for_transaction(self):
+        # The task running the transaction would wait for itself
+        if self._transaction_task is not None and self._transaction_task is asyncio.current_task():
+            raise ProgrammingError("use the AsyncTransaction handle inside db.transaction()")
+        # Writes issued after the lock is released are queued before any new BEGIN
+        if self._transaction_lock.locked():
+            async with self._transaction_lock:
+                pass
+
+    async def _write_loop(self):
+        loop = asyncio.get_running_loop()
+        stop = False
+        while not stop:
+            items = [await self._queue.get()]
+            while not self._queue.empty() and len(items) < self.write_batch_size:
+                items.append(self._queue.get_nowait())
+            if None in items:
+                stop = True
+                items = [item for item in items if item is not None]
+            items = [item for item in items if not item[2].cancelled()]
+            if not items:
+                continue
+
+            results = await loop.run_in_executor(self._writer, self._run_batch, [(func, args) for func, args, _ in items])
+            for (_, _, future), (ok, value) in zip(items, results):
+                if future.cancelled():
+                    continue
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+
+
+class AsyncTransaction:
+    def __init__(self, db):
+        self.db = db
+
+    async def execute(self, sql_stmt, parameters=None):
+        """Executes a statement inside the transaction, SELECTs see its uncommitted changes"""
+        cursor = await self.db._write(self.db._execute, sql_stmt, parameters, None)
+        return AsyncCursor(cursor, self.db._write, self.db.batch_size)
+
+
+class AsyncCursor:
+    """
+    Async wrapper of a Cursor, rows are fetched in batches by `run`: batches of a SELECT on any thread of
+    the reader pool (the cursor reads its snapshot from any thread), other statements' on the writer thread.
+    """
+
+    def __init__(self, cursor, run, batch_size):
+        self.cursor = cursor
+        self.columns = cursor.columns
+        self.rowcount = cursor.rowcount
+        self.returns_rows = cursor.returns_rows
+        self.batch_size = batch_size
+        self.__run = run
+        self.__buffer = deque()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        row = await self.fetchone()
+        if row is None:
+            raise StopAsyncIteration
+        return row
+
+    async def fetchone(self):
+        if not self.__buffer:
+            self.__buffer.extend(await self.__fetch(self.batch_size))
+        return self.__buffer.popleft() if self.__buffer else None
+
+    async def fetchmany(self, size=None):
+        size = self.batch_size if size is None else size
+        rows = [self.__buffer.popleft() for _ in range(min(size, len(self.__buffer)))]
+        if len(rows) < size:
+            rows.extend(await self.__fetch(size - len(rows)))
+        return rows
+
+    async def fetchall(self):
+        rows = list(self.__buffer)
+        self.__buffer.clear()
+        while True:
+            batch = await self.__fetch(self.batch_size)
+            rows.extend(batch)
+            if len(batch) < self.batch_size:
+                return rows
+
+    async def __fetch(self, size):
+        if self.cursor.closed and self.returns_rows:
+            return []
+        return await self.__run(self.cursor.fetchmany, size)
+
+    async def close(self):
+        self.__buffer.clear()
+        self.cursor.close()
+
+    def __repr__(self):
+        return f"AsyncCursor(columns={self.columns}, rowcount={self.rowcount}, closed={self.cursor.closed})"
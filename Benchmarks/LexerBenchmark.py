@@ -0,0 +1,106 @@
+"""
+Lexer/parser benchmark comparing the regex Tokenizer with the hand-written FastTokenizer.
+
+Run from the repository root:
+    python -m Benchmarks.LexerBenchmark [--iterations N]
+
+Before timing anything the tokens produced by both tokenizers are compared over the corpus
+(and a few edge cases), the benchmark fails if they differ.
+"""
+import argparse
+import time
+
+from Exceptions import SQLSyntaxError
+from LALR import Tokenizer, FastTokenizer, Parser
+
+CORPUS = [
+    "CREATE TABLE users (id NUMBER PRIMARY KEY, name TEXT NOT NULL UNIQUE, email TEXT UNIQUE, age NUMBER DEFAULT 18, active BOOL DEFAULT TRUE)",
+    "CREATE TABLE orders (id NUMBER PRIMARY KEY, user_id NUMBER FOREIGN KEY REFERENCES users(id), amount NUMBER, note TEXT DEFAULT 'none')",
+    "INSERT INTO users (id, name, email, age) VALUES (1, 'Alice', 'alice@example.com', 31)",
+    "INSERT INTO orders (id, user_id, amount, note) VALUES (10, 1, 250, 'first order; paid')",
+    "SELECT * FROM users",
+    "SELECT users.id, users.name FROM users WHERE id = 1",
+    "SELECT users.name, orders.amount FROM users, orders WHERE users.id = orders.user_id AND orders.amount >= 100 ORDER BY orders.amount DESC, users.name ASC",
+    "SELECT id, name FROM users WHERE (age > 18 AND active = true) OR (name != 'Bob' AND email IS NOT NULL)",
+    "UPDATE users SET name = 'Alice Smith', age = 32 WHERE id = 1",
+    "UPDATE orders SET amount = 0 WHERE NOT amount <= 10 AND note IS NULL",
+    "DELETE FROM orders WHERE user_id = 1",
+    "DELETE FROM users WHERE age < 18 OR FALSE",
+    "ALTER TABLE users ADD COLUMN nickname TEXT DEFAULT 'nick'",
+    "ALTER TABLE users DROP COLUMN nickname CASCADE",
+    "ALTER TABLE users MODIFY COLUMN age NUMBER NOT NULL",
+    "DROP TABLE orders",
+]
+
+# Inputs exercising the corners of the regex grammar, only used for the equivalence check
+EDGE_CASES = [
+    "SELECT trueish, True, FALSE_, _false, x1true FROM t WHERE a=1.5 AND b<=.5 AND c>=2. AND d!=3",
+    "select\t*\nfrom\r\nt where\tname='' or name = 'a''b'",
+    "SELECT a.b, c . d FROM t1,t2;SELECT 1;",
+    "INSERT INTO t (x) VALUES (b'1A2B')",
+    "SELECT é FROM t",
+    "SELECT a FROM t WHERE a ! b",
+    "SELECT a FROM t WHERE a = 'unterminated",
+    "SELECT 12abc, abc12, trueé FROM t WHERE x = ١٢",
+    "INSERT INTO t (a, b) VALUES (?, ?)",
+]
+
+
+def token_tuples(tokenizer, sql):
+    try:
+        return [(t.type, t.value, t.length, t.offset) for t in tokenizer.tokenize(sql)]
+    except SQLSyntaxError as e:
+        return ('error', e.message)
+
+
+def check_equivalence(reference, candidate, statements):
+    mismatches = []
+    for sql in statements:
+        expected = token_tuples(reference, sql)
+        actual = token_tuples(candidate, sql)
+        if expected != actual:
+            mismatches.append((sql, expected, actual))
+    return mismatches
+
+
+def bench(label, func, corpus, iterations, tokens_per_round):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        for sql in corpus:
+            func(sql)
+    elapsed = time.perf_counter() - started
+
+    statements = len(corpus) * iterations
+    print(f"{label:<28} {statements / elapsed:>12,.0f} stmt/s {tokens_per_round * iterations / elapsed:>14,.0f} tokens/s")
+    return elapsed
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Benchmark the SQL tokenizers and the parser")
+    arg_parser.add_argument('--iterations', type=int, default=2000, help="rounds over the corpus")
+    args = arg_parser.parse_args()
+
+    regex_tokenizer = Tokenizer()
+    fast_tokenizer = FastTokenizer()
+
+    mismatches = check_equivalence(regex_tokenizer, fast_tokenizer, CORPUS + EDGE_CASES)
+    if mismatches:
+        for sql, expected, actual in mismatches:
+            print(f"MISMATCH for {sql!r}:\n  regex: {expected}\n  fast:  {actual}")
+        raise SystemExit(1)
+    print(f"Token streams identical for {len(CORPUS) + len(EDGE_CASES)} statements\n")
+
+    tokens_per_round = sum(len(regex_tokenizer.tokenize(sql)) for sql in CORPUS)
+    regex_parser = Parser(regex_tokenizer)
+    fast_parser = Parser(fast_tokenizer)
+
+    regex_lex = bench("tokenize (regex)", regex_tokenizer.tokenize, CORPUS, args.iterations, tokens_per_round)
+    fast_lex = bench("tokenize (fast)", fast_tokenizer.tokenize, CORPUS, args.iterations, tokens_per_round)
+    regex_parse = bench("tokenize+parse (regex)", regex_parser.parse, CORPUS, args.iterations, tokens_per_round)
+    fast_parse = bench("tokenize+parse (fast)", fast_parser.parse, CORPUS, args.iterations, tokens_per_round)
+
+    print(f"\nLexer speedup: {regex_lex / fast_lex:.2f}x, tokenize+parse speedup: {regex_parse / fast_parse:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,241 @@
+"""
+Comparison of RegretDB with an in-memory sqlite3 database on the same SQL.
+
+Run from the repository root:
+    python -m Benchmarks.SqliteComparison [--rows N] [--repeat N] [--output results.json]
+
+Both engines get the same schema and data (see WorkloadBenchmark) and run every statement of the corpus,
+which sticks to the part of SQL RegretDB supports. Results are checked before anything is compared:
+rows of queries with ORDER BY must be equal in order, other queries as multisets, DML statements must
+affect the same number of rows and make the same changes to the tables. A statement failing on only one
+of the engines is a mismatch as well.
+
+The report lists the median time of every statement on both engines and their ratio, slowest relative
+to sqlite3 first, so the operators furthest behind (joins, Sort, constraint checks...) stand out.
+The script exits with status 1 if any result differs.
+"""
+import argparse
+import json
+import random
+import sqlite3
+import statistics
+import time
+from collections import Counter
+
+from Benchmarks.WorkloadBenchmark import SCHEMA, REGIONS, DatasetState
+from Exceptions import RegretDBError
+from RegretDB import RegretDB
+
+TABLES = ['regions', 'users', 'orders']
+
+
+class Statement:
+    def __init__(self, name, operator, sql, parameters=(), ordered=False):
+        self.name = name
+        self.operator = operator  # the operator or check the statement exercises, for the report
+        self.sql = sql
+        self.parameters = parameters  # a tuple, or a function of the repetition number for statements changing data
+        self.ordered = ordered  # rows must come in the same order
+
+    def parameters_for(self, repetition):
+        return self.parameters(repetition) if callable(self.parameters) else self.parameters
+
+    @property
+    def is_query(self):
+        return self.sql.lstrip().upper().startswith('SELECT')
+
+
+def corpus(state):
+    free_user = state.users_with_orders + 1  # users after this one have no orders
+    return [
+        Statement('point', 'TableScan+Filter', "SELECT * FROM users WHERE id = ?", (state.users // 3,)),
+        Statement('range', 'TableScan+Filter', "SELECT orders.id, orders.amount FROM orders WHERE amount >= ? AND amount < ?", (100, 120)),
+        Statement('predicate', 'Filter', "SELECT id, email FROM users WHERE (age > 60 AND region_id = 3) OR NOT age >= 19", ()),
+        Statement('is_null', 'Filter', "SELECT id FROM orders WHERE note IS NULL OR amount = 1", ()),
+        Statement('order_by', 'Sort', "SELECT orders.id, orders.amount FROM orders WHERE amount < ? ORDER BY amount DESC, id ASC", (200,), ordered=True),
+        Statement('order_by_all', 'Sort', "SELECT id, region_id, age FROM users ORDER BY region_id ASC, age DESC, id ASC", (), ordered=True),
+        Statement('join', 'SortMergeJoin', "SELECT users.email, regions.name FROM users, regions WHERE users.region_id = regions.id AND users.age = ?", (42,)),
+        Statement('join_group_by', 'SortMergeJoin+HashAggregate', "SELECT regions.name, COUNT(*) FROM users, regions WHERE users.region_id = regions.id GROUP BY regions.name", ()),
+        Statement('count', 'TableCount', "SELECT COUNT(*) FROM orders", ()),
+        Statement('group_by', 'HashAggregate', "SELECT region_id, COUNT(*), MIN(age), MAX(age), SUM(age) FROM users GROUP BY region_id", ()),
+        Statement('group_by_order', 'HashAggregate+Sort', "SELECT user_id, SUM(amount) FROM orders WHERE amount > ? GROUP BY user_id ORDER BY user_id ASC", (900,), ordered=True),
+        Statement('insert', 'Insert (PK, FK, DEFAULT)', "INSERT INTO orders (id, user_id, amount) VALUES (?, ?, ?)",
+                  lambda i: (state.orders + 1 + i, 1 + i, 10)),
+        Statement('upsert', 'Upsert (conflict lookup)', "INSERT INTO users (id, email, region_id, age) VALUES (?, ?, ?, ?) ON CONFLICT (id) DO UPDATE SET age = EXCLUDED.age",
+                  lambda i: (10 + i, f"upsert{i}@example.com", 1, 77)),
+        Statement('update', 'Update (UNIQUE check)', "UPDATE users SET email = ? WHERE id = ?",
+                  lambda i: (f"renamed{i}@example.com", 5 + i)),
+        Statement('update_fk', 'Update (FK check)', "UPDATE orders SET user_id = ? WHERE id = ?",
+                  lambda i: (2 + i, 1 + i)),
+        Statement('delete', 'Delete (FK check)', "DELETE FROM users WHERE id = ?",
+                  lambda i: (free_user + i,)),
+    ]
+
+
+def generate_data(state, seed):
+    """Rows of every table as (columns, [values, ...]), the same for both engines"""
+    rng = random.Random(seed)
+    users = []
+    for i in range(1, state.users + 1):
+        users.append((i, f"user{i}@example.com", rng.randint(1, REGIONS), rng.randint(18, 80) if i % 2 else 30))
+    return [
+        ('regions', ('id', 'name'), [(i, f"region{i}") for i in range(1, REGIONS + 1)]),
+        ('users', ('id', 'email', 'region_id', 'age'), users),
+        ('orders', ('id', 'user_id', 'amount'),
+         [(i, rng.randint(1, state.users_with_orders), rng.randint(1, 1000)) for i in range(1, state.orders + 1)]),
+    ]
+
+
+def to_sqlite(sql):
+    """RegretDB declares a foreign key on the column as FOREIGN KEY REFERENCES, SQL as REFERENCES"""
+    return sql.replace('FOREIGN KEY REFERENCES', 'REFERENCES')
+
+
+class RegretDBEngine:
+    name = 'regretdb'
+
+    def __init__(self):
+        self.db = RegretDB()
+
+    def execute(self, sql, parameters=()):
+        """Returns the result rows of a query or the number of affected rows"""
+        cursor = self.db.execute(sql, parameters or None)
+        if not cursor.returns_rows:
+            return cursor.rowcount
+        return [tuple(row[column] for column in cursor.columns) for row in cursor.fetchall()]
+
+    def load(self, table, columns, rows):
+        self.db.executemany(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", rows)
+
+
+class SqliteEngine:
+    name = 'sqlite3'
+
+    def __init__(self):
+        self.connection = sqlite3.connect(':memory:', isolation_level=None)  # autocommit like RegretDB
+        self.connection.execute("PRAGMA foreign_keys = ON")
+
+    def execute(self, sql, parameters=()):
+        cursor = self.connection.execute(to_sqlite(sql), parameters)
+        if cursor.description is None:
+            return cursor.rowcount
+        return cursor.fetchall()
+
+    def load(self, table, columns, rows):
+        self.connection.execute("BEGIN")
+        self.connection.executemany(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", rows)
+        self.connection.execute("COMMIT")
+
+
+def normalize(result, ordered):
+    """Makes results of both engines comparable: booleans as integers, floats rounded, unordered rows sorted"""
+    if not isinstance(result, list):
+        return result
+    rows = [tuple(int(value) if isinstance(value, bool) else round(value, 9) if isinstance(value, float) else value
+                  for value in row) for row in result]
+    return rows if ordered else sorted(rows, key=repr)
+
+
+def run_statement(engine, statement, repeat):
+    """Runs a statement `repeat` times, returns (median seconds, first result or exception)"""
+    timings = []
+    first = None
+    for repetition in range(repeat):
+        parameters = statement.parameters_for(repetition)
+        start = time.perf_counter()
+        try:
+            result = engine.execute(statement.sql, parameters)
+        except (RegretDBError, sqlite3.Error) as e:
+            result = e
+        timings.append(time.perf_counter() - start)
+        if repetition == 0:
+            first = result
+        if isinstance(result, Exception):
+            break
+    return statistics.median(timings), first
+
+
+def table_contents(engine):
+    return {table: Counter(engine.execute(f"SELECT * FROM {table}")) for table in TABLES}
+
+
+def changes(before, after):
+    """Rows removed from and added to every table, the engines may differ in rows earlier statements changed"""
+    return {table: (before[table] - after[table], after[table] - before[table]) for table in TABLES}
+
+
+def describe_result(result):
+    if isinstance(result, Exception):
+        return f"{type(result).__name__}: {getattr(result, 'message', result)}"
+    if isinstance(result, list):
+        return f"{len(result)} rows"
+    return f"{result} rows affected"
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Compare RegretDB with sqlite3 on the same statements")
+    arg_parser.add_argument('--rows', type=int, default=2000, help="total rows of the generated tables")
+    arg_parser.add_argument('--repeat', type=int, default=5, help="runs of every statement, the median is reported")
+    arg_parser.add_argument('--seed', type=int, default=42)
+    arg_parser.add_argument('--output', help="JSON file for the results")
+    args = arg_parser.parse_args()
+
+    state = DatasetState(args.rows)
+    engines = [RegretDBEngine(), SqliteEngine()]
+    for engine in engines:
+        for sql in SCHEMA:
+            engine.execute(sql)
+        for table, columns, rows in generate_data(state, args.seed):
+            engine.load(table, columns, rows)
+
+    results = []
+    mismatches = 0
+    for statement in corpus(state):
+        timings = {}
+        outcomes = {}
+        changed = {}
+        for engine in engines:
+            before = table_contents(engine) if not statement.is_query else None
+            timings[engine.name], outcomes[engine.name] = run_statement(engine, statement, args.repeat)
+            if before is not None:
+                changed[engine.name] = changes(before, table_contents(engine))
+
+        regret, lite = outcomes['regretdb'], outcomes['sqlite3']
+        if isinstance(regret, Exception) or isinstance(lite, Exception):
+            same = isinstance(regret, Exception) and isinstance(lite, Exception)
+        else:
+            same = normalize(regret, statement.ordered) == normalize(lite, statement.ordered)
+            if same and not statement.is_query:
+                same = changed['regretdb'] == changed['sqlite3']
+        mismatches += not same
+
+        results.append({
+            'name': statement.name,
+            'operator': statement.operator,
+            'sql': statement.sql,
+            'regretdb_ms': timings['regretdb'] * 1000,
+            'sqlite3_ms': timings['sqlite3'] * 1000,
+            'ratio': timings['regretdb'] / timings['sqlite3'] if timings['sqlite3'] else None,
+            'same_result': same,
+            'regretdb_result': describe_result(regret),
+            'sqlite3_result': describe_result(lite),
+        })
+
+    print(f"{args.rows:,} rows, median of {args.repeat} runs, slowest relative to sqlite3 first\n")
+    print(f"{'statement':<16} {'operator':<26} {'regretdb':>12} {'sqlite3':>12} {'ratio':>10}  result")
+    for result in sorted(results, key=lambda result: result['ratio'] or 0, reverse=True):
+        status = 'same' if result['same_result'] else f"DIFFERENT ({result['regretdb_result']} vs {result['sqlite3_result']})"
+        print(f"{result['name']:<16} {result['operator']:<26} {result['regretdb_ms']:>9.3f} ms {result['sqlite3_ms']:>9.3f} ms"
+              f" {result['ratio']:>9.1f}x  {status}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump({'rows': args.rows, 'repeat': args.repeat, 'seed': args.seed, 'statements': results}, file, indent=2)
+        print(f"\nResults written to {args.output}")
+    if mismatches:
+        print(f"\n{mismatches} statement(s) returned different results")
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
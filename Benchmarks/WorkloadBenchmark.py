@@ -0,0 +1,285 @@
+"""
+DML and query workload benchmark.
+
+Run from the repository root:
+    python -m Benchmarks.WorkloadBenchmark [--rows 10000 100000 1000000] [--ops N] [--output results.json]
+    python -m Benchmarks.WorkloadBenchmark --compare baseline.json results.json [--threshold 0.1]
+
+For every size a synthetic schema is created and loaded:
+    regions (id PRIMARY KEY, name UNIQUE)                                   16 rows
+    users   (id PRIMARY KEY, email UNIQUE, region_id FOREIGN KEY, age DEFAULT) rows / 2
+    orders  (id PRIMARY KEY, user_id FOREIGN KEY, amount, note DEFAULT)      rows / 2
+Only the first half of the users has orders, so the other half can be deleted without FK violations.
+Then every workload runs `--ops` statements (joins fewer, they are the most expensive) and
+latency percentiles, throughput and memory are recorded.
+
+Data and parameters come from a seeded random generator, so runs on different commits execute exactly
+the same statements. `--compare` reports the change of the median latency of every workload between two
+result files and exits with status 1 if any got slower than the threshold.
+
+Every size runs in a process of its own. Memory: peak_rss_kb is the peak RSS of that process up to the
+end of the load or workload (it never decreases), tracemalloc peaks are recorded per workload with
+--tracemalloc (slows everything down).
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import json
+import multiprocessing
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from Exceptions import RegretDBError
+from RegretDB import RegretDB
+
+REGIONS = 16
+SCHEMA = [
+    "CREATE TABLE regions (id NUMBER PRIMARY KEY, name TEXT UNIQUE)",
+    "CREATE TABLE users (id NUMBER PRIMARY KEY, email TEXT UNIQUE, region_id NUMBER FOREIGN KEY REFERENCES regions(id), age NUMBER DEFAULT 30)",
+    "CREATE TABLE orders (id NUMBER PRIMARY KEY, user_id NUMBER FOREIGN KEY REFERENCES users(id), amount NUMBER, note TEXT DEFAULT 'none')",
+]
+
+
+class Workload:
+    def __init__(self, name, sql, make_parameters, ops_divisor=1, fetch=True):
+        self.name = name
+        self.sql = sql
+        self.make_parameters = make_parameters  # (random, state, op number) -> parameters
+        self.ops_divisor = ops_divisor  # expensive workloads run ops // ops_divisor statements
+        self.fetch = fetch  # fetch the rows of a SELECT, other statements count affected rows
+
+
+def amount_range(rng, state, op):
+    low = rng.randint(1, 990)
+    return low, low + 10
+
+
+def workloads():
+    return [
+        Workload('insert', "INSERT INTO orders (id, user_id, amount) VALUES (?, ?, ?)",
+                 lambda rng, state, op: (state.next_order_id(), rng.randint(1, state.users_with_orders), rng.randint(1, 1000)),
+                 fetch=False),
+        Workload('select_point', "SELECT * FROM users WHERE id = ?",
+                 lambda rng, state, op: (rng.randint(1, state.users),)),
+        Workload('select_range', "SELECT orders.id, orders.amount FROM orders WHERE amount >= ? AND amount < ?",
+                 amount_range),
+        Workload('select_join', "SELECT users.email, regions.name FROM users, regions WHERE users.region_id = regions.id AND users.age = ?",
+                 lambda rng, state, op: (rng.randint(18, 80),), ops_divisor=10),
+        Workload('select_order_by', "SELECT orders.id, orders.amount FROM orders WHERE amount < ? ORDER BY amount DESC",
+                 lambda rng, state, op: (rng.randint(1, 100),)),
+        Workload('update_unique', "UPDATE users SET email = ? WHERE id = ?",
+                 lambda rng, state, op: (f"changed{op}@example.com", rng.randint(1, state.users)),
+                 fetch=False),
+        Workload('update_fk', "UPDATE orders SET user_id = ? WHERE id = ?",
+                 lambda rng, state, op: (rng.randint(1, state.users_with_orders), rng.randint(1, state.orders)),
+                 fetch=False),
+        Workload('delete_fk', "DELETE FROM users WHERE id = ?",
+                 lambda rng, state, op: (state.next_deleted_user(),),
+                 fetch=False),
+    ]
+
+
+class DatasetState:
+    """Sizes of the generated tables and the ids workloads may use next"""
+
+    def __init__(self, rows):
+        self.users = max(rows // 2, 2)
+        self.orders = max(rows // 2, 1)
+        self.users_with_orders = self.users // 2
+        self.last_order_id = self.orders
+        self.last_deleted_user = self.users  # users without orders are deleted from the end
+
+    def next_order_id(self):
+        self.last_order_id += 1
+        return self.last_order_id
+
+    def next_deleted_user(self):
+        if self.last_deleted_user <= self.users_with_orders:
+            raise RuntimeError("No more users without orders to delete, lower --ops")
+        self.last_deleted_user -= 1
+        return self.last_deleted_user + 1
+
+
+def load(db, state, rng):
+    """Creates and fills the tables, returns the load statistics"""
+    for sql in SCHEMA:
+        db.execute(sql)
+    started = time.perf_counter()
+    db.executemany("INSERT INTO regions (id, name) VALUES (?, ?)", [(i, f"region{i}") for i in range(1, REGIONS + 1)])
+    # age is left to its DEFAULT for every other user
+    db.executemany("INSERT INTO users (id, email, region_id, age) VALUES (?, ?, ?, ?)",
+                   [(i, f"user{i}@example.com", rng.randint(1, REGIONS), rng.randint(18, 80)) for i in range(1, state.users + 1, 2)])
+    db.executemany("INSERT INTO users (id, email, region_id) VALUES (?, ?, ?)",
+                   [(i, f"user{i}@example.com", rng.randint(1, REGIONS)) for i in range(2, state.users + 1, 2)])
+    db.executemany("INSERT INTO orders (id, user_id, amount) VALUES (?, ?, ?)",
+                   [(i, rng.randint(1, state.users_with_orders), rng.randint(1, 1000)) for i in range(1, state.orders + 1)])
+    elapsed = time.perf_counter() - started
+    rows = REGIONS + state.users + state.orders
+    return {'rows': rows, 'seconds': elapsed, 'rows_per_second': rows / elapsed, 'peak_rss_kb': peak_rss_kb()}
+
+
+def run_workload(db, workload, state, rng, ops, use_tracemalloc):
+    if use_tracemalloc:
+        tracemalloc.reset_peak()
+    ops = max(ops // workload.ops_divisor, 1)
+    latencies = []
+    rows = 0
+    started = time.perf_counter()
+    for op in range(ops):
+        parameters = workload.make_parameters(rng, state, op)
+        start = time.perf_counter()
+        cursor = db.execute(workload.sql, parameters)
+        rows += len(cursor.fetchall()) if workload.fetch else max(cursor.rowcount, 0)
+        latencies.append(time.perf_counter() - start)
+    elapsed = time.perf_counter() - started
+
+    result = summarize(latencies)
+    result.update({'ops': ops, 'ops_per_second': ops / elapsed, 'rows': rows, 'peak_rss_kb': peak_rss_kb()})
+    if use_tracemalloc:
+        result['tracemalloc_peak_kb'] = tracemalloc.get_traced_memory()[1] // 1024
+    return result
+
+
+def summarize(latencies):
+    latencies = sorted(latencies)
+
+    def percentile(p):
+        return latencies[min(int(p * len(latencies)), len(latencies) - 1)] * 1000
+
+    return {
+        'mean_ms': sum(latencies) / len(latencies) * 1000,
+        'p50_ms': percentile(0.5),
+        'p90_ms': percentile(0.9),
+        'p99_ms': percentile(0.99),
+        'max_ms': latencies[-1] * 1000,
+    }
+
+
+def peak_rss_kb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak  # bytes on macOS, KB elsewhere
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_size(rows, args):
+    if args.tracemalloc:
+        tracemalloc.start()
+    rng = random.Random(args.seed)
+    state = DatasetState(rows)
+    db = RegretDB(fast_lexer=args.fast_lexer)
+    print(f"\n{rows:,} rows", flush=True)
+    size_result = {'load': load(db, state, rng), 'workloads': {}}
+    load_result = size_result['load']
+    print(f"  {'load':<16} {load_result['rows_per_second']:>12,.0f} rows/s {load_result['seconds']:>10.2f} s", flush=True)
+
+    for workload in workloads():
+        try:
+            result = run_workload(db, workload, state, rng, args.ops, args.tracemalloc)
+        except RegretDBError as e:
+            # A failing workload is reported, the others still run
+            size_result['workloads'][workload.name] = {'error': f"{type(e).__name__}: {e.message}"}
+            print(f"  {workload.name:<16} FAILED {type(e).__name__}: {e.message}", flush=True)
+            continue
+        size_result['workloads'][workload.name] = result
+        print(f"  {workload.name:<16} {result['ops_per_second']:>12,.1f} ops/s   p50 {result['p50_ms']:>9.3f} ms"
+              f"   p99 {result['p99_ms']:>9.3f} ms   max {result['max_ms']:>9.3f} ms", flush=True)
+    size_result['peak_rss_kb'] = peak_rss_kb()
+    print(f"  peak RSS {size_result['peak_rss_kb'] / 1024:,.1f} MB", flush=True)
+    return size_result
+
+
+def run(args):
+    results = {
+        'meta': {
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'seed': args.seed,
+            'ops': args.ops,
+            'fast_lexer': args.fast_lexer,
+        },
+        'sizes': {},
+    }
+    for rows in args.rows:
+        # Every size runs in a new process, so it starts from an empty database and its peak RSS is its own
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+            results['sizes'][str(rows)] = executor.submit(run_size, rows, args).result()
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+def compare(baseline_path, current_path, threshold):
+    """Prints the median latency change of every workload, returns True if none regressed beyond the threshold"""
+    with open(baseline_path, encoding='utf-8') as file:
+        baseline = json.load(file)
+    with open(current_path, encoding='utf-8') as file:
+        current = json.load(file)
+    print(f"baseline {baseline['meta'].get('commit')} vs current {current['meta'].get('commit')}, threshold {threshold:.0%}\n")
+
+    regressions = []
+    for size, current_size in current['sizes'].items():
+        baseline_size = baseline['sizes'].get(size)
+        if baseline_size is None:
+            continue
+        entries = [('load', baseline_size['load']['seconds'] * 1000, current_size['load']['seconds'] * 1000)]
+        for name, result in current_size['workloads'].items():
+            before = baseline_size['workloads'].get(name)
+            if before is None:
+                continue
+            if 'error' in result or 'error' in before:
+                entries.append((name, None, None))
+            else:
+                entries.append((name, before['p50_ms'], result['p50_ms']))
+
+        print(f"{int(size):,} rows")
+        for name, before, after in entries:
+            if before is None:
+                print(f"  {name:<16} skipped, failed in one of the runs")
+                continue
+            change = (after - before) / before if before else 0.0
+            flag = ''
+            if change > threshold:
+                flag = '  REGRESSION'
+                regressions.append((size, name))
+            elif change < -threshold:
+                flag = '  improved'
+            print(f"  {name:<16} {before:>10.3f} ms -> {after:>10.3f} ms  {change:>+8.1%}{flag}")
+
+    if regressions:
+        print(f"\n{len(regressions)} regression(s): " + ', '.join(f"{name} ({size} rows)" for size, name in regressions))
+    return not regressions
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Benchmark DML and query workloads at several table sizes")
+    arg_parser.add_argument('--rows', type=int, nargs='+', default=[10000], help="total rows of the generated tables")
+    arg_parser.add_argument('--ops', type=int, default=100, help="statements per workload")
+    arg_parser.add_argument('--seed', type=int, default=42)
+    arg_parser.add_argument('--fast-lexer', action='store_true')
+    arg_parser.add_argument('--tracemalloc', action='store_true', help="record tracemalloc peaks per workload")
+    arg_parser.add_argument('--output', help="JSON file for the results")
+    arg_parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'), help="compare two result files")
+    arg_parser.add_argument('--threshold', type=float, default=0.1, help="relative slowdown reported as a regression")
+    args = arg_parser.parse_args()
+
+    if args.compare:
+        raise SystemExit(0 if compare(*args.compare, args.threshold) else 1)
+    run(args)
+
+
+if __name__ == '__main__':
+    main()
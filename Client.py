@@ -0,0 +1,319 @@
+import contextlib
+import queue
+import socket
+import threading
+from collections import deque
+
+import Protocol
+from Exceptions import RegretDBError, InterfaceError, ProtocolError
+
+"""
+Client of the network server (Server.py):
+
+    client = Client(('127.0.0.1', 6666))        # or Client('/tmp/regretdb.sock')
+    client.execute("INSERT INTO users (id, name) VALUES (?, ?)", (1, 'Alice'))
+    for row in client.execute("SELECT * FROM users"):
+        ...
+
+    pipeline = client.pipeline()                 # several statements, one round trip
+    pipeline.execute("INSERT INTO users (id) VALUES (?)", (2,))
+    pipeline.execute("SELECT * FROM users")
+    insert, select = pipeline.run()
+
+    statement = client.prepare("SELECT * FROM users WHERE id = ?")
+    rows = statement.execute((1,)).fetchall()
+
+    pool = ConnectionPool(('127.0.0.1', 6666), size=8)
+    with pool.connection() as client:
+        ...
+
+A client is a single connection and must not be shared by threads, use a ConnectionPool instead.
+Rows are tuples in the order of Result.columns, they are read from the socket batch by batch while
+iterating. A new request first reads the rest of a result which is still streaming.
+"""
+
+
+class Client:
+    def __init__(self, address, timeout=None):
+        if isinstance(address, str):
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock.settimeout(timeout)
+        self.sock.connect(address)
+        self.rfile = self.sock.makefile('rb')
+        self.closed = False
+        self.next_request_id = 1
+        self.streaming = None  # Result whose rows are still being received
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def execute(self, sql_stmt, parameters=None):
+        request_id = self._send([(Protocol.EXECUTE, (sql_stmt, _parameters(parameters)))])[0]
+        return Result(self, request_id).start()
+
+    def executemany(self, sql_stmt, seq_of_parameters):
+        """Returns the number of affected rows"""
+        body = (sql_stmt, [_parameters(parameters) for parameters in seq_of_parameters])
+        request_id = self._send([(Protocol.EXECUTEMANY, body)])[0]
+        return Result(self, request_id).start().rowcount
+
+    def prepare(self, sql_stmt):
+        request_id = self._send([(Protocol.PREPARE, (sql_stmt,))])[0]
+        handle, = self._expect(request_id, Protocol.PREPARED)
+        return PreparedStatement(self, handle)
+
+    def pipeline(self):
+        return Pipeline(self)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.streaming = None
+        self.rfile.close()
+        self.sock.close()
+
+    # Framing
+    def _send(self, requests):
+        """Sends [(message type, body), ...] at once, returns their request ids"""
+        if self.closed:
+            raise InterfaceError("Client is closed")
+        if self.streaming is not None:
+            self.streaming.discard()
+
+        request_ids = []
+        frames = []
+        for message_type, body in requests:
+            request_ids.append(self.next_request_id)
+            frames.append(Protocol.encode_frame(message_type, self.next_request_id, body))
+            self.next_request_id = (self.next_request_id + 1) & 0xFFFFFFFF
+        self.sock.sendall(b''.join(frames))
+        return request_ids
+
+    def _read(self, request_id):
+        frame = Protocol.read_frame(self.rfile)
+        if frame is None:
+            self.close()
+            raise ProtocolError("Server closed the connection")
+        message_type, response_id, body = frame
+        if response_id != request_id:
+            self.close()
+            raise ProtocolError(f"Response to request {response_id} received while waiting for {request_id}")
+        return message_type, body
+
+    def _expect(self, request_id, expected_type):
+        message_type, body = self._read(request_id)
+        if message_type == Protocol.ERROR:
+            raise Protocol.decode_error(body)
+        if message_type != expected_type:
+            raise ProtocolError(f"Unexpected response type {message_type}")
+        return body
+
+
+class Result:
+    """
+    Response to a statement. Rows of a SELECT are received lazily, the server streams them in batches.
+    """
+
+    def __init__(self, client, request_id):
+        self.client = client
+        self.request_id = request_id
+        self.columns = None  # column names, None for statements not returning rows
+        self.rowcount = -1
+        self.error = None  # set for a failed statement of a pipeline
+        self.done = False
+        self.__rows = deque()
+
+    def start(self):
+        """Reads the first response frame, raises the error of a failed statement"""
+        message_type, body = self.client._read(self.request_id)
+        if message_type == Protocol.ERROR:
+            self.done = True
+            raise Protocol.decode_error(body)
+        if message_type == Protocol.DONE:
+            self.rowcount, = body
+            self.done = True
+        elif message_type == Protocol.COLUMNS:
+            self.columns, = body
+            self.client.streaming = self
+        else:
+            raise ProtocolError(f"Unexpected response type {message_type}")
+        return self
+
+    @property
+    def returns_rows(self):
+        return self.columns is not None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        while not self.__rows:
+            if self.done:
+                self._check_error()
+                raise StopIteration
+            self.__receive()
+        return self.__rows.popleft()
+
+    def fetchone(self):
+        return next(self, None)
+
+    def fetchall(self):
+        return list(self)
+
+    def discard(self):
+        """Reads and drops the rest of the rows"""
+        while not self.done:
+            self.__receive()
+        self.__rows.clear()
+
+    def load(self):
+        """Receives the whole result now, used by pipelines which read responses in order"""
+        try:
+            self.start()
+            while not self.done:
+                self.__receive()
+        except ProtocolError:
+            raise
+        except RegretDBError as e:
+            self.error = e
+        return self
+
+    def __receive(self):
+        message_type, body = self.client._read(self.request_id)
+        if message_type == Protocol.ROWS:
+            self.__rows.extend(body[0])
+            return
+        self.done = True
+        self.client.streaming = None
+        if message_type == Protocol.DONE:
+            self.rowcount, = body
+        elif message_type == Protocol.ERROR:
+            self.error = Protocol.decode_error(body)
+        else:
+            raise ProtocolError(f"Unexpected response type {message_type}")
+
+    def _check_error(self):
+        if self.error is not None:
+            raise self.error
+
+    def __repr__(self):
+        return f"Result(columns={self.columns}, rowcount={self.rowcount}, done={self.done})"
+
+
+class Pipeline:
+    """Statements sent together and answered in order, a failed statement doesn't stop the others"""
+
+    def __init__(self, client):
+        self.client = client
+        self.requests = []
+
+    def execute(self, sql_stmt, parameters=None):
+        self.requests.append((Protocol.EXECUTE, (sql_stmt, _parameters(parameters))))
+        return self
+
+    def execute_prepared(self, statement, parameters=None):
+        self.requests.append((Protocol.EXECUTE_PREPARED, (statement.handle, _parameters(parameters))))
+        return self
+
+    def run(self):
+        """Returns a fully received Result per statement, `error` holds the exception of a failed one
+           and is raised when its rows are read"""
+        request_ids = self.client._send(self.requests)
+        self.requests = []
+        return [Result(self.client, request_id).load() for request_id in request_ids]
+
+
+class PreparedStatement:
+    def __init__(self, client, handle):
+        self.client = client
+        self.handle = handle
+
+    def execute(self, parameters=None):
+        request_id = self.client._send([(Protocol.EXECUTE_PREPARED, (self.handle, _parameters(parameters)))])[0]
+        return Result(self.client, request_id).start()
+
+    def close(self):
+        if self.client.closed:
+            return
+        request_id = self.client._send([(Protocol.CLOSE_PREPARED, (self.handle,))])[0]
+        self.client._expect(request_id, Protocol.DONE)
+
+
+class ConnectionPool:
+    """
+    Reuses up to `size` connections between threads, connection() waits while all of them are in use.
+    A connection used by a block which raised is closed rather than reused, the server rolls back
+    a transaction it left open.
+    """
+
+    def __init__(self, address, size=4, timeout=None):
+        self.address = address
+        self.size = size
+        self.timeout = timeout
+        self.created = 0
+        self.closed = False
+        self.__idle = queue.LifoQueue()
+        self.__lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def connection(self):
+        client = self._acquire()
+        try:
+            yield client
+        except BaseException:
+            client.close()
+            raise
+        finally:
+            self._release(client)
+
+    def _acquire(self):
+        if self.closed:
+            raise InterfaceError("Connection pool is closed")
+        try:
+            return self.__idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self.__lock:
+            create = self.created < self.size
+            if create:
+                self.created += 1
+        if create:
+            try:
+                return Client(self.address, self.timeout)
+            except BaseException:
+                with self.__lock:
+                    self.created -= 1
+                raise
+        try:
+            return self.__idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise InterfaceError(f"No connection available within {self.timeout} s, all {self.size} are in use") from None
+
+    def _release(self, client):
+        if client.streaming is not None and not client.closed:
+            client.streaming.discard()
+        if client.closed or self.closed:
+            client.close()
+            with self.__lock:
+                self.created -= 1
+            return
+        self.__idle.put(client)
+
+    def close(self):
+        self.closed = True
+        while True:
+            try:
+                self.__idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+def _parameters(parameters):
+    return list(parameters) if parameters is not None else None
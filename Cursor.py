@@ -0,0 +1,123 @@
+import weakref
+from itertools import islice
+
+from Exceptions import ExecutingError
+from StatementGuard import run_guarded
+
+
+class Cursor:
+    """
+    Result of a single statement.
+
+    Rows of a SELECT are pulled lazily from the plan, nothing is materialized unless the plan itself
+    needs it (e.g. Sort). Outside a transaction they are read from the MVCC snapshot taken when the
+    statement ran, so later changes of the tables don't show up. The snapshot is released when the
+    cursor is exhausted or closed, or when it is garbage collected if it was abandoned.
+    For other statements `rowcount` holds the number of affected rows (-1 when not applicable).
+    Rows are fetched under the StatementGuard of the statement, which may stop a runaway SELECT.
+    """
+
+    def __init__(self, rows=None, columns=None, rowcount=-1, on_close=None, guard=None):
+        self.columns = columns  # qualified column names, None for statements not returning rows
+        self.rowcount = rowcount
+        self.arraysize = 1
+        self.returns_rows = rows is not None
+        self.__rows = iter(rows) if rows is not None else iter(())
+        # Runs once, from close() or when an abandoned cursor is collected
+        self.__on_close = weakref.finalize(self, on_close) if on_close else None
+        self.__guard = guard
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        row = self.fetchone()
+        if row is None:
+            raise StopIteration
+        return row
+
+    def _check_result_set(self):
+        if not self.returns_rows:
+            raise ExecutingError("Statement did not return any rows")
+
+    def fetchone(self):
+        self._check_result_set()
+        try:
+            return self._pull(next, self.__rows)
+        except StopIteration:
+            self.close()
+            return None
+
+    def fetchmany(self, size=None):
+        self._check_result_set()
+        size = self.arraysize if size is None else size
+        rows = self._pull(list, islice(self.__rows, size))
+        if len(rows) < size:
+            self.close()
+        return rows
+
+    def fetchall(self):
+        self._check_result_set()
+        rows = self._pull(list, self.__rows)
+        self.close()
+        return rows
+
+    def _pull(self, fetch, rows):
+        if self.__guard is None:
+            return fetch(rows)
+        return run_guarded(self.__guard, fetch, rows)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.__rows = iter(())
+        if self.__on_close:
+            self.__on_close()
+
+    def __repr__(self):
+        return f"Cursor(columns={self.columns}, rowcount={self.rowcount}, closed={self.closed})"
+
+
+class Visualize:
+    """
+    Prints the rows of a cursor in a readable tabular format.
+    Column widths are computed from the first `sample_size` rows only, rows after the sample are
+    streamed straight to the output, a value wider than its column just makes its row wider.
+    """
+
+    def __init__(self, cursor, sample_size=1000, out=print):
+        self.cursor = cursor
+        self.sample_size = sample_size
+        self.out = out
+
+    def visualize_table(self):
+        sample = self.cursor.fetchmany(self.sample_size)
+        if not sample:
+            self.out("\nNo data to display.")
+            return
+
+        headers = self.cursor.columns or list(sample[0].keys())
+
+        # Determine column widths
+        col_widths = [len(h) for h in headers]
+        for row in sample:
+            for i, h in enumerate(headers):
+                col_widths[i] = max(col_widths[i], len(str(row[h])))
+
+        def divider():
+            return '+' + '+'.join(['-' * (w + 2) for w in col_widths]) + '+'
+
+        def format_row(row_data):
+            return '| ' + ' | '.join(f"{str(row_data[i]).ljust(col_widths[i])}" for i in range(len(row_data))) + ' |'
+
+        self.out(f"\nResult: ")
+        self.out(divider())
+        self.out(format_row(headers))
+        self.out(divider())
+        for row in sample:
+            self.out(format_row([row[h] for h in headers]))
+        for row in self.cursor:
+            self.out(format_row([row[h] for h in headers]))
+        self.out(divider())
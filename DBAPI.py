@@ -0,0 +1,173 @@
+from DataManager import data_manager
+from Exceptions import RegretDBError, DatabaseError, ProgrammingError, IntegrityError, InterfaceError, NotSupportedError
+from RegretDB import RegretDB
+
+"""
+DB-API 2.0 (PEP 249) interface:
+
+    import DBAPI
+    connection = DBAPI.connect()
+    cursor = connection.cursor()
+    cursor.execute("INSERT INTO users (id, name) VALUES (?, ?)", (1, 'Alice'))
+    cursor.executemany("INSERT INTO users (id, name) VALUES (?, ?)", [(2, 'Ash'), (3, 'Laura')])
+    cursor.execute("SELECT * FROM users WHERE id > ?", (1,))
+    rows = cursor.fetchall()  # [(2, 'Ash'), (3, 'Laura')]
+
+Every connection works on the process wide data_manager, so all connections see the same tables.
+Statements are autocommitted unless a transaction is opened with BEGIN, commit() and rollback() end it.
+"""
+
+apilevel = '2.0'
+threadsafety = 1  # threads may share the module, every thread needs its own connection
+paramstyle = 'qmark'
+
+Error = RegretDBError  # InterfaceError and DatabaseError derive from it
+
+
+class Warning(Exception):
+    pass
+
+
+class DataError(DatabaseError):
+    pass
+
+
+class OperationalError(DatabaseError):
+    pass
+
+
+class InternalError(DatabaseError):
+    pass
+
+
+def connect(plan_cache_size=128, fast_lexer=False):
+    return Connection(RegretDB(plan_cache_size=plan_cache_size, fast_lexer=fast_lexer))
+
+
+class Connection:
+    def __init__(self, engine):
+        self.engine = engine
+        self.closed = False
+
+    def cursor(self):
+        self._check_open()
+        return Cursor(self)
+
+    def commit(self):
+        self._check_open()
+        if data_manager.in_transaction():
+            self.engine.execute("COMMIT")
+
+    def rollback(self):
+        self._check_open()
+        if data_manager.in_transaction():
+            self.engine.execute("ROLLBACK")
+
+    def close(self):
+        self.closed = True
+
+    def _check_open(self):
+        if self.closed:
+            raise InterfaceError("Connection is closed")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+
+
+class Cursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.description = None
+        self.rowcount = -1
+        self.arraysize = 1
+        self.lastrowid = None
+        self.closed = False
+        self.__result = None
+        self.__columns = None
+
+    def execute(self, operation, parameters=None):
+        self._check_open()
+        self._reset()
+        self.__result = self.connection.engine.execute(operation, parameters if parameters is not None else ())
+        self.rowcount = self.__result.rowcount
+
+        if self.__result.returns_rows:
+            self.__columns = self.__result.columns
+            column_types = self._column_types()
+            self.description = tuple((column, column_types[column], None, None, None, None, None) for column in self.__columns)
+        return self
+
+    def executemany(self, operation, seq_of_parameters):
+        self._check_open()
+        self._reset()
+        self.rowcount = self.connection.engine.executemany(operation, seq_of_parameters)
+        return self
+
+    def fetchone(self):
+        row = self._get_result().fetchone()
+        return self._to_tuple(row) if row is not None else None
+
+    def fetchmany(self, size=None):
+        rows = self._get_result().fetchmany(self.arraysize if size is None else size)
+        return [self._to_tuple(row) for row in rows]
+
+    def fetchall(self):
+        return [self._to_tuple(row) for row in self._get_result().fetchall()]
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        row = self.fetchone()
+        if row is None:
+            raise StopIteration
+        return row
+
+    def setinputsizes(self, sizes):
+        pass
+
+    def setoutputsize(self, size, column=None):
+        pass
+
+    def close(self):
+        self._reset()
+        self.closed = True
+
+    def _reset(self):
+        if self.__result is not None:
+            self.__result.close()
+        self.__result = None
+        self.__columns = None
+        self.description = None
+        self.rowcount = -1
+
+    def _check_open(self):
+        if self.closed:
+            raise InterfaceError("Cursor is closed")
+        self.connection._check_open()
+
+    def _get_result(self):
+        self._check_open()
+        if self.__result is None or not self.__result.returns_rows:
+            raise ProgrammingError("No result set, execute a SELECT statement first")
+        return self.__result
+
+    def _to_tuple(self, row):
+        return tuple(row[column] for column in self.__columns)
+
+    def _column_types(self):
+        """Maps qualified column names of the result to their declared types"""
+        statement = self.connection.engine.statement
+        return {column: statement.result_type(column) for column in self.__columns}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
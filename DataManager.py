@@ -1,5 +1,12 @@
-from Exceptions import IntegrityError
+import warnings
+
+from Exceptions import IntegrityError, MemoryBudgetError, MemoryBudgetWarning, ProgrammingError
 from ForeignKeyManager import ForeignKeyManager
+from LockManager import LockManager
+from MemoryStats import measure_table, row_payload, ROW_OVERHEAD_BYTES
+from Metrics import scanned_rows
+from TransactionManager import TransactionManager
+from VersionManager import VersionManager
 
 """
 How data is stored:
@@ -55,6 +62,14 @@ class DataManager:
         self.__column_types = {}
         self.__table_data = {}
         self.foreign_key_manager = ForeignKeyManager()
+        self.transaction_manager = TransactionManager(self)
+        self.version_manager = VersionManager()
+        self.lock_manager = LockManager()
+        self.enforce_foreign_keys = True  # off in shard workers, the coordinator checks foreign keys across shards
+        self.schema_version = 0  # bumped by every CREATE/DROP/ALTER, invalidates cached plans
+        self.memory_budget = None  # bytes all tables may use, see set_memory_budget()
+        self.memory_budget_action = 'reject'
+        self.__memory_estimates = {}  # table_name -> TableStats of its last measurement
 
     def does_table_exist(self, table_name):
         if self.__column_types.get(table_name):
@@ -73,12 +88,146 @@ class DataManager:
     def get_tables_data(self, table_name):
         return self.__table_data[table_name]
 
+    # Row changes, they are recorded in the undo log of an active transaction
     def insert_row(self, table_name, row):
-        self.__table_data[table_name].append(row)
+        table = self.__table_data[table_name]
+        self.transaction_manager.log('INSERT', table_name, len(table))
+        self.version_manager.on_insert(table_name, row)
+        table.append(row)
+
+    def replace_row(self, table_name, index, row):
+        table = self.__table_data[table_name]
+        self.transaction_manager.log('UPDATE', table_name, index, table[index])
+        self.version_manager.on_delete(table_name, table[index])
+        self.version_manager.on_insert(table_name, row)
+        table[index] = row
+
+    def delete_row(self, table_name, index):
+        table = self.__table_data[table_name]
+        self.transaction_manager.log('DELETE', table_name, index, table[index])
+        self.version_manager.on_delete(table_name, table[index])
+        del table[index]
+
+    def delete_rows(self, table_name, rows):
+        """Deletes a set of rows of a table in one pass, rows are matched by identity"""
+        old_rows = self.__table_data[table_name]
+        self.transaction_manager.log('TABLE', table_name, old_rows)
+        if len(rows) == len(old_rows):
+            # Every row goes, an empty list is swapped in
+            self.version_manager.on_truncate(table_name)
+            self.set_table_rows(table_name, [])
+            return
+        for row in rows:
+            self.version_manager.on_delete(table_name, row)
+        deleted_ids = {id(row) for row in rows}
+        self.set_table_rows(table_name, [row for row in old_rows if id(row) not in deleted_ids])
+
+    def replace_table_rows(self, table_name, rows):
+        """Swaps in a new list of rows for a table, used by bulk operations"""
+        old_rows = self.__table_data[table_name]
+        self.transaction_manager.log('TABLE', table_name, old_rows)
+        # Row versions still have to be ended and created one by one
+        for row in old_rows:
+            self.version_manager.on_delete(table_name, row)
+        for row in rows:
+            self.version_manager.on_insert(table_name, row)
+        self.set_table_rows(table_name, rows)
+
+    def set_table_rows(self, table_name, rows):
+        self.__table_data[table_name] = rows
+
+    def in_transaction(self):
+        return self.transaction_manager.active
+
+    def get_snapshot_rows(self, table_name, snapshot):
+        """Lazily yields rows of a table visible in an MVCC snapshot"""
+        versions = self.version_manager.get_versions(table_name)
+        scanned_rows.count += len(versions)
+        for version in versions:
+            if 0 < version.begin <= snapshot and not (version.end and 0 < version.end <= snapshot):
+                yield version.row
+
+    def count_rows(self, table_name, snapshot=None):
+        """Number of rows of a table, O(1) for the live table and for snapshots taken after its last change"""
+        if snapshot is None:
+            return len(self.__table_data[table_name])
+        count = self.version_manager.committed_count(table_name, snapshot)
+        if count is None:
+            count = sum(1 for _ in self.get_snapshot_rows(table_name, snapshot))
+        return count
+
+    def collect_garbage(self):
+        """Reclaims old row versions table by table, tables locked by running writers are skipped"""
+        oldest = self.version_manager.oldest_snapshot()
+        reclaimed = 0
+        for table_name in list(self.__table_data):
+            if self.lock_manager.holds(table_name):
+                reclaimed += self.version_manager.collect_table(table_name, oldest)
+            elif self.lock_manager.try_acquire_exclusive(table_name):
+                try:
+                    reclaimed += self.version_manager.collect_table(table_name, oldest)
+                finally:
+                    self.lock_manager.release(table_name)
+        return reclaimed
+
+    def collect_garbage_if_needed(self):
+        if self.version_manager.needs_collection():
+            self.collect_garbage()
+
+    # Memory accounting, see MemoryStats.py
+    def table_stats(self, table_name=None):
+        """Estimated memory use of a table, or of every table, as a list of TableStats"""
+        table_names = [table_name] if table_name is not None else sorted(self.__table_data)
+        return [self.__measure_table(name) for name in table_names]
+
+    def __measure_table(self, table_name):
+        stats = measure_table(table_name, self.get_columns_for_table(table_name), self.__table_data[table_name],
+                              self.version_manager.get_versions(table_name),
+                              self.version_manager.current_versions[table_name])
+        self.__memory_estimates[table_name] = stats
+        return stats
+
+    def memory_usage(self):
+        """Estimated bytes used by all tables. Tables are measured again once their row count changed by more
+           than 10% since their last measurement, in between their size is extrapolated from the row count."""
+        total = 0
+        for table_name, rows in list(self.__table_data.items()):
+            stats = self.__memory_estimates.get(table_name)
+            if stats is None or abs(len(rows) - stats.rows) > stats.rows // 10:
+                stats = self.__measure_table(table_name)
+            total += stats.total_bytes + (len(rows) - stats.rows) * (stats.bytes_per_row + ROW_OVERHEAD_BYTES)
+        return total
+
+    def set_memory_budget(self, budget, action='reject'):
+        """Limits the estimated memory of all tables to `budget` bytes, None removes the limit.
+           INSERTs exceeding it fail with MemoryBudgetError, or only issue a MemoryBudgetWarning with action='warn'."""
+        if action not in ('reject', 'warn'):
+            raise ProgrammingError(f"Unknown memory budget action '{action}', expected 'reject' or 'warn'")
+        self.memory_budget = budget
+        self.memory_budget_action = action
+
+    def check_memory_budget(self, table_name, rows):
+        """Called before `rows` are inserted into a table"""
+        if self.memory_budget is None or not rows:
+            return
+        added = round((sum(row_payload(rows)) + ROW_OVERHEAD_BYTES) * len(rows))
+        usage = self.memory_usage()
+        if usage + added <= self.memory_budget:
+            return
+        message = (f"Inserting {len(rows)} rows (~{added} bytes) into '{table_name}' would exceed the memory budget,"
+                   f" {usage} of {self.memory_budget} bytes are used")
+        if self.memory_budget_action == 'warn':
+            warnings.warn(message, MemoryBudgetWarning)
+        else:
+            raise MemoryBudgetError(message)
+
+    def bump_schema_version(self):
+        self.schema_version += 1
 
     # SETTERS
     def add_table(self, table_name):
         self.__table_data[table_name] = []
+        self.version_manager.add_table(table_name)
 
     def add_column_types(self, table_name, col_types):
         self.__column_types[table_name] = col_types
@@ -93,6 +242,8 @@ class DataManager:
         # Remove table data
         if table_name in self.__table_data:
             del self.__table_data[table_name]
+        self.version_manager.drop_table(table_name)
+        self.__memory_estimates.pop(table_name, None)
 
         # Remove column types
         if table_name in self.__column_types:
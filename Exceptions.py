@@ -2,7 +2,7 @@ from utility import get_pretty_error
 
 
 class RegretDBError(Exception):
-    """Base class for all exceptions"""
+    """Base class for all exceptions (DB-API 2.0 Error)"""
     def __init__(self, message, token=None, line=None):
         super().__init__(message)
         self.token = token
@@ -14,7 +14,13 @@ class RegretDBError(Exception):
             return f"{base} (Token: {self.token}, Line: {self.line})"
         return base
 
-class SQLSyntaxError(RegretDBError):
+class DatabaseError(RegretDBError):
+    """Errors of the database itself, as opposed to InterfaceError (DB-API 2.0 naming)"""
+
+class ProgrammingError(DatabaseError):
+    """Errors in the statement itself (DB-API 2.0 naming)"""
+
+class SQLSyntaxError(ProgrammingError):
     def __init__(self, message, sql=None, tokens=None, pos=None, adjust_pos=None):
         self.message = message
         self.sql = sql
@@ -26,21 +32,39 @@ class SQLSyntaxError(RegretDBError):
     def __str__(self):
         return self.message + "\n" + get_pretty_error(self.sql, self.tokens, self.pos, self.adjust_pos)
 
-class ExecutingError(RegretDBError):
+class ExecutingError(DatabaseError):
     def __init__(self, message):
         self.message = message
 
     def __str__(self):
         return self.message
 
-class IntegrityError(RegretDBError):
+class DeadlockError(ExecutingError):
+    """Raised to the transaction chosen as the deadlock victim, its whole transaction is rolled back"""
+
+class StatementCanceledError(ExecutingError):
+    """The statement was canceled with RegretDB.cancel(), its changes are undone"""
+
+class StatementTimeoutError(StatementCanceledError):
+    """The statement ran longer than the statement timeout, its changes are undone"""
+
+class RowLimitError(ExecutingError):
+    """The plan produced more intermediate rows than the max_intermediate_rows guard allows"""
+
+class MemoryBudgetError(ExecutingError):
+    """An INSERT would make the tables exceed the memory budget, nothing is inserted"""
+
+class MemoryBudgetWarning(UserWarning):
+    """Issued instead of MemoryBudgetError when the memory budget only warns"""
+
+class IntegrityError(DatabaseError):
     def __init__(self, message):
         self.message = message
 
     def __str__(self):
         return self.message
 
-class PreProcessorError(RegretDBError):
+class PreProcessorError(ProgrammingError):
     def __init__(self, message, word=None, sql_stmt=None):
         self.message = message
         self.word = word
@@ -82,3 +106,23 @@ class PreProcessorError(RegretDBError):
 
         underline_str = ''.join(underline)
         return f"{self.message}\n{self.sql_stmt}\n{underline_str}"
+
+class InterfaceError(RegretDBError):
+    """Misuse of the DB-API interface, e.g. fetching from a closed cursor"""
+    def __init__(self, message):
+        self.message = message
+        super().__init__(message)
+
+    def __str__(self):
+        return self.message
+
+class NotSupportedError(DatabaseError):
+    def __init__(self, message):
+        self.message = message
+        super().__init__(message)
+
+    def __str__(self):
+        return self.message
+
+class ProtocolError(InterfaceError):
+    """Malformed or unexpected message of the network protocol"""
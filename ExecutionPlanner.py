@@ -2,46 +2,61 @@ from ASTNodes.AlterNodes import AlterAddStmt, AlterRenameStmt, AlterModifyStmt,
 from ASTNodes.CreateNode import CreateStmt
 from ASTNodes.DeleteNode import DeleteStmt
 from ASTNodes.DropNode import DropStmt
+from ASTNodes.ExplainNode import ExplainStmt
 from ASTNodes.InsertNode import InsertStmt
 from ASTNodes.SelectNode import SelectStmt
+from ASTNodes.ShowNode import ShowTableStatsStmt
+from ASTNodes.TransactionNode import TransactionStmt
 from ASTNodes.UpdateNode import UpdateStmt
 from Exceptions import RegretDBError
+from Operators.LogicalOperators import Operator, AND, BOOL, EG, LT, LE, GT, GE
+from PlanNodes.AggregatePlanNodes import HashAggregate, TableCount
 from PlanNodes.CreatePlanNodes import CreateTable
 from PlanNodes.DeletePlanNode import Delete
 from PlanNodes.DropTablePlanNode import DropTable
-from PlanNodes.InsertPlanNode import Insert
-from PlanNodes.SelectPlanNodes import TableScan, Filter, CrossJoin, Project, Sort, Visualize
+from PlanNodes.ExplainPlanNode import Explain
+from PlanNodes.InsertPlanNode import Insert, Upsert
+from PlanNodes.JoinPlanNodes import SortMergeJoin, BlockNestedLoopJoin
+from PlanNodes.ParallelPlanNodes import ParallelScan
+from PlanNodes.SelectPlanNodes import TableScan, Filter, Project, Sort
+from PlanNodes.ShowPlanNodes import ShowTableStats
+from PlanNodes.TransactionPlanNodes import Begin, Commit, Rollback
 from PlanNodes.UpdatePlanNode import Update
 
+# Comparisons a SortMergeJoin can join on, and the operator with its sides swapped
+JOIN_OPERATORS = {EG: ('=', '='), LT: ('<', '>'), LE: ('<=', '>='), GT: ('>', '<'), GE: ('>=', '<=')}
+
 
 class ExecutionPlanner:
+    def __init__(self, parallel_workers=0, parallel_threshold=50000, parallel_executor='auto'):
+        # Single table SELECTs run in parallel with more than one worker, see ParallelPlanNodes
+        self.parallel_workers = parallel_workers
+        self.parallel_threshold = parallel_threshold
+        self.parallel_executor = parallel_executor
+
     def plan(self, statement):
         if isinstance(statement, SelectStmt):
+            if statement.is_aggregate:
+                return self.plan_aggregate(statement)
+            if self.parallel_workers > 1 and len(statement.tables) == 1:
+                return ParallelScan(statement.tables[0], statement.where_expr, statement.columns, statement.order_by,
+                                    self.parallel_workers, self.parallel_threshold, self.parallel_executor)
 
-            # Step 1: TableScans
-            scans = [TableScan(table) for table in statement.tables]
-
-            # Step 2: Build cross joins
-            plan = scans[0]
-            for scan in scans[1:]:
-                plan = CrossJoin(plan, scan)
-
-            # Step 3: WHERE clause
-            if statement.where_expr:
-                plan = Filter(plan, statement.where_expr)
+            # Step 1 and 2: TableScans and joins with the WHERE clause
+            plan = self.plan_joins(statement)
 
-            # Step 4: SELECT columns
+            # Step 3: SELECT columns
             plan = Project(plan, statement.columns)
 
-            # Step 5: ORDER BY
+            # Step 4: ORDER BY
             if statement.order_by:
                 plan = Sort(plan, statement.order_by)
 
-            # Step 6: Visualize
-            plan = Visualize(plan)
-
             return plan
         elif isinstance(statement, InsertStmt):
+            if statement.conflict_action:
+                return Upsert(statement.table, statement.columns, statement.values, statement.conflict_column,
+                              statement.conflict_action, statement.conflict_assignments)
             return Insert(table_name=statement.table, columns=statement.columns, values=statement.values)
         elif isinstance(statement, UpdateStmt):
             # Step 1: Scan the target table
@@ -74,6 +89,12 @@ class ExecutionPlanner:
 
         elif isinstance(statement, DropStmt):
             return DropTable(table=statement.table)
+        elif isinstance(statement, ExplainStmt):
+            return Explain(self.plan(statement.statement), statement.analyze, isinstance(statement.statement, SelectStmt))
+        elif isinstance(statement, ShowTableStatsStmt):
+            return ShowTableStats(statement.table)
+        elif isinstance(statement, TransactionStmt):
+            return {'BEGIN': Begin, 'COMMIT': Commit, 'ROLLBACK': Rollback}[statement.action]()
         elif isinstance(statement, AlterAddStmt):
             pass
         elif isinstance(statement, AlterModifyStmt):
@@ -84,3 +105,121 @@ class ExecutionPlanner:
             pass
         else:
             raise RegretDBError(f"Unexpected statement type: {type(statement)}")
+
+    def plan_aggregate(self, statement):
+        # COUNT(*) of a whole table doesn't need to scan it
+        if (len(statement.tables) == 1 and not statement.where_expr and not statement.group_by
+                and all(aggregate.function == 'COUNT' and aggregate.column == '*' for aggregate in statement.aggregates)):
+            return TableCount(statement.tables[0], statement.columns)
+
+        plan = self.plan_joins(statement)
+        plan = HashAggregate(plan, statement.group_by, statement.aggregates)
+
+        # Sorting by GROUP BY columns, they are projected away afterwards if they aren't selected
+        if statement.order_by:
+            plan = Sort(plan, statement.order_by)
+        return Project(plan, statement.columns)
+
+    def plan_joins(self, statement):
+        """
+        Scans and joins of the FROM tables with the WHERE clause applied.
+        The WHERE clause is split into its AND-ed conditions, every condition is applied as soon as the tables
+        it reads are available: conditions on one table filter its scan and the rest filter the first join
+        having all their tables. Tables are joined one by one, next the one compared to the joined tables
+        with = (or else <, <=, >, >=) by a SortMergeJoin, tables without such a comparison are joined in
+        FROM order by a BlockNestedLoopJoin.
+        """
+        tables = statement.tables
+        plan = TableScan(tables[0])
+        if len(tables) == 1:
+            return Filter(plan, statement.where_expr) if statement.where_expr else plan
+
+        # [(condition, tables it reads)]
+        conditions = [(condition, referenced_tables(condition, tables)) for condition in split_conditions(statement.where_expr)]
+
+        def take_conditions(available):
+            """Removes the conditions reading only available tables and returns them"""
+            taken = [condition for condition, referenced in conditions if referenced <= available]
+            conditions[:] = [(condition, referenced) for condition, referenced in conditions if not referenced <= available]
+            return taken
+
+        def scan(table):
+            return with_filter(TableScan(table), take_conditions({table}))
+
+        joined = {tables[0]}
+        plan = scan(tables[0])
+        pending = list(tables[1:])
+        while pending:
+            table, key = self._next_join(conditions, joined, pending)
+            pending.remove(table)
+            if key is not None:
+                condition, left_key, operator, right_key = key
+                conditions[:] = [(other, referenced) for other, referenced in conditions if other is not condition]
+                plan = SortMergeJoin(plan, scan(table), left_key, operator, right_key, condition)
+                joined.add(table)
+                plan = with_filter(plan, take_conditions(joined))
+            else:
+                right = scan(table)
+                joined.add(table)
+                plan = BlockNestedLoopJoin(plan, right, combine_conditions(take_conditions(joined)))
+        return plan
+
+    @staticmethod
+    def _next_join(conditions, joined, pending):
+        """(table, (condition, left key, operator, right key)) of the table to join next, the key is None
+           without a comparison to the joined tables. Equality joins go first, they produce the fewest rows."""
+        candidates = []
+        for table in pending:
+            for condition, _ in conditions:
+                key = join_key(condition, joined, table)
+                if key is not None:
+                    candidates.append((table, (condition,) + key))
+        for table, key in candidates:
+            if key[2] == '=':
+                return table, key
+        if candidates:
+            return candidates[0]
+        return pending[0], None
+
+
+def split_conditions(expression):
+    """The AND-ed conditions of a WHERE clause"""
+    if isinstance(expression, AND):
+        return split_conditions(expression.left) + split_conditions(expression.right)
+    return [expression]
+
+
+def combine_conditions(conditions):
+    """AND of conditions, None without any"""
+    combined = None
+    for condition in conditions:
+        combined = condition if combined is None else AND(combined, condition)
+    return combined
+
+
+def with_filter(plan, conditions):
+    condition = combine_conditions(conditions)
+    return Filter(plan, condition) if condition is not None else plan
+
+
+def referenced_tables(expression, tables):
+    """Tables whose columns an expression reads"""
+    if isinstance(expression, str):
+        table = expression.split('.')[0]
+        return {table} if table in tables else set()
+    if isinstance(expression, Operator) and not isinstance(expression, BOOL):
+        return referenced_tables(expression.left, tables) | referenced_tables(expression.right, tables)
+    return set()
+
+
+def join_key(condition, joined, table):
+    """(left key, operator, right key) if the condition compares a column of the joined tables with one of table"""
+    operators = JOIN_OPERATORS.get(type(condition))
+    if operators is None or not isinstance(condition.left, str) or not isinstance(condition.right, str):
+        return None
+    left_table, right_table = condition.left.split('.')[0], condition.right.split('.')[0]
+    if left_table in joined and right_table == table:
+        return condition.left, operators[0], condition.right
+    if right_table in joined and left_table == table:
+        return condition.right, operators[1], condition.left
+    return None
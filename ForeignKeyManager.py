@@ -1,21 +1,24 @@
 class ForeignKeyRelationship:
-    def __init__(self, referencing_column, referenced_column):
+    def __init__(self, referencing_column, referenced_column, on_delete='RESTRICT', on_update='RESTRICT'):
         # Storing columns as fully qualified names like 'table.column'
         self.referencing_column = referencing_column
         self.referenced_column = referenced_column
+        # CASCADE, SET NULL or RESTRICT, see ReferentialActions
+        self.on_delete = on_delete
+        self.on_update = on_update
 
     def __repr__(self):
         return (f"ForeignKeyRelationship(referencing_column='{self.referencing_column}', "
-                f"referenced_column='{self.referenced_column}')")
+                f"referenced_column='{self.referenced_column}', on_delete='{self.on_delete}', on_update='{self.on_update}')")
 
 
 class ForeignKeyManager:
     def __init__(self):
         self.foreign_keys = []
 
-    def add_foreign_key(self, referencing_column, referenced_column):
+    def add_foreign_key(self, referencing_column, referenced_column, on_delete='RESTRICT', on_update='RESTRICT'):
         # Add foreign key relationship with fully qualified column names
-        relationship = ForeignKeyRelationship(referencing_column, referenced_column)
+        relationship = ForeignKeyRelationship(referencing_column, referenced_column, on_delete, on_update)
         self.foreign_keys.append(relationship)
 
     def get_columns_foreign_keys(self, column):
@@ -50,5 +53,6 @@ class ForeignKeyManager:
         if not self.foreign_keys:
             return "No foreign key relationships found."
 
-        fk_str = "\n".join([f"{fk.referencing_column} -> {fk.referenced_column}" for fk in self.foreign_keys])
+        fk_str = "\n".join([f"{fk.referencing_column} -> {fk.referenced_column} (ON DELETE {fk.on_delete}, ON UPDATE {fk.on_update})"
+                            for fk in self.foreign_keys])
         return f"ForeignKeyManager:\n{fk_str}"
@@ -1,18 +1,25 @@
+import io
 import re
+import string
 
 from ASTNodes.AlterNodes import AlterAddStmt, AlterDropStmt, AlterRenameStmt, AlterModifyStmt
 from ASTNodes.CreateNode import CreateStmt
 from ASTNodes.DeleteNode import DeleteStmt
 from ASTNodes.DropNode import DropStmt
+from ASTNodes.ExplainNode import ExplainStmt
+from ASTNodes.ShowNode import ShowTableStatsStmt
 from ASTNodes.InsertNode import InsertStmt
 from ASTNodes.SelectNode import SelectStmt
+from ASTNodes.TransactionNode import TransactionStmt
 from ASTNodes.UpdateNode import UpdateStmt
-from Exceptions import SQLSyntaxError, RegretDBError
+from Exceptions import SQLSyntaxError, RegretDBError, ProgrammingError, NotSupportedError
 from Operators.LogicalOperators import OR, AND, IS_NOT_NULL, IS_NULL, LE, GE, LT, GT, NE, EG, NOT, BOOL
-from TokenTypes import Identifier, Literal, Constraint
-from utility import format_options, parse_boolean
+from TokenTypes import Identifier, Literal, Constraint, Aggregate
+from utility import format_options, parse_boolean, is_word_char
 
 class Token:
+    __slots__ = ('type', 'value', 'length', 'offset')
+
     def __init__(self, type, value, offset):
         self.type = type  # e.g. 'IDENT', 'NUMBER', 'STRING' or a keyword like 'SELECT'
         self.value = value
@@ -38,60 +45,213 @@ class Tokenizer:
             ('NUMBER', r'\b\d+(?:\.\d*)?'),  # Integer or decimal
             ('TEXT', r"'([^']*)'"),  # Single-quoted string
             ('BLOB', r'b\'[0-9A-Fa-f]+\'|x\'[0-9A-Fa-f]+\''),  # BLOB (e.g., b'1A2B')
+            ('PARAM', r'\?'),  # Parameter placeholder, replaced by bind_parameters()
             ('MISMATCH', r'.'),  # Any other character
         ]
         self.tok_regex = '|'.join(f'(?P<{name}>{pattern})' for name, pattern in token_specification)
+        self.get_token = re.compile(self.tok_regex).match
         self.column_types = [
             'TEXT', 'NUMBER', 'BLOB', 'BOOL'
         ]
+        # Token types holding a value, these are replaced with placeholders by the plan cache
+        self.literal_types = ('NUMBER', 'TEXT', 'BOOLEAN', 'BLOB')
         self.keywords = [
-                            'SELECT', 'FROM', 'WHERE', 'ORDER', 'BY', 'ASC', 'DESC',
-                            'INSERT', 'INTO', 'VALUES',
+                            'SELECT', 'FROM', 'WHERE', 'GROUP', 'ORDER', 'BY', 'ASC', 'DESC',
+                            'INSERT', 'INTO', 'VALUES', 'CONFLICT', 'DO', 'NOTHING', 'EXCLUDED',
                             'UPDATE', 'SET',
-                            'DELETE',
+                            'DELETE', 'TRUNCATE',
                             'CREATE', 'TABLE',
                             'DROP',
                             'ALTER', 'ADD', 'RENAME', 'MODIFY', 'CASCADE', 'RESTRICT',
+                            'BEGIN', 'TRANSACTION', 'COMMIT', 'ROLLBACK',
+                            'EXPLAIN', 'ANALYZE',
+                            'SHOW', 'STATS',
                             'AND', 'OR', 'IS', 'NOT', 'NULL', 'FALSE', 'TRUE',  # operators
-                            'PRIMARY', 'FOREIGN', 'KEY', 'UNIQUE', 'DEFAULT'  # constraints
+                            'PRIMARY', 'FOREIGN', 'KEY', 'UNIQUE', 'DEFAULT', 'ON'  # constraints
                         ] + self.column_types
 
     def tokenize(self, sql):
-        get_token = re.compile(self.tok_regex).match
-        pos = 0
-        tokens = []
+        return list(self.iter_tokens(sql))
+
+    def iter_tokens(self, sql, pos=0):
+        """Lazily yields tokens of `sql` starting at `pos`"""
+        get_token = self.get_token
         while pos < len(sql):
             m = get_token(sql, pos)
             if not m:
                 raise SQLSyntaxError(f"Illegal character at position {pos}", adjust_pos=pos)
-            typ = m.lastgroup
-            lexeme = m.group(typ)
-            if typ == 'TEXT':
-                # Strip the quotes: lexeme includes the quotes, m.group(1) is content
-                tokens.append(Token('TEXT', lexeme[1:-1], pos))
-            elif typ == 'IDENTIFIER':
-                val = lexeme.upper()
-                # Recognize SQL keywords (we store the type as the uppercase keyword)
-                if val in self.keywords:
-                    tokens.append(Token(val, val, pos))
+            token = self.make_token(m, pos)
+            if token:
+                yield token
+            pos = m.end()
+
+    def tokenize_statements(self, source, chunk_size=1 << 16):
+        """Lazily splits a script on ';' and yields (statement text, tokens) pairs.
+           `source` is a str or a text file-like object, which is read in chunks of `chunk_size`,
+           so only the statement being tokenized is held in memory."""
+        if isinstance(source, str):
+            source = io.StringIO(source)
+
+        get_token = self.get_token
+        buffer = ''
+        eof = False
+        start = pos = 0  # start of the current statement and the scan position in the buffer
+        tokens = []
+        while True:
+            m = get_token(buffer, pos) if pos < len(buffer) else None
+
+            # A lexeme touching the end of the buffer (or an unterminated string) may continue in the next chunk
+            if not eof and (m is None or m.end() == len(buffer) or (m.lastgroup == 'MISMATCH' and m.group() == "'")):
+                chunk = source.read(chunk_size)
+                if chunk:
+                    # Dropping already executed statements
+                    buffer = buffer[start:] + chunk
+                    pos -= start
+                    start = 0
                 else:
-                    tokens.append(Token('IDENTIFIER', lexeme, pos))
-            elif typ == 'SKIP':
-                pass  # ignore whitespace
-            elif typ != 'MISMATCH':
-                tokens.append(Token(typ, lexeme, pos))
-            else:  # MISMATCH
-                raise SQLSyntaxError(f"Unexpected character {lexeme!r} at position {pos}", adjust_pos=pos)
+                    eof = True
+                continue
+
+            if m is None:
+                if pos < len(buffer):
+                    raise SQLSyntaxError(f"Illegal character at position {pos - start}", sql=buffer[start:pos + 1], pos=0, adjust_pos=pos - start)
+                break
+
+            if m.lastgroup == 'SEMI':
+                if tokens:
+                    yield buffer[start:pos], tokens
+                tokens = []
+                start = m.end()
+            else:
+                try:
+                    token = self.make_token(m, pos - start)
+                except SQLSyntaxError as e:
+                    e.sql = buffer[start:m.end()]
+                    e.pos = 0
+                    raise e
+                if token:
+                    tokens.append(token)
             pos = m.end()
+
+        if tokens:
+            yield buffer[start:], tokens
+
+    def make_token(self, m, offset):
+        """Creates a token from a regex match, returns None for skipped lexemes"""
+        typ = m.lastgroup
+        lexeme = m.group(typ)
+        if typ == 'TEXT':
+            # Strip the quotes: lexeme includes the quotes, m.group(1) is content
+            return Token('TEXT', lexeme[1:-1], offset)
+        elif typ == 'IDENTIFIER':
+            val = lexeme.upper()
+            # Recognize SQL keywords (we store the type as the uppercase keyword)
+            if val in self.keywords:
+                return Token(val, val, offset)
+            return Token('IDENTIFIER', lexeme, offset)
+        elif typ == 'SKIP':
+            return None  # ignore whitespace
+        elif typ != 'MISMATCH':
+            return Token(typ, lexeme, offset)
+        else:  # MISMATCH
+            raise SQLSyntaxError(f"Unexpected character {lexeme!r} at position {offset}", adjust_pos=offset)
+
+
+class FastTokenizer(Tokenizer):
+    """Hand-written scanner producing exactly the same tokens as the regex based Tokenizer.
+       It dispatches on the first character of a lexeme and looks keywords up in a set."""
+    IDENTIFIER_START = frozenset(string.ascii_letters + '_')
+    IDENTIFIER_CHARS = frozenset(string.ascii_letters + string.digits + '_')
+    WHITESPACE = frozenset(' \t\n\r')
+    PUNCTUATION = {'*': 'STAR', ',': 'COMMA', '(': 'LPAREN', ')': 'RPAREN', ';': 'SEMI', '.': 'DOT', '?': 'PARAM'}
+    OPERATORS = ('<=', '>=', '!=')
+    BOOLEANS = ('TRUE', 'FALSE')
+
+    def __init__(self):
+        super().__init__()
+        self.keyword_set = frozenset(self.keywords)
+
+    def tokenize(self, sql):
+        return self.scan(sql)
+
+    def iter_tokens(self, sql, pos=0):
+        return iter(self.scan(sql, pos))
+
+    def scan(self, sql, pos=0):
+        identifier_start = self.IDENTIFIER_START
+        identifier_chars = self.IDENTIFIER_CHARS
+        whitespace = self.WHITESPACE
+        punctuation = self.PUNCTUATION
+        keywords = self.keyword_set
+
+        tokens = []
+        append = tokens.append
+        n = len(sql)
+        while pos < n:
+            ch = sql[pos]
+            if ch in whitespace:
+                pos += 1
+                continue
+
+            start = pos
+            if ch in identifier_start:
+                pos += 1
+                while pos < n and sql[pos] in identifier_chars:
+                    pos += 1
+                lexeme = sql[start:pos]
+                val = lexeme.upper()
+                if val in keywords:
+                    # TRUE/FALSE are booleans only on word boundaries (\b in the regex tokenizer)
+                    if val in self.BOOLEANS and not (start > 0 and is_word_char(sql[start - 1])) and not (pos < n and is_word_char(sql[pos])):
+                        append(Token('BOOLEAN', lexeme, start))
+                    else:
+                        append(Token(val, val, start))
+                else:
+                    append(Token('IDENTIFIER', lexeme, start))
+
+            elif ch in punctuation:
+                pos += 1
+                append(Token(punctuation[ch], ch, start))
+
+            elif ch == "'":
+                end = sql.find("'", pos + 1)
+                if end == -1:
+                    raise SQLSyntaxError(f"Unexpected character {ch!r} at position {start}", adjust_pos=start)
+                pos = end + 1
+                append(Token('TEXT', sql[start + 1:end], start))
+
+            elif ch in '<>=!':
+                if sql[pos:pos + 2] in self.OPERATORS:
+                    pos += 2
+                elif ch != '!':
+                    pos += 1
+                else:
+                    raise SQLSyntaxError(f"Unexpected character {ch!r} at position {start}", adjust_pos=start)
+                append(Token('OP', sql[start:pos], start))
+
+            elif ch.isdecimal() and not (start > 0 and is_word_char(sql[start - 1])):
+                pos += 1
+                while pos < n and sql[pos].isdecimal():
+                    pos += 1
+                if pos < n and sql[pos] == '.':
+                    pos += 1
+                    while pos < n and sql[pos].isdecimal():
+                        pos += 1
+                append(Token('NUMBER', sql[start:pos], start))
+
+            else:
+                raise SQLSyntaxError(f"Unexpected character {ch!r} at position {start}", adjust_pos=start)
+
         return tokens
 
 
 class Parser:
-    def __init__(self):
-        self.tokenizer = Tokenizer()
+    def __init__(self, tokenizer=None):
+        self.tokenizer = tokenizer or Tokenizer()
         self.tokens = []
         self.pos = 0
         self.sql = None
+        self.bindings = []  # (token position, Literal) pairs, used to re-bind cached plans
         self.OPERATOR_MAP = {
             '=': EG,
             '!=': NE,
@@ -117,31 +277,53 @@ class Parser:
         else:
             raise SQLSyntaxError(f"Expected '{type_or_value}' instead found {token}")
 
-    def parse(self, sql_stmt):
+    def tokenize(self, sql_stmt):
+        """Tokenizes a statement, attaching the statement to syntax errors so they can be pretty printed"""
+        try:
+            return self.tokenizer.tokenize(sql_stmt)
+        except SQLSyntaxError as e:
+            e.sql = sql_stmt
+            e.pos = 0
+            raise e
+
+    def bind_parameters(self, tokens, parameters):
+        """Returns a copy of tokens with '?' placeholders replaced by literal tokens of the parameter values"""
+        bound = []
+        index = 0
+        for token in tokens:
+            if token.type != 'PARAM':
+                bound.append(token)
+                continue
+            if index >= len(parameters):
+                raise ProgrammingError(f"Not enough parameters, {len(parameters)} supplied")
+            bound.append(self.token_from_value(parameters[index], token.offset))
+            index += 1
+
+        if index != len(parameters):
+            raise ProgrammingError(f"Statement uses {index} parameters, {len(parameters)} supplied")
+        return bound
+
+    def token_from_value(self, value, offset):
+        if value is None:
+            return Token('NULL', 'NULL', offset)
+        elif isinstance(value, bool):
+            return Token('BOOLEAN', 'TRUE' if value else 'FALSE', offset)
+        elif isinstance(value, int):
+            return Token('NUMBER', str(value), offset)
+        elif isinstance(value, str):
+            return Token('TEXT', value, offset)
+        raise NotSupportedError(f"Unsupported parameter type: {type(value).__name__}")
+
+    def parse(self, sql_stmt, tokens=None):
+        """Parse the next statement based on the leading keyword and check for extra input.
+           Already tokenized input can be passed in `tokens` to skip tokenization."""
         self.pos = 0
-        """Parse the next statement based on the leading keyword and check for extra input."""
+        self.bindings = []
         try:
             self.sql = sql_stmt
 
-            self.tokens = self.tokenizer.tokenize(self.sql)
-            token = self.peek()
-
-            if token.type == 'SELECT':
-                stmt = self.parse_select()
-            elif token.type == 'INSERT':
-                stmt = self.parse_insert()
-            elif token.type == 'UPDATE':
-                stmt = self.parse_update()
-            elif token.type == 'DELETE':
-                stmt = self.parse_delete()
-            elif token.type == 'CREATE':
-                stmt = self.parse_create()
-            elif token.type == 'DROP':
-                stmt = self.parse_drop()
-            elif token.type == 'ALTER':
-                stmt = self.parse_alter()
-            else:
-                raise SQLSyntaxError(f"Unknown statement start: {token}")
+            self.tokens = tokens if tokens is not None else self.tokenizer.tokenize(self.sql)
+            stmt = self.parse_statement()
 
             # 🔒 Check for leftover tokens
             if self.peek().type != 'EOF':
@@ -154,19 +336,60 @@ class Parser:
             e.pos = self.pos
             raise e
 
+    def parse_statement(self):
+        token = self.peek()
+        if token.type == 'EXPLAIN':
+            stmt = self.parse_explain()
+        elif token.type == 'SELECT':
+            stmt = self.parse_select()
+        elif token.type == 'INSERT':
+            stmt = self.parse_insert()
+        elif token.type == 'UPDATE':
+            stmt = self.parse_update()
+        elif token.type == 'DELETE':
+            stmt = self.parse_delete()
+        elif token.type == 'TRUNCATE':
+            stmt = self.parse_truncate()
+        elif token.type == 'CREATE':
+            stmt = self.parse_create()
+        elif token.type == 'DROP':
+            stmt = self.parse_drop()
+        elif token.type == 'ALTER':
+            stmt = self.parse_alter()
+        elif token.type in ('BEGIN', 'COMMIT', 'ROLLBACK'):
+            stmt = self.parse_transaction()
+        elif token.type == 'SHOW':
+            stmt = self.parse_show()
+        else:
+            raise SQLSyntaxError(f"Unknown statement start: {token}")
+        return stmt
+
+    def parse_explain(self):
+        """EXPLAIN [ANALYZE] <SELECT, INSERT, UPDATE or DELETE statement>"""
+        self.expect('EXPLAIN')
+        analyze = self.peek().type == 'ANALYZE'
+        if analyze:
+            self.advance()
+        if self.peek().type not in ('SELECT', 'INSERT', 'UPDATE', 'DELETE'):
+            raise SQLSyntaxError(f"EXPLAIN expects a SELECT, INSERT, UPDATE or DELETE statement, found {self.peek()}")
+        return ExplainStmt(self.parse_statement(), analyze)
+
     def parse_literal(self):
         token = self.peek()
+        literal = self.literal_from_token(token)
+        if token.type in self.tokenizer.literal_types:
+            self.bindings.append((self.pos, literal))
+        self.advance()
+        return literal
+
+    def literal_from_token(self, token):
         if token.type == 'NUMBER':
-            self.advance()
             return Literal(type=token.type, value=int(token.value))
         elif token.type == 'BOOLEAN':
-            self.advance()
             return Literal(type=token.type, value=parse_boolean(token.value))
         elif token.type == 'TEXT':
-            self.advance()
             return Literal(type=token.type, value=token.value)
         elif token.type == 'NULL':
-            self.advance()
             return Literal(type=token.type, value=None)
         else:
             raise SQLSyntaxError(f"Expected literal value, found {token}")
@@ -250,8 +473,8 @@ class Parser:
                 self.expect('(')
                 column = self.parse_column()
                 self.expect(')')
-                # TODO ON UPDATE CASCADE/RESTRICT
-                constraints.append(Constraint(type='FOREIGN KEY', arg1=f"{table.value}.{column.value}"))
+                actions = self.parse_referential_actions()
+                constraints.append(Constraint(type='FOREIGN KEY', arg1=f"{table.value}.{column.value}", arg2=actions))
 
             elif token.type == 'UNIQUE':
                 self.advance()
@@ -270,6 +493,31 @@ class Parser:
                 break
         return constraints
 
+    def parse_referential_actions(self):
+        """[ON DELETE <action>] [ON UPDATE <action>], an action is CASCADE, SET NULL or RESTRICT (the default).
+           Returns (ON DELETE action, ON UPDATE action)"""
+        actions = {}
+        while self.peek().type == 'ON':
+            self.advance()
+            event = self.peek()
+            if event.type not in ('DELETE', 'UPDATE'):
+                raise SQLSyntaxError(f"Expected DELETE or UPDATE after ON, found {event}")
+            self.advance()
+            if event.type in actions:
+                raise SQLSyntaxError(f"Duplicate ON {event.type} action", adjust_pos=-1)
+
+            token = self.peek()
+            if token.type in ('CASCADE', 'RESTRICT'):
+                self.advance()
+                actions[event.type] = token.type
+            elif token.type == 'SET':
+                self.advance()
+                self.expect('NULL')
+                actions[event.type] = 'SET NULL'
+            else:
+                raise SQLSyntaxError(f"Expected CASCADE, SET NULL or RESTRICT, found {token}")
+        return actions.get('DELETE', 'RESTRICT'), actions.get('UPDATE', 'RESTRICT')
+
     def parse_order_by(self):
         self.expect('ORDER')
         self.expect('BY')
@@ -287,14 +535,21 @@ class Parser:
             self.advance()  # skip comma
         return orderings
 
-    def parse_assignments(self):
+    def parse_assignments(self, allow_excluded=False):
+        """<column>=<value> [, ...], values of ON CONFLICT DO UPDATE may be EXCLUDED.<column>, the value the
+           conflicting row would have inserted"""
         assignments = []
 
         while True:
             column = self.parse_column()
             self.expect('=')
-            literal = self.parse_literal()
-            assignments.append((column, literal))
+            if allow_excluded and self.peek().type == 'EXCLUDED':
+                self.advance()
+                self.expect('DOT')
+                value = Identifier(type='EXCLUDED', value=self.expect('IDENTIFIER').value)
+            else:
+                value = self.parse_literal()
+            assignments.append((column, value))
 
             if self.peek().type != 'COMMA':
                 break
@@ -389,13 +644,13 @@ class Parser:
     # ===========================================
 
     def parse_select(self):
-        """SELECT <columns> FROM <table> [WHERE <expr>] [ORDER BY <column> ASC|DESC]"""
+        """SELECT <columns> FROM <table> [WHERE <expr>] [GROUP BY <columns>] [ORDER BY <column> ASC|DESC]"""
         self.expect('SELECT')
         if self.peek().type == 'STAR':
             self.advance()
             columns = [Identifier(type='COLUMN', value="*")]
         else:
-            columns = self.parse_columns()
+            columns = self.parse_select_list()
 
         self.expect('FROM')
         tables = self.parse_tables()
@@ -405,14 +660,50 @@ class Parser:
             self.advance()
             where_expr = self.parse_expression()
 
+        group_by = None
+        if self.peek().type == 'GROUP':
+            self.advance()
+            self.expect('BY')
+            group_by = self.parse_columns()
+
         order_by = None
         if self.peek().type == 'ORDER':
             order_by = self.parse_order_by()
 
-        return SelectStmt(columns, tables, where_expr, order_by)
+        return SelectStmt(columns, tables, where_expr, order_by, group_by)
+
+    def parse_select_list(self):
+        """Comma-separated columns and aggregates like COUNT(*) or SUM(column)"""
+        items = [self.parse_select_item()]
+        while self.peek().type == 'COMMA':
+            self.advance()
+            items.append(self.parse_select_item())
+        return items
+
+    def parse_select_item(self):
+        token = self.peek()
+        is_call = self.pos + 1 < len(self.tokens) and self.tokens[self.pos + 1].type == 'LPAREN'
+        if token.type != 'IDENTIFIER' or not is_call:
+            return self.parse_column()
+
+        function = token.value.upper()
+        if function not in Aggregate.FUNCTIONS:
+            raise SQLSyntaxError(f"Unknown function '{token.value}', expected one of {format_options(Aggregate.FUNCTIONS)}")
+        self.advance()
+        self.expect('(')
+        if self.peek().type == 'STAR':
+            if function != 'COUNT':
+                raise SQLSyntaxError(f"Only COUNT accepts '*'")
+            self.advance()
+            column = Identifier(type='COLUMN', value='*')
+        else:
+            column = self.parse_column()
+        self.expect(')')
+        return Aggregate(function, column)
 
     def parse_insert(self):
-        """INSERT INTO <table> (<columns>) VALUES (<values>)"""
+        """INSERT INTO <table> (<columns>) VALUES (<values>)
+           [ON CONFLICT (<column>) DO NOTHING | DO UPDATE SET <column>=<value | EXCLUDED.column> [, ...]]"""
         self.expect('INSERT')
         self.expect('INTO')
 
@@ -428,7 +719,21 @@ class Parser:
         values = self.parse_value_list()
         self.expect(')')
 
-        return InsertStmt(table, columns, values)
+        if self.peek().type != 'ON':
+            return InsertStmt(table, columns, values)
+
+        self.advance()
+        self.expect('CONFLICT')
+        self.expect('(')
+        conflict_column = self.parse_column()
+        self.expect(')')
+        self.expect('DO')
+        if self.peek().type == 'NOTHING':
+            self.advance()
+            return InsertStmt(table, columns, values, conflict_column, 'NOTHING')
+        self.expect('UPDATE')
+        self.expect('SET')
+        return InsertStmt(table, columns, values, conflict_column, 'UPDATE', self.parse_assignments(allow_excluded=True))
 
     def parse_update(self):
         """UPDATE <table> SET <column>=<value> [, <column>=<value> ...] [WHERE <condition>] """
@@ -456,6 +761,13 @@ class Parser:
             where_expr = self.parse_expression()
         return DeleteStmt(table, where_expr)
 
+    def parse_truncate(self):
+        """TRUNCATE [TABLE] <table>, a DELETE without WHERE clause"""
+        self.expect('TRUNCATE')
+        if self.peek().type == 'TABLE':
+            self.advance()
+        return DeleteStmt(self.parse_table(), None)
+
     def parse_create(self):
         """CREATE TABLE <table_name> (<column_name1> <data_type1> <constraints>, <column_name2> <data_type2> <constraints> ...)"""
         self.expect('CREATE')
@@ -486,6 +798,22 @@ class Parser:
         table = self.parse_table()
         return DropStmt(table)
 
+    def parse_show(self):
+        """SHOW TABLE STATS [<table_name>]"""
+        self.expect('SHOW')
+        self.expect('TABLE')
+        self.expect('STATS')
+        table = self.parse_table() if self.peek().type == 'IDENTIFIER' else None
+        return ShowTableStatsStmt(table)
+
+    def parse_transaction(self):
+        """BEGIN [TRANSACTION] | COMMIT | ROLLBACK"""
+        action = self.peek().type
+        self.advance()
+        if action == 'BEGIN' and self.peek().type == 'TRANSACTION':
+            self.advance()
+        return TransactionStmt(action)
+
     def parse_alter(self):
         """ALTER TABLE <table_name> [ADD COLUMN <column_name> <data_type> [<constraints>]]
           | [DROP COLUMN <column_name>]
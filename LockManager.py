@@ -0,0 +1,168 @@
+import threading
+import time
+from collections import Counter
+
+from Exceptions import DeadlockError
+
+"""
+Per-table shared/exclusive locks.
+
+Locks are owned by a thread (which runs at most one transaction) and are held until the end of the
+statement, or until COMMIT/ROLLBACK inside a transaction (strict two phase locking):
+
+self.locks = {
+    'table_name': TableLock(shared={owner1, owner2, ...}, exclusive=owner or None),
+    ...
+}
+
+A waiting owner registers the owners blocking it in self.waits_for, a wait closing a cycle in that graph
+is a deadlock and the waiting owner gets a DeadlockError.
+"""
+
+SHARED = 'S'
+EXCLUSIVE = 'X'
+
+
+class TableLock:
+    def __init__(self):
+        self.shared = set()
+        self.exclusive = None
+
+    def is_grantable(self, mode, owner):
+        if self.exclusive is not None and self.exclusive != owner:
+            return False
+        return mode == SHARED or not (self.shared - {owner})
+
+    def blockers(self, mode, owner):
+        blockers = set()
+        if self.exclusive is not None and self.exclusive != owner:
+            blockers.add(self.exclusive)
+        if mode == EXCLUSIVE:
+            blockers |= self.shared - {owner}
+        return blockers
+
+    def __repr__(self):
+        return f"TableLock(shared={self.shared}, exclusive={self.exclusive})"
+
+
+class LockManager:
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.locks = {}
+        self.held = {}  # owner -> set of locked tables
+        self.waits_for = {}  # owner -> set of owners it waits for
+
+        # Metrics
+        self.acquisitions = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+        self.deadlocks = 0
+        self.table_waits = Counter()
+
+    def acquire(self, table_name, mode, owner=None):
+        owner = owner if owner is not None else threading.get_ident()
+        with self.condition:
+            self.acquisitions += 1
+            lock = self.locks.setdefault(table_name, TableLock())
+            if not lock.is_grantable(mode, owner):
+                lock = self._wait(table_name, mode, owner)
+
+            if mode == EXCLUSIVE:
+                lock.exclusive = owner
+            else:
+                lock.shared.add(owner)
+            self.held.setdefault(owner, set()).add(table_name)
+
+    def _wait(self, table_name, mode, owner):
+        """Waits until the lock can be granted and returns it, released locks are dropped so it's looked up again"""
+        self.waits += 1
+        self.table_waits[table_name] += 1
+        started = time.perf_counter()
+        try:
+            while True:
+                lock = self.locks.setdefault(table_name, TableLock())
+                if lock.is_grantable(mode, owner):
+                    return lock
+                self.waits_for[owner] = lock.blockers(mode, owner)
+                if self._closes_cycle(owner):
+                    self.deadlocks += 1
+                    raise DeadlockError(f"Deadlock detected while waiting for {'an exclusive' if mode == EXCLUSIVE else 'a shared'} lock on table '{table_name}'")
+                self.condition.wait()
+        finally:
+            self.waits_for.pop(owner, None)
+            waited = time.perf_counter() - started
+            self.wait_time += waited
+            self.max_wait_time = max(self.max_wait_time, waited)
+
+    def _closes_cycle(self, owner):
+        """Depth first search in the wait-for graph for a path leading back to owner"""
+        stack = list(self.waits_for.get(owner, ()))
+        seen = set()
+        while stack:
+            current = stack.pop()
+            if current == owner:
+                return True
+            if current in seen:
+                continue
+            seen.add(current)
+            stack.extend(self.waits_for.get(current, ()))
+        return False
+
+    def release(self, table_name, owner=None):
+        owner = owner if owner is not None else threading.get_ident()
+        with self.condition:
+            tables = self.held.get(owner)
+            if tables is None or table_name not in tables:
+                return
+            tables.discard(table_name)
+            if not tables:
+                del self.held[owner]
+            self._release(table_name, owner)
+            self.condition.notify_all()
+
+    def release_all(self, owner=None):
+        owner = owner if owner is not None else threading.get_ident()
+        with self.condition:
+            tables = self.held.pop(owner, ())
+            for table_name in tables:
+                self._release(table_name, owner)
+            if tables:
+                self.condition.notify_all()
+
+    def _release(self, table_name, owner):
+        lock = self.locks.get(table_name)
+        if lock is None:
+            return
+        lock.shared.discard(owner)
+        if lock.exclusive == owner:
+            lock.exclusive = None
+        if not lock.shared and lock.exclusive is None:
+            del self.locks[table_name]
+
+    def try_acquire_exclusive(self, table_name, owner=None):
+        """Takes an exclusive lock only if it's free right now, returns whether it was taken"""
+        owner = owner if owner is not None else threading.get_ident()
+        with self.condition:
+            lock = self.locks.setdefault(table_name, TableLock())
+            if not lock.is_grantable(EXCLUSIVE, owner):
+                return False
+            lock.exclusive = owner
+            self.held.setdefault(owner, set()).add(table_name)
+            return True
+
+    def holds(self, table_name, owner=None):
+        owner = owner if owner is not None else threading.get_ident()
+        return table_name in self.held.get(owner, ())
+
+    def stats(self):
+        with self.condition:
+            return {
+                'acquisitions': self.acquisitions,
+                'waits': self.waits,
+                'wait_time': self.wait_time,
+                'max_wait_time': self.max_wait_time,
+                'avg_wait_time': self.wait_time / self.waits if self.waits else 0.0,
+                'deadlocks': self.deadlocks,
+                'table_waits': dict(self.table_waits),
+            }
@@ -0,0 +1,109 @@
+import sys
+
+from VersionManager import RowVersion
+
+"""
+Memory accounting of tables:
+
+    data_manager.table_stats('users')                       # or SHOW TABLE STATS users
+    data_manager.set_memory_budget(512 * 1024 * 1024, action='warn')
+
+The sizes are estimates made with sys.getsizeof(). Row dictionaries and their values are measured on a
+sample of at most SAMPLE_ROWS rows spread over the table and scaled to the whole table, column names are
+shared by all rows and counted once. None, booleans and small integers are interpreted singletons,
+they cost nothing besides their slot in the dictionary.
+
+RegretDB has no indexes, the per-table structures next to the row list are the MVCC row versions and
+the map from live rows to their current version (VersionManager.current_versions), which is reported
+as the index of the table. Versions of deleted or replaced rows keep their old row dictionaries alive
+until the garbage collection reclaims them, they are counted in version_bytes.
+"""
+
+SAMPLE_ROWS = 1000
+POINTER_BYTES = 8
+VERSION_BYTES = sys.getsizeof(RowVersion(None))
+INDEX_KEY_BYTES = sys.getsizeof(2 ** 40)  # the id() of a live row
+# What a row costs besides its dictionary and values: its slots in the row and version lists, its version
+# and its entry (hash, key and value) in the index
+ROW_OVERHEAD_BYTES = 2 * POINTER_BYTES + VERSION_BYTES + INDEX_KEY_BYTES + 3 * POINTER_BYTES
+STATS_COLUMNS = ['table', 'rows', 'versions', 'bytes_per_row', 'dict_bytes', 'string_bytes', 'value_bytes',
+                 'list_bytes', 'version_bytes', 'index_bytes', 'total_bytes']
+
+
+class TableStats:
+    __slots__ = ('table', 'rows', 'versions', 'dict_bytes', 'string_bytes', 'value_bytes', 'list_bytes',
+                 'version_bytes', 'index_bytes')
+
+    def __init__(self, table, rows, versions):
+        self.table = table
+        self.rows = rows
+        self.versions = versions  # row versions, live rows and old versions not reclaimed yet
+        self.dict_bytes = 0  # row dictionaries
+        self.string_bytes = 0  # TEXT values and column names
+        self.value_bytes = 0  # other values (numbers, BLOBs)
+        self.list_bytes = 0  # the list holding the rows
+        self.version_bytes = 0
+        self.index_bytes = 0
+
+    @property
+    def bytes_per_row(self):
+        """Row dictionary and values of an average row"""
+        if not self.rows:
+            return 0
+        return (self.dict_bytes + self.string_bytes + self.value_bytes) // self.rows
+
+    @property
+    def total_bytes(self):
+        return (self.dict_bytes + self.string_bytes + self.value_bytes + self.list_bytes + self.version_bytes
+                + self.index_bytes)
+
+    def as_dict(self):
+        return {column: getattr(self, column) for column in STATS_COLUMNS}
+
+    def __repr__(self):
+        return f"TableStats({', '.join(f'{column}={getattr(self, column)}' for column in STATS_COLUMNS)})"
+
+
+def value_size(value):
+    if value is None or isinstance(value, bool) or (type(value) is int and -5 <= value <= 256):
+        return 0
+    return sys.getsizeof(value)
+
+
+def sample(rows, size=SAMPLE_ROWS):
+    if len(rows) <= size:
+        return rows
+    return rows[::len(rows) // size][:size]
+
+
+def row_payload(rows):
+    """(dictionary, string, other value) bytes of an average row of `rows`, measured on a sample"""
+    rows = sample(rows)
+    if not rows:
+        return 0, 0, 0
+    dict_bytes = string_bytes = value_bytes = 0
+    for row in rows:
+        dict_bytes += sys.getsizeof(row)
+        for value in row.values():
+            if isinstance(value, str):
+                string_bytes += sys.getsizeof(value)
+            else:
+                value_bytes += value_size(value)
+    return dict_bytes / len(rows), string_bytes / len(rows), value_bytes / len(rows)
+
+
+def measure_table(table_name, columns, rows, versions, index):
+    """TableStats of a table from its live rows, row versions and current version map"""
+    stats = TableStats(table_name, len(rows), len(versions))
+    dict_bytes, string_bytes, value_bytes = row_payload(rows)
+    stats.dict_bytes = round(dict_bytes * len(rows))
+    stats.string_bytes = round(string_bytes * len(rows)) + sum(sys.getsizeof(column) for column in columns)
+    stats.value_bytes = round(value_bytes * len(rows))
+    stats.list_bytes = sys.getsizeof(rows)
+
+    # Versions beyond the live rows hold dictionaries of deleted or replaced rows
+    old_versions = max(len(versions) - len(rows), 0)
+    stats.version_bytes = (sys.getsizeof(versions) + VERSION_BYTES * len(versions)
+                           + round((dict_bytes + string_bytes + value_bytes) * old_versions))
+    stats.index_bytes = sys.getsizeof(index) + INDEX_KEY_BYTES * len(index)
+    return stats
@@ -0,0 +1,235 @@
+import bisect
+import threading
+from time import perf_counter
+
+"""
+Per statement instrumentation:
+
+    sink = HistogramSink()
+    db = RegretDB(metrics=sink)
+    ...
+    sink.snapshot()          # counts, sums and latency percentiles per statement type and phase
+    sink.to_prometheus()     # the same in the Prometheus text exposition format
+
+    db = RegretDB(metrics=CallbackSink(lambda metrics: print(metrics)))
+
+Every statement is measured in the phases tokenize, parse, verify, plan and execute. A statement whose
+plan comes from the plan cache isn't parsed, verified or planned, its 'plan' phase is the cache lookup.
+Rows of a SELECT are produced while they are fetched, so its 'execute' phase is the time spent producing
+them and it is recorded once the cursor is exhausted or closed.
+Without a sink (the default) nothing is measured.
+
+Constraint checks count the full table scans they do in `check_scans`, table scans count the rows they
+read in `scanned_rows`, both per thread.
+"""
+
+class CheckScans(threading.local):
+    """Table scans done by uniqueness and foreign key checks on this thread"""
+
+    def __init__(self):
+        self.unique = 0
+        self.foreign_key = 0
+
+
+check_scans = CheckScans()
+
+
+class ScannedRows(threading.local):
+    """Rows read by table scans on this thread, row versions for scans of MVCC snapshots"""
+
+    def __init__(self):
+        self.count = 0
+
+
+scanned_rows = ScannedRows()
+
+
+class StatementMetrics:
+    """Measurements of one statement, passed to MetricsSink.record()"""
+
+    def __init__(self, sql):
+        self.sql = sql
+        self.statement = None  # statement type, its leading keyword e.g. 'SELECT'
+        self.phases = {}  # phase -> seconds
+        self.rows = -1  # rows returned by a SELECT, affected rows otherwise
+        self.rows_scanned = 0
+        self.cached = False  # the plan came from the plan cache
+        self.error = None  # exception class name of a failed statement
+        self.unique_scans = 0
+        self.foreign_key_scans = 0
+        self.key = None  # plan cache key of the statement, its literals are replaced by placeholders
+        self.plan = None
+        self._counting = False
+        self.resume()
+        self._last = perf_counter()
+
+    def lap(self, phase):
+        """Adds the time since the previous lap to a phase"""
+        now = perf_counter()
+        self.phases[phase] = self.phases.get(phase, 0.0) + now - self._last
+        self._last = now
+
+    def resume(self):
+        """Starts counting the scans of this thread towards the statement"""
+        if not self._counting:
+            self._counting = True
+            self.unique_scans -= check_scans.unique
+            self.foreign_key_scans -= check_scans.foreign_key
+            self.rows_scanned -= scanned_rows.count
+
+    def pause(self):
+        """Stops counting, the thread runs something else (e.g. while the rows of a cursor aren't fetched)"""
+        if self._counting:
+            self._counting = False
+            self.unique_scans += check_scans.unique
+            self.foreign_key_scans += check_scans.foreign_key
+            self.rows_scanned += scanned_rows.count
+
+    def finish(self):
+        self.pause()
+        return self
+
+    @property
+    def fingerprint(self):
+        """The statement with its literals replaced by '?', statements differing only in literals share it"""
+        if self.key is None:
+            return self.sql
+        text = ' '.join('?' if value in ('?', '?0') else str(value) for _, value in self.key)
+        return text.replace(' . ', '.').replace(' ,', ',').replace('( ', '(').replace(' )', ')')
+
+    @property
+    def total(self):
+        return sum(self.phases.values())
+
+    def __repr__(self):
+        phases = ', '.join(f"{phase}={seconds * 1000:.3f}ms" for phase, seconds in self.phases.items())
+        return (f"StatementMetrics({self.statement}, {phases}, rows={self.rows}, rows_scanned={self.rows_scanned}, cached={self.cached}, "
+                f"unique_scans={self.unique_scans}, foreign_key_scans={self.foreign_key_scans}, error={self.error})")
+
+
+class MetricsSink:
+    def record(self, metrics):
+        raise NotImplementedError()
+
+
+class MultiSink(MetricsSink):
+    """Passes every StatementMetrics to several sinks"""
+
+    def __init__(self, *sinks):
+        self.sinks = sinks
+
+    def record(self, metrics):
+        for sink in self.sinks:
+            sink.record(metrics)
+
+
+class CallbackSink(MetricsSink):
+    """Passes every StatementMetrics to a function"""
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def record(self, metrics):
+        self.callback(metrics)
+
+
+class Histogram:
+    # Upper bounds of the buckets in seconds, the last bucket is unbounded
+    BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+               2.5, 5.0, 10.0)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile, an estimate precise to the bucket width"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+
+class HistogramSink(MetricsSink):
+    """Keeps latency histograms per statement type and phase and counters per statement type in memory"""
+
+    def __init__(self):
+        self.histograms = {}  # (statement, phase) -> Histogram, phase 'total' for whole statements
+        self.counters = {}  # (statement, counter) -> value
+        self.__lock = threading.Lock()
+
+    def record(self, metrics):
+        statement = metrics.statement or 'UNKNOWN'
+        with self.__lock:
+            for phase, seconds in metrics.phases.items():
+                self._observe(statement, phase, seconds)
+            self._observe(statement, 'total', metrics.total)
+            self._count(statement, 'statements', 1)
+            self._count(statement, 'errors', metrics.error is not None)
+            self._count(statement, 'cache_hits', metrics.cached)
+            self._count(statement, 'rows', max(metrics.rows, 0))
+            self._count(statement, 'rows_scanned', metrics.rows_scanned)
+            self._count(statement, 'unique_scans', metrics.unique_scans)
+            self._count(statement, 'foreign_key_scans', metrics.foreign_key_scans)
+
+    def _observe(self, statement, phase, seconds):
+        histogram = self.histograms.get((statement, phase))
+        if histogram is None:
+            histogram = self.histograms[(statement, phase)] = Histogram()
+        histogram.observe(seconds)
+
+    def _count(self, statement, counter, value):
+        self.counters[(statement, counter)] = self.counters.get((statement, counter), 0) + value
+
+    def snapshot(self):
+        """{statement: {'counters': {...}, 'phases': {phase: {count, sum, p50, p95, p99}}}}"""
+        with self.__lock:
+            result = {}
+            for (statement, counter), value in self.counters.items():
+                result.setdefault(statement, {'counters': {}, 'phases': {}})['counters'][counter] = value
+            for (statement, phase), histogram in self.histograms.items():
+                result[statement]['phases'][phase] = {
+                    'count': histogram.count,
+                    'sum': histogram.sum,
+                    'p50': histogram.quantile(0.5),
+                    'p95': histogram.quantile(0.95),
+                    'p99': histogram.quantile(0.99),
+                }
+            return result
+
+    def reset(self):
+        with self.__lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+    def to_prometheus(self, prefix='regretdb'):
+        """Renders the metrics in the Prometheus text exposition format"""
+        with self.__lock:
+            lines = [f"# TYPE {prefix}_phase_seconds histogram"]
+            for (statement, phase), histogram in sorted(self.histograms.items()):
+                labels = f'statement="{statement}",phase="{phase}"'
+                cumulative = 0
+                for bound, count in zip(Histogram.BUCKETS, histogram.counts):
+                    cumulative += count
+                    lines.append(f'{prefix}_phase_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'{prefix}_phase_seconds_bucket{{{labels},le="+Inf"}} {histogram.count}')
+                lines.append(f'{prefix}_phase_seconds_sum{{{labels}}} {histogram.sum}')
+                lines.append(f'{prefix}_phase_seconds_count{{{labels}}} {histogram.count}')
+
+            for counter in sorted({counter for _, counter in self.counters}):
+                lines.append(f"# TYPE {prefix}_{counter}_total counter")
+                for (statement, name), value in sorted(self.counters.items()):
+                    if name == counter:
+                        lines.append(f'{prefix}_{counter}_total{{statement="{statement}"}} {value}')
+            return '\n'.join(lines) + '\n'
@@ -1,5 +1,7 @@
 from abc import ABC, abstractmethod
 
+from TokenTypes import Literal
+
 
 class Operator(ABC):
     def __init__(self, left, right=None):
@@ -18,6 +20,8 @@ class Operator(ABC):
     def resolve(self, operand, row):
         if isinstance(operand, Operator):
             return operand.execute(row)
+        if isinstance(operand, Literal):
+            return operand.value
         if isinstance(operand, str) and operand in row:  # else return the value of the column identifier in the row
             return row[operand]
         return operand
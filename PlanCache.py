@@ -0,0 +1,94 @@
+from collections import OrderedDict
+
+"""
+Statement level plan cache.
+
+Statements are keyed by their token stream with literal values replaced by placeholders, so
+"SELECT * FROM users WHERE id = 1" and "SELECT * FROM users WHERE id = 2" share one entry.
+An entry holds the verified AST, the plan built from it and the Literal objects bound into that
+plan, on every hit the new literal values are written into those Literal objects.
+"""
+
+
+class CacheEntry:
+    def __init__(self, statement, plan, bindings, schema_version):
+        self.statement = statement
+        self.plan = plan
+        self.bindings = bindings  # [(token position, Literal), ...]
+        self.schema_version = schema_version
+        self.in_use = False  # set while an open cursor still reads through the plan
+
+    def __repr__(self):
+        return f"CacheEntry(statement={self.statement}, schema_version={self.schema_version})"
+
+
+class PlanCache:
+    def __init__(self, capacity=128):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def make_key(self, tokens, literal_types, literal_from_token):
+        """Returns the normalized key for a token stream or None if the statement can't be cached"""
+        key = []
+        for token in tokens:
+            if token.type not in literal_types:
+                key.append((token.type, token.value))
+                continue
+            try:
+                literal = literal_from_token(token)
+            except Exception:
+                return None  # let the parser report it
+            # check_type() treats falsy literals as NULL, so they must not share a template with truthy ones
+            key.append((token.type, '?' if literal.value else '?0'))
+        return tuple(key)
+
+    def get(self, key, schema_version):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        if entry.schema_version != schema_version:
+            del self.entries[key]
+            self.invalidations += 1
+            self.misses += 1
+            return None
+
+        if entry.in_use:
+            # Re-binding would change the result of an unfinished cursor, a fresh plan replaces this entry
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key, entry):
+        if self.capacity <= 0:
+            return
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'size': len(self.entries),
+            'capacity': self.capacity,
+        }
+
+    def __str__(self):
+        stats = self.stats()
+        return (f"PlanCache(size={stats['size']}/{stats['capacity']}, hits={stats['hits']}, "
+                f"misses={stats['misses']}, hit_rate={stats['hit_rate']:.2%})")
@@ -0,0 +1,153 @@
+from DataManager import data_manager
+from LockManager import SHARED
+from PlanNodes.BasePlanNode import PlanNode
+from utility import indent
+
+
+class Accumulator:
+    """State of one aggregate of one group, NULLs are ignored like in SQL"""
+    __slots__ = ('value', 'count')
+
+    def __init__(self):
+        self.value = None
+        self.count = 0
+
+    def add(self, value):
+        raise NotImplementedError()
+
+    def result(self):
+        return self.value
+
+
+class CountAccumulator(Accumulator):
+    __slots__ = ()
+
+    def add(self, value):
+        if value is not None:
+            self.count += 1
+
+    def result(self):
+        return self.count
+
+
+class SumAccumulator(Accumulator):
+    __slots__ = ()
+
+    def add(self, value):
+        if value is not None:
+            self.value = value if self.value is None else self.value + value
+
+
+class MinAccumulator(Accumulator):
+    __slots__ = ()
+
+    def add(self, value):
+        if value is not None and (self.value is None or value < self.value):
+            self.value = value
+
+
+class MaxAccumulator(Accumulator):
+    __slots__ = ()
+
+    def add(self, value):
+        if value is not None and (self.value is None or value > self.value):
+            self.value = value
+
+
+class AvgAccumulator(Accumulator):
+    __slots__ = ()
+
+    def add(self, value):
+        if value is not None:
+            self.value = value if self.value is None else self.value + value
+            self.count += 1
+
+    def result(self):
+        return self.value / self.count if self.count else None
+
+
+ACCUMULATORS = {
+    'COUNT': CountAccumulator,
+    'SUM': SumAccumulator,
+    'MIN': MinAccumulator,
+    'MAX': MaxAccumulator,
+    'AVG': AvgAccumulator,
+}
+
+
+class HashAggregate(PlanNode):
+    """
+    Groups the rows of its source by the GROUP BY columns in a hash table and computes the aggregates.
+    Rows are streamed from the source, only one set of accumulators per group is kept in memory.
+    Without GROUP BY there is exactly one group, so an empty input still gives one row (COUNT(*) = 0).
+    """
+
+    explain_attributes = ('group_by', 'aggregates')
+
+    def __init__(self, source, group_by, aggregates):
+        super().__init__()
+        self.source = source
+        self.group_by = group_by  # qualified columns
+        self.aggregates = aggregates  # Aggregate objects
+
+    def execute(self):
+        return list(self.iterate())
+
+    def iterate(self):
+        group_by = self.group_by
+        # (accumulator class, column or None for COUNT(*)) for every aggregate
+        specs = [(ACCUMULATORS[aggregate.function], None if aggregate.column == '*' else aggregate.column)
+                 for aggregate in self.aggregates]
+        groups = {}
+        if not group_by:
+            groups[()] = [accumulator() for accumulator, _ in specs]
+
+        for row in self.source.iterate():
+            key = tuple([row[column] for column in group_by])
+            accumulators = groups.get(key)
+            if accumulators is None:
+                accumulators = groups[key] = [accumulator() for accumulator, _ in specs]
+            for accumulator, (_, column) in zip(accumulators, specs):
+                # COUNT(*) counts rows, every row is a non NULL value
+                accumulator.add(row[column] if column is not None else True)
+
+        names = [aggregate.name for aggregate in self.aggregates]
+        for key, accumulators in groups.items():
+            result = dict(zip(group_by, key))
+            for name, accumulator in zip(names, accumulators):
+                result[name] = accumulator.result()
+            yield result
+
+    def materialized_rows(self, stats):
+        # One set of accumulators per group
+        return stats[self].rows_out
+
+    def __str__(self, level=0):
+        return f"HashAggregatePlan(\n{indent(level)}group_by={self.group_by},\n{indent(level)}aggregates={self.aggregates},\n{indent(level)}source={self.source.__str__(level + 1)}\n{indent(level - 1)})"
+
+
+class TableCount(PlanNode):
+    """COUNT(*) of a whole table answered from the row counts kept by DataManager, without scanning it"""
+
+    explain_attributes = ('table',)
+
+    def __init__(self, table, names):
+        super().__init__()
+        self.table = table
+        self.names = names  # result columns, all of them COUNT(*)
+        self.snapshot = None
+
+    def set_snapshot(self, snapshot):
+        self.snapshot = snapshot
+
+    def execute(self):
+        return list(self.iterate())
+
+    def iterate(self):
+        if self.snapshot is None:
+            data_manager.lock_manager.acquire(self.table, SHARED)
+        count = data_manager.count_rows(self.table, self.snapshot)
+        yield {name: count for name in self.names}
+
+    def __str__(self, level=0):
+        return f"TableCountPlan('{self.table}')"
@@ -1,14 +1,55 @@
 from DataManager import data_manager
 from Exceptions import IntegrityError
+from LockManager import SHARED, EXCLUSIVE
+from Metrics import check_scans
 
 
 class PlanNode:
+    # Attributes shown by EXPLAIN next to the node name
+    explain_attributes = ()
+
     def __init__(self):
         pass
 
     def execute(self):
         raise NotImplementedError()
 
+    def iterate(self):
+        """Lazily yields the result rows, nodes able to stream their output override it"""
+        yield from self.execute()
+
+    def children(self):
+        return [node for node in (getattr(self, name, None) for name in ('source', 'left', 'right')) if isinstance(node, PlanNode)]
+
+    def set_snapshot(self, snapshot):
+        """Makes the table scans below this node read an MVCC snapshot (None reads the live tables)"""
+        for child in self.children():
+            child.set_snapshot(snapshot)
+
+    def describe(self):
+        """One line description of the node for EXPLAIN"""
+        details = ', '.join(f"{name}={getattr(self, name)}" for name in self.explain_attributes
+                            if getattr(self, name) not in (None, [], ()))
+        return f"{type(self).__name__}({details})"
+
+    def materialized_rows(self, stats):
+        """Number of rows the node holds in memory at once, from the stats of an EXPLAIN ANALYZE run.
+           Streaming nodes hold none"""
+        return 0
+
+    def _lock_for_write(self, table_name):
+        """Locks a table for writing, tables linked to it by foreign keys are locked for reading as their
+           rows are looked up by the constraint checks"""
+        lock_manager = data_manager.lock_manager
+        lock_manager.acquire(table_name, EXCLUSIVE)
+        for fk in data_manager.foreign_key_manager.foreign_keys:
+            referencing_table = fk.referencing_column.split('.')[0]
+            referenced_table = fk.referenced_column.split('.')[0]
+            if referencing_table == table_name:
+                lock_manager.acquire(referenced_table, SHARED)
+            elif referenced_table == table_name:
+                lock_manager.acquire(referencing_table, SHARED)
+
     def _validate_foreign_key(self, constraint, value):
         referenced_col = constraint.arg1
         ref_table, ref_col = referenced_col.split(".")
@@ -18,9 +59,17 @@ class PlanNode:
         #     return todo
 
         found = False
+        check_scans.foreign_key += 1
         for row in data_manager.get_tables_data(ref_table):
             if row.get(referenced_col) == value:
                 found = True
 
         if not found:
             raise IntegrityError(f"Violation of FOREIGN KEY constraint: no matching value in {referenced_col} for {value}")
+
+    def _get_referenced_values(self, constraint):
+        """Returns the set of values present in the column referenced by a foreign key constraint"""
+        referenced_col = constraint.arg1
+        ref_table, ref_col = referenced_col.split(".")
+        check_scans.foreign_key += 1
+        return {row.get(referenced_col) for row in data_manager.get_tables_data(ref_table)}
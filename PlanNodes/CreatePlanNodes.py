@@ -12,6 +12,7 @@ class CreateTable(PlanNode):
         col_types = {col[0]: col[1] for col in self.columns}
         col_constraints = {col[0]: col[2] for col in self.columns}
 
+        self._lock_for_write(self.name)
         data_manager.add_table(self.name)
         data_manager.add_column_types(self.name, col_types)
         data_manager.add_column_constraints(self.name, col_constraints)
@@ -1,9 +1,12 @@
+import ReferentialActions
 from DataManager import data_manager
-from Exceptions import ExecutingError
 from PlanNodes.BasePlanNode import PlanNode
+from utility import indent
 
 
 class Delete(PlanNode):
+    explain_attributes = ('table_name',)
+
     def __init__(self, source, table, where_expr):
         super().__init__()
         self.source = source
@@ -11,25 +14,21 @@ class Delete(PlanNode):
         self.where_expr = where_expr
 
     def execute(self):
+        """
+        Deletes the rows of the source as a set: the referential actions of the foreign keys referencing them
+        are propagated with one anti-join per foreign key (see ReferentialActions) and every table is rebuilt in
+        one pass. Deleting every row (no WHERE clause, TRUNCATE) swaps in an empty table.
+        """
+        self._lock_for_write(self.table_name)
         rows = self.source.execute()
-        deleted_rows = []
-
-        for row in rows:
-            for column, value in row.items():
-                referencing_fks = data_manager.foreign_key_manager.get_foreign_keys_referencing(column)
-                for fk in referencing_fks:
-                    ref_col_full = fk.referencing_column
-                    ref_table, ref_col = ref_col_full.split(".")
-                    referencing_rows = data_manager.get_tables_data(ref_table)
-                    for r in referencing_rows:
-                        if r.get(ref_col_full) == value:
-                            raise ExecutingError(f"Cannot delete row {row}: it is referenced by {r}")
-
-            deleted_rows.append(row)
-
-        # Actually remove the rows
-        table_data = data_manager.get_tables_data(self.table_name)
-        for row in deleted_rows:
-            table_data.remove(row)
+        if not rows:
+            return []
+        # The source may be the table itself, it's replaced, not changed
+        deleted_rows = list(rows) if rows is data_manager.get_tables_data(self.table_name) else rows
 
+        changes = ReferentialActions.propagate(self.table_name, deleted_rows=deleted_rows)
+        ReferentialActions.apply(changes)
         return deleted_rows
+
+    def __str__(self, level=0):
+        return f"DeletePlan(\n{indent(level)}table='{self.table_name}',\n{indent(level)}source={self.source.__str__(level + 1)}\n{indent(level - 1)})"
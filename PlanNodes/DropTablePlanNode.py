@@ -8,6 +8,7 @@ class DropTable(PlanNode):
         self.table = table
 
     def execute(self):
+        self._lock_for_write(self.table)
         data_manager.drop_table(self.table)
 
     def __str__(self):
@@ -0,0 +1,157 @@
+from time import perf_counter
+
+from PlanNodes.BasePlanNode import PlanNode
+from PlanNodes.SelectPlanNodes import Filter
+
+"""
+EXPLAIN prints the plan tree, one node per line, children indented below their parent.
+
+EXPLAIN ANALYZE executes the statement with every node instrumented and annotates the nodes with:
+    time      wall time spent in the node and the nodes below it (ms)
+    self      time spent in the node itself (ms)
+    rows_in   rows received from the children
+    rows_out  rows produced by the node
+    peak      rows held in memory at once by a materializing node (Sort, HashAggregate, joins)
+    evals     predicate evaluations of a filter
+
+Nodes are instrumented by wrapping execute() and iterate() of the plan node instances, the wrappers are
+removed afterwards, so the plan can run normally again.
+"""
+
+EXPLAIN_COLUMNS = ['QUERY PLAN']
+
+
+class NodeStats:
+    __slots__ = ('time', 'rows_out', 'evaluations', 'active')
+
+    def __init__(self):
+        self.time = 0.0
+        self.rows_out = 0
+        self.evaluations = 0  # predicate evaluations, None for nodes without a predicate
+        self.active = 0  # > 0 while the node runs, a node calling its own execute() or iterate() isn't counted twice
+
+
+class Explain(PlanNode):
+    def __init__(self, source, analyze, is_query):
+        super().__init__()
+        self.source = source  # plan of the explained statement
+        self.analyze = analyze
+        self.is_query = is_query  # SELECTs are run by draining iterate(), other statements by execute()
+
+    def execute(self):
+        if not self.analyze:
+            return self._rows(self._render(self.source))
+
+        stats = {}
+        instrumented = []
+        self._instrument(self.source, stats, instrumented)
+        start = perf_counter()
+        try:
+            if self.is_query:
+                for _ in self.source.iterate():
+                    pass
+            else:
+                self.source.execute()
+        finally:
+            total = perf_counter() - start
+            for obj, attribute in instrumented:
+                del obj.__dict__[attribute]
+
+        lines = self._render(self.source, stats)
+        lines.append(f"Execution time: {total * 1000:.3f} ms")
+        return self._rows(lines)
+
+    def _rows(self, lines):
+        return [{EXPLAIN_COLUMNS[0]: line} for line in lines]
+
+    def _instrument(self, node, stats, instrumented):
+        node_stats = stats[node] = NodeStats()
+        node.execute = self._timed_execute(node.execute, node_stats)
+        node.iterate = self._timed_iterate(node.iterate, node_stats)
+        instrumented += [(node, 'execute'), (node, 'iterate')]
+
+        if isinstance(node, Filter):
+            condition = node.condition
+            condition.execute = self._counted_predicate(condition.execute, node_stats)
+            instrumented.append((condition, 'execute'))
+        else:
+            node_stats.evaluations = None
+
+        for child in node.children():
+            self._instrument(child, stats, instrumented)
+
+    @staticmethod
+    def _timed_execute(execute, stats):
+        def timed_execute(*args):
+            if stats.active:
+                return execute(*args)
+            stats.active += 1
+            start = perf_counter()
+            try:
+                result = execute(*args)
+            finally:
+                stats.time += perf_counter() - start
+                stats.active -= 1
+            if isinstance(result, list):
+                stats.rows_out += len(result)
+            return result
+        return timed_execute
+
+    @staticmethod
+    def _timed_iterate(iterate, stats):
+        def timed_iterate():
+            if stats.active:
+                yield from iterate()
+                return
+            rows = iterate()
+            while True:
+                # Only the time spent producing rows is counted, not the time the consumer keeps a row
+                stats.active += 1
+                start = perf_counter()
+                try:
+                    row = next(rows)
+                except StopIteration:
+                    return
+                finally:
+                    stats.time += perf_counter() - start
+                    stats.active -= 1
+                stats.rows_out += 1
+                yield row
+        return timed_iterate
+
+    @staticmethod
+    def _counted_predicate(predicate, stats):
+        def counted_predicate(row):
+            stats.evaluations += 1
+            return predicate(row)
+        return counted_predicate
+
+    def _render(self, node, stats=None, depth=0, lines=None):
+        if lines is None:
+            lines = []
+        prefix = '  ' * depth + ('-> ' if depth else '')
+        line = prefix + node.describe()
+        children = node.children()
+
+        if stats is not None:
+            node_stats = stats[node]
+            rows_in = sum(stats[child].rows_out for child in children)
+            self_time = node_stats.time - sum(stats[child].time for child in children)
+            details = [f"time={node_stats.time * 1000:.3f} ms", f"self={self_time * 1000:.3f} ms"]
+            if children:
+                details.append(f"rows_in={rows_in}")
+            details.append(f"rows_out={node_stats.rows_out}")
+            peak = node.materialized_rows(stats)
+            if peak:
+                details.append(f"peak={peak}")
+            if node_stats.evaluations is not None:
+                details.append(f"evals={node_stats.evaluations}")
+            line += f"  ({', '.join(details)})"
+
+        lines.append(line)
+        for child in children:
+            self._render(child, stats, depth + 1, lines)
+        return lines
+
+    def __str__(self, level=0):
+        return f"ExplainPlan(analyze={self.analyze}, source={self.source.__str__(level + 1)})"
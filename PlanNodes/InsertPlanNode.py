@@ -1,9 +1,16 @@
+import ReferentialActions
 from DataManager import data_manager
-from Exceptions import ExecutingError
+from Exceptions import ExecutingError, IntegrityError
+from Metrics import check_scans
 from PlanNodes.BasePlanNode import PlanNode
+from StatementGuard import checked_chunks
+from TokenTypes import Identifier
+from utility import indent
 
 
 class Insert(PlanNode):
+    explain_attributes = ('table_name', 'columns', 'values')
+
     def __init__(self, table_name, columns, values):
         super().__init__()
         self.table_name = table_name
@@ -11,45 +18,193 @@ class Insert(PlanNode):
         self.columns = columns
 
     def execute(self):
-        # Build row as dictionary {col_name: value}
-        row = {}
-        table_data = data_manager.get_tables_data(self.table_name)
-        all_columns = data_manager.get_columns_for_table(self.table_name)
+        return self.execute_batch([self.row_values()])
+
+    def row_values(self):
+        """Values of this statement's row for execute_batch(), the literals are re-bound on every run of a cached plan"""
+        return [literal.value for literal in self.values]
+
+    def execute_batch(self, rows_values):
+        """
+        Inserts rows given as lists of values for self.columns.
+        Uniqueness and foreign keys are checked against hash sets built once for the whole batch,
+        nothing is inserted if any of the rows violates a constraint.
+        Inside a transaction the checks are deferred to COMMIT.
+        """
+        self._lock_for_write(self.table_name)
+        defaults = self._defaults()
+        rows = []
+        for values in rows_values:
+            row = dict(zip(self.columns, values))
+            row.update(defaults)
+            rows.append(row)
+        return self._insert_rows(rows, self.columns)
 
+    def _defaults(self):
+        """Default values of the columns missing from self.columns"""
         table_constraints = data_manager.get_constraint_for_table(self.table_name)
+        defaults = {}
+        for col in data_manager.get_columns_for_table(self.table_name):
+            if col not in self.columns:
+                default_value = None
+                for constraint in table_constraints[col]:
+                    if constraint.type == 'DEFAULT':
+                        default_value = constraint.arg1.value
+                defaults[col] = default_value
+        return defaults
 
-        for col_name, value in zip(self.columns, self.values):
-            value = value.value
+    def _insert_rows(self, rows, columns):
+        """Checks complete rows and inserts them: uniqueness of every column (NULLs never collide, like at
+           COMMIT and in Update) and foreign keys of the given `columns`"""
+        table_data = data_manager.get_tables_data(self.table_name)
+        table_constraints = data_manager.get_constraint_for_table(self.table_name)
 
+        # (column, constraint, set of values) checks in the same order as the constraints are declared
+        unique_checks = []
+        foreign_key_checks = []
+        # Inside a transaction constraints are checked at COMMIT
+        checked_columns = data_manager.get_columns_for_table(self.table_name) if not data_manager.in_transaction() else []
+        for col_name in checked_columns:
             for constraint in table_constraints[col_name]:
-                # check if inserted value is unique
+                # inserted values must be unique, default values included
                 if constraint.type in ['PRIMARY KEY', 'UNIQUE']:
-                    if self._check_if_unique(table_data, col_name, value):
-                        raise ExecutingError(f"Violation of {constraint} constraint on column {col_name}, it must be unique.")
+                    check_scans.unique += 1
+                    unique_checks.append((col_name, constraint, {row.get(col_name) for row in table_data}))
 
-                if constraint.type == 'FOREIGN KEY':
-                    self._validate_foreign_key(constraint, value)
+                if constraint.type == 'FOREIGN KEY' and data_manager.enforce_foreign_keys and col_name in columns:
+                    foreign_key_checks.append((col_name, constraint, self._get_referenced_values(constraint)))
 
-            row[col_name] = value
+        for row in rows:
+            for col_name, constraint, used_values in unique_checks:
+                if row[col_name] is not None and row[col_name] in used_values:
+                    raise IntegrityError(f"Violation of {constraint} constraint on column {col_name}, it must be unique.")
 
-        # Fill in missing columns with None
-        for col in all_columns:
-            if col not in row:
-                # finding default value if constraint exists
-                default_value = None
-                for constraint in table_constraints[col]:
-                    if constraint.type == 'DEFAULT':
-                        default_value = constraint.arg1.value
-                row[col] = default_value
+            for col_name, constraint, referenced_values in foreign_key_checks:
+                if row[col_name] not in referenced_values:
+                    raise IntegrityError(f"Violation of FOREIGN KEY constraint: no matching value in {constraint.arg1} for {row[col_name]}")
+
+            # Later rows of the batch see this one
+            for col_name, _, used_values in unique_checks:
+                used_values.add(row[col_name])
+            for _, constraint, referenced_values in foreign_key_checks:
+                if constraint.arg1 in row:  # self referencing foreign key
+                    referenced_values.add(row[constraint.arg1])
 
         # No violations, safe to insert
-        data_manager.insert_row(self.table_name, row)
+        data_manager.check_memory_budget(self.table_name, rows)
+        for row in rows:
+            data_manager.insert_row(self.table_name, row)
+        return rows
+
+    def __str__(self, level=0):
+        return f"InsertPlan(\n{indent(level)}table='{self.table_name}',\n{indent(level)}columns={self.columns},\n{indent(level)}values={self.values}\n{indent(level - 1)})"
+
+
+class Upsert(Insert):
+    """INSERT ... ON CONFLICT (conflict_column) DO NOTHING | DO UPDATE SET assignments"""
+    explain_attributes = ('table_name', 'columns', 'values', 'conflict_column', 'action', 'assignments')
 
-    def _check_if_unique(self, table, column, value):
+    def __init__(self, table_name, columns, values, conflict_column, action, assignments):
+        super().__init__(table_name, columns, values)
+        self.conflict_column = conflict_column
+        self.action = action  # 'NOTHING' or 'UPDATE'
+        self.assignments = assignments  # list of (column, Literal or EXCLUDED Identifier)
+
+    def row_values(self):
+        """Values of the row followed by the values of the literal assignments"""
+        return super().row_values() + [value.value for _, value in self.assignments if not isinstance(value, Identifier)]
+
+    def execute_batch(self, rows_values):
         """
-        Check if `value` is unique across the table.
+        Inserts rows given as the lists of row_values(). A row whose conflict column holds the value of an
+        existing row, or of an earlier row of the batch, updates that row instead (DO UPDATE) or is skipped
+        (DO NOTHING). Conflicts are looked up in a hash map of the conflict column built with one pass over
+        the table, the updates are checked and applied as one set like UPDATE, then the other rows are inserted.
         """
-        for existing_row in table:
-            if existing_row.get(column) == value:
-                return True
-        return False
+        self._lock_for_write(self.table_name)
+        table = data_manager.get_tables_data(self.table_name)
+        conflict_column = self.conflict_column
+        defaults = self._defaults()
+        width = len(self.columns)
+
+        check_scans.unique += 1
+        existing = {row.get(conflict_column): row for row in table}  # conflict key -> row
+        existing.pop(None, None)
+        batch_keys = {}  # conflict key -> row inserted by the batch
+        new_rows = []
+        updated = {}  # id(existing row) -> (existing row, new row)
+
+        for chunk in checked_chunks(rows_values):
+            for values in chunk:
+                row = dict(zip(self.columns, values))
+                row.update(defaults)
+                key = row[conflict_column]
+                target = batch_keys.get(key)
+                if target is None:
+                    target = existing.get(key)
+                    if target is None:
+                        new_rows.append(row)
+                        if key is not None:
+                            batch_keys[key] = row
+                        continue
+                if self.action == 'NOTHING':
+                    continue
+
+                literal_values = iter(values[width:])
+                assignments = {column: row[value.value] if isinstance(value, Identifier) else next(literal_values)
+                               for column, value in self.assignments}
+                if target is batch_keys.get(key):
+                    target.update(assignments)
+                    keys = batch_keys
+                else:
+                    entry = updated.get(id(target))
+                    if entry is None:
+                        entry = updated[id(target)] = (target, target.copy())
+                    entry[1].update(assignments)
+                    keys = existing
+                    target = entry[1]
+                # The conflict column may be assigned too
+                if target[conflict_column] != key:
+                    keys[target[conflict_column]] = keys.pop(key)
+
+        updated_rows = list(updated.values())
+        if updated_rows:
+            if not data_manager.in_transaction():
+                self._check_updates(updated_rows, table)
+            ReferentialActions.apply(ReferentialActions.propagate(self.table_name, updated_rows=updated_rows))
+
+        assigned_columns = [column for column, _ in self.assignments if column not in self.columns]
+        return [new_row for _, new_row in updated_rows] + self._insert_rows(new_rows, self.columns + assigned_columns)
+
+    def _check_updates(self, updated_rows, table):
+        """Constraints of the assigned columns in the new rows of conflicting rows"""
+        constraints = data_manager.get_constraint_for_table(self.table_name)
+        updated_ids = {id(row) for row, _ in updated_rows}
+        for column in dict.fromkeys(column for column, _ in self.assignments):
+            new_values = [new_row[column] for _, new_row in updated_rows]
+            for constraint in constraints[column]:
+                if constraint.type in ('NOT NULL', 'PRIMARY KEY') and None in new_values:
+                    raise IntegrityError(f"Column '{column}' cannot be NULL")
+
+                # The new values must be unique among themselves and among the rows left unchanged,
+                # NULLs never collide, like in Update and Insert
+                if constraint.type in ('PRIMARY KEY', 'UNIQUE'):
+                    check_scans.unique += 1
+                    values = [value for value in new_values if value is not None]
+                    used_values = {row.get(column) for row in table if id(row) not in updated_ids}
+                    if len(set(values)) < len(values) or not used_values.isdisjoint(values):
+                        raise IntegrityError(f"Update violates {constraint.type} constraint on column {column}")
+
+                # The new values must exist in the referenced column
+                if constraint.type == 'FOREIGN KEY' and data_manager.enforce_foreign_keys:
+                    referenced_values = self._get_referenced_values(constraint)
+                    if constraint.arg1.split('.')[0] == self.table_name:  # self referencing foreign key
+                        referenced_values = referenced_values | {new_row.get(constraint.arg1) for _, new_row in updated_rows}
+                    for value in new_values:
+                        if value is not None and value not in referenced_values:
+                            raise IntegrityError(f"Violation of FOREIGN KEY constraint: no matching value in {constraint.arg1} for {value}")
+
+    def __str__(self, level=0):
+        return (f"UpsertPlan(\n{indent(level)}table='{self.table_name}',\n{indent(level)}columns={self.columns},\n"
+                f"{indent(level)}values={self.values},\n{indent(level)}on_conflict={self.conflict_column},\n"
+                f"{indent(level)}action={self.action},\n{indent(level)}assignments={self.assignments}\n{indent(level - 1)})")
@@ -0,0 +1,141 @@
+from bisect import bisect_left, bisect_right
+from operator import itemgetter
+
+from PlanNodes.BasePlanNode import PlanNode
+from StatementGuard import current, checked_chunks, CHECK_INTERVAL
+from utility import indent
+
+"""
+Joins planned for SELECTs over several tables (see ExecutionPlanner.plan_joins), neither of them holds
+the product of its inputs:
+
+SortMergeJoin joins on a comparison of a left and a right column (=, <, <=, > or >=). The right side is
+sorted by its key once, the matches of a left row are a contiguous run of it found by binary search,
+so the left side streams in any order and only the right side is held in memory.
+
+BlockNestedLoopJoin joins tables without such a comparison. The left side streams in blocks of
+block_size rows and the right side is scanned again for every block instead of being held in memory.
+Tables live in memory already, so scanning one again is what reading a spilled side back would be.
+"""
+
+BLOCK_SIZE = 1024
+
+
+class SortMergeJoin(PlanNode):
+    def __init__(self, left, right, left_key, operator, right_key, condition):
+        super().__init__()
+        self.left = left
+        self.right = right
+        self.left_key = left_key  # column of the left side
+        self.operator = operator  # '=', '<', '<=', '>' or '>=', left_key <operator> right_key
+        self.right_key = right_key
+        self.condition = condition  # the comparison as an Operator of the WHERE clause
+
+    def execute(self):
+        return list(self.iterate())
+
+    def iterate(self):
+        guard = current.guard
+        right_key = self.right_key
+        # NULL never compares true, rows with a NULL key have no matches
+        right_rows = [row for row in self.right.iterate() if row.get(right_key) is not None]
+        guard.add_rows(len(right_rows))
+        try:
+            right_rows.sort(key=itemgetter(right_key))
+        except TypeError:
+            # Keys of different types can't be ordered, pairs are compared one by one like the WHERE clause would
+            keys = None
+        else:
+            keys = [row[right_key] for row in right_rows]
+
+        produced = 0
+        for chunk in checked_chunks(self.left.iterate()):
+            for left_row in chunk:
+                key = left_row.get(self.left_key)
+                if key is None:
+                    continue
+                span = self._matches(keys, key)
+                if span is None:
+                    for compared, right_row in enumerate(right_rows, 1):
+                        row = {**left_row, **right_row}
+                        if self.condition.execute(row):
+                            produced += 1
+                            yield row
+                        if not compared % CHECK_INTERVAL:
+                            guard.add_rows(produced)
+                            produced = 0
+                    continue
+                # Rows are charged to the guard before they are produced, CHECK_INTERVAL at most at a time
+                start, end = span
+                for begin in range(start, end, CHECK_INTERVAL):
+                    stop = min(begin + CHECK_INTERVAL, end)
+                    produced += stop - begin
+                    if produced >= CHECK_INTERVAL:
+                        guard.add_rows(produced)
+                        produced = 0
+                    for position in range(begin, stop):
+                        yield {**left_row, **right_rows[position]}
+
+    def _matches(self, keys, key):
+        """Range of positions of the sorted right rows matching a left key,
+           None if the keys can't be compared by ordering (keys of different types)"""
+        if keys is None:
+            return None
+        try:
+            if self.operator == '=':
+                return bisect_left(keys, key), bisect_right(keys, key)
+            if self.operator == '<':
+                return bisect_right(keys, key), len(keys)
+            if self.operator == '<=':
+                return bisect_left(keys, key), len(keys)
+            if self.operator == '>':
+                return 0, bisect_left(keys, key)
+            return 0, bisect_right(keys, key)
+        except TypeError:
+            return None
+
+    def describe(self):
+        return f"SortMergeJoin({self.left_key} {self.operator} {self.right_key})"
+
+    def materialized_rows(self, stats):
+        return stats[self.right].rows_out
+
+    def __str__(self, level=0):
+        return (f"SortMergeJoinPlan(\n{indent(level)}on={self.left_key} {self.operator} {self.right_key},\n"
+                f"{indent(level)}left={self.left.__str__(level + 1)},\n{indent(level)}right={self.right.__str__(level + 1)}\n{indent(level - 1)})")
+
+
+class BlockNestedLoopJoin(PlanNode):
+    explain_attributes = ('condition', 'block_size')
+
+    def __init__(self, left, right, condition=None, block_size=BLOCK_SIZE):
+        super().__init__()
+        self.left = left
+        self.right = right  # scanned once per block, a TableScan (or a Filter over one) so it's cheap to repeat
+        self.condition = condition  # rows of the product not satisfying it are dropped, None keeps all
+        self.block_size = block_size
+
+    def execute(self):
+        return list(self.iterate())
+
+    def iterate(self):
+        guard = current.guard
+        condition = self.condition
+        for block in checked_chunks(self.left.iterate(), self.block_size):
+            # The guard is checked about every CHECK_INTERVAL combined rows
+            for right_rows in checked_chunks(self.right.iterate(), max(1, CHECK_INTERVAL // len(block))):
+                produced = 0
+                for right_row in right_rows:
+                    for left_row in block:
+                        row = {**left_row, **right_row}
+                        if condition is None or condition.execute(row):
+                            produced += 1
+                            yield row
+                guard.add_rows(produced)
+
+    def materialized_rows(self, stats):
+        return min(self.block_size, stats[self.left].rows_out)
+
+    def __str__(self, level=0):
+        return (f"BlockNestedLoopJoinPlan(\n{indent(level)}condition={self.condition},\n"
+                f"{indent(level)}left={self.left.__str__(level + 1)},\n{indent(level)}right={self.right.__str__(level + 1)}\n{indent(level - 1)})")
@@ -0,0 +1,137 @@
+import heapq
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from DataManager import data_manager
+from LockManager import SHARED
+from Metrics import scanned_rows
+from PlanNodes.BasePlanNode import PlanNode
+from PlanNodes.SelectPlanNodes import OrderKey
+from StatementGuard import current, checked_chunks
+from utility import indent
+
+"""
+Parallel execution of the TableScan -> Filter -> Project (-> Sort) fragment of single table SELECTs.
+
+The rows of the table are split into contiguous partitions, every partition is filtered and projected
+(and sorted when the query has an ORDER BY) by a worker. Results are merged in partition order, so the
+output has the same order as the serial plan, sorted partitions are merged with heapq.merge.
+Tables smaller than `threshold` rows are processed serially, shipping the rows to workers would cost more.
+
+Workers are processes, or threads on free-threaded CPython builds where threads run in parallel.
+The statement's guard is checked while the workers run and over the merged rows, partitions still
+pending are canceled when it raises. Like Sort, sorted partitions count towards the intermediate rows.
+"""
+
+GUARD_POLL = 0.05  # seconds between checks of the guard while waiting for a worker
+_executors = {}
+
+
+def free_threaded():
+    is_gil_enabled = getattr(sys, '_is_gil_enabled', None)
+    return is_gil_enabled is not None and not is_gil_enabled()
+
+
+def get_executor(kind, workers):
+    """Returns a shared pool, pools are created on first use and reused by all plans"""
+    if kind == 'auto':
+        kind = 'thread' if free_threaded() else 'process'
+    key = (kind, workers)
+    executor = _executors.get(key)
+    if executor is None:
+        pool_class = ThreadPoolExecutor if kind == 'thread' else ProcessPoolExecutor
+        executor = _executors[key] = pool_class(max_workers=workers)
+    return executor
+
+
+def run_fragment(rows, condition, columns, order_key=None):
+    """Filters and projects rows, runs in the workers"""
+    result = []
+    for row in rows:
+        if condition is None or condition.execute(row):
+            result.append({col: row[col] for col in columns})
+    if order_key is not None:
+        result.sort(key=order_key)
+    return result
+
+
+class ParallelScan(PlanNode):
+    explain_attributes = ('table', 'condition', 'columns', 'order_by', 'workers')
+
+    def __init__(self, table, condition, columns, order_by=None, workers=None, threshold=50000, executor='auto'):
+        super().__init__()
+        self.table = table
+        self.condition = condition
+        self.columns = columns
+        self.order_by = order_by
+        self.workers = workers or os.cpu_count() or 1
+        self.threshold = threshold
+        self.executor = executor  # 'process', 'thread' or 'auto'
+        self.snapshot = None
+
+    def set_snapshot(self, snapshot):
+        self.snapshot = snapshot
+
+    def execute(self):
+        return list(self.iterate())
+
+    def iterate(self):
+        guard = current.guard
+        rows = self._read_rows()
+        order_key = OrderKey(self.order_by) if self.order_by else None
+
+        if len(rows) < self.threshold or self.workers < 2:
+            if order_key is None:
+                for chunk in checked_chunks(rows):
+                    yield from run_fragment(chunk, self.condition, self.columns)
+                return
+            result = []
+            for chunk in checked_chunks(rows):
+                result.extend(run_fragment(chunk, self.condition, self.columns))
+            guard.add_rows(len(result))
+            result.sort(key=order_key)
+            yield from result
+            return
+
+        executor = get_executor(self.executor, self.workers)
+        partition_size = -(-len(rows) // (self.workers * 2))
+        futures = [executor.submit(run_fragment, rows[start:start + partition_size], self.condition, self.columns, order_key)
+                   for start in range(0, len(rows), partition_size)]
+        try:
+            if order_key is None:
+                for future in futures:
+                    for chunk in checked_chunks(self._result(future, guard)):
+                        yield from chunk
+            else:
+                results = [self._result(future, guard) for future in futures]
+                guard.add_rows(sum(len(result) for result in results))
+                for chunk in checked_chunks(heapq.merge(*results, key=order_key)):
+                    yield from chunk
+        finally:
+            for future in futures:
+                future.cancel()
+
+    @staticmethod
+    def _result(future, guard):
+        """Waits for the rows of a partition, checking the guard while the worker runs"""
+        while True:
+            guard.check()
+            try:
+                return future.result(timeout=GUARD_POLL)
+            except FutureTimeoutError:
+                pass
+
+    def _read_rows(self):
+        """Returns a list of the rows the query reads, it is not modified while the workers run"""
+        if self.snapshot is not None:
+            return list(data_manager.get_snapshot_rows(self.table, self.snapshot))
+        data_manager.lock_manager.acquire(self.table, SHARED)
+        rows = list(data_manager.get_tables_data(self.table))
+        scanned_rows.count += len(rows)
+        return rows
+
+    def __str__(self, level=0):
+        return (f"ParallelScanPlan(\n{indent(level)}table='{self.table}',\n{indent(level)}condition={self.condition},\n"
+                f"{indent(level)}projection={self.columns},\n{indent(level)}keys={self.order_by},\n"
+                f"{indent(level)}workers={self.workers}, threshold={self.threshold}\n{indent(level - 1)})")
@@ -1,114 +1,143 @@
 from DataManager import data_manager
+from LockManager import SHARED
+from Metrics import scanned_rows
 from PlanNodes.BasePlanNode import PlanNode
+from StatementGuard import current, checked_chunks, CHECK_INTERVAL
 from utility import indent
 
 
 class TableScan(PlanNode):
+    explain_attributes = ('table',)
+
     def __init__(self, table):
         super().__init__()
         self.table = table
+        self.snapshot = None
 
     def execute(self):
-        return data_manager.get_tables_data(self.table)
+        if self.snapshot is not None:
+            return list(self.iterate())
+        data_manager.lock_manager.acquire(self.table, SHARED)
+        rows = data_manager.get_tables_data(self.table)
+        scanned_rows.count += len(rows)
+        return rows
 
-    def __str__(self, level=0):
-        return f"TableScan('{self.table}')"
+    def iterate(self):
+        if self.snapshot is not None:
+            # Snapshots don't need any locks
+            yield from data_manager.get_snapshot_rows(self.table, self.snapshot)
+        else:
+            # Rows are read from the live table, not from a copy
+            data_manager.lock_manager.acquire(self.table, SHARED)
+            rows = data_manager.get_tables_data(self.table)
+            scanned_rows.count += len(rows)
+            yield from rows
 
+    def set_snapshot(self, snapshot):
+        self.snapshot = snapshot
 
-class Filter(PlanNode):
-    def __init__(self, source, condition):
-        super().__init__()
-        self.source = source
-        self.condition = condition
+    def __str__(self, level=0):
+        return f"TableScan('{self.table}')"
 
-    def execute(self):
-        filtered_rows = []
-        for row in self.source.execute():
-            # print(row)
-            # print(self.condition)
-            if self.condition.execute(row):
-                filtered_rows.append(row)
-        return filtered_rows
 
-    def __str__(self, level=0):
-        return f"FilterPlan(\n{indent(level)}condition={self.condition},\n{indent(level)}source={self.source.__str__(level + 1)}\n{indent(level - 1)})"
+class RowsScan(PlanNode):
+    """Scan of rows gathered from elsewhere (e.g. shards) standing in for a table"""
 
+    explain_attributes = ('table',)
 
-class Visualize(PlanNode):
-    def __init__(self, source):
+    def __init__(self, table, rows):
         super().__init__()
-        self.headers = None
-        self.data = None
-        self.source = source
+        self.table = table
+        self.rows = rows
 
     def execute(self):
-        self.data = self.source.execute()
-        if self.data:
-            self.headers = list(self.data[0].keys())
-        else:
-            self.headers = []
-        self.visualize_table()
-        return self.data
+        return self.rows
+
+    def iterate(self):
+        yield from self.rows
 
     def __str__(self, level=0):
-        return f"Visualize(\n{indent(level)}source={self.source.__str__(level + 1)}\n{indent(level - 1)})"
+        return f"RowsScan('{self.table}', rows={len(self.rows)})"
 
-    def visualize_table(self):
-        """
-        Displays the table data in a readable tabular format.
-        """
-        if not self.data:
-            print("\nNo data to display.")
-            return
 
-        headers = self.headers
-        rows = [[row[h] for h in headers] for row in self.data]
+class Filter(PlanNode):
+    explain_attributes = ('condition',)
 
-        # Determine column widths
-        col_widths = [len(h) for h in headers]
-        for row in rows:
-            for i, val in enumerate(row):
-                col_widths[i] = max(col_widths[i], len(str(val)))
+    def __init__(self, source, condition):
+        super().__init__()
+        self.source = source
+        self.condition = condition
 
-        def divider():
-            return '+' + '+'.join(['-' * (w + 2) for w in col_widths]) + '+'
+    def execute(self):
+        return list(self.iterate())
 
-        def format_row(row_data):
-            return '| ' + ' | '.join(f"{str(row_data[i]).ljust(col_widths[i])}" for i in range(len(row_data))) + ' |'
+    def iterate(self):
+        for chunk in checked_chunks(self.source.iterate()):
+            for row in chunk:
+                if self.condition.execute(row):
+                    yield row
 
-        print(f"\nResult: ")
-        print(divider())
-        print(format_row(headers))
-        print(divider())
-        for row in rows:
-            print(format_row(row))
-        print(divider())
+    def __str__(self, level=0):
+        return f"FilterPlan(\n{indent(level)}condition={self.condition},\n{indent(level)}source={self.source.__str__(level + 1)}\n{indent(level - 1)})"
 
 
 class Project(PlanNode):
     """This plan filters each row from unneeded columns"""
 
+    explain_attributes = ('columns',)
+
     def __init__(self, source, columns):
         super().__init__()
         self.source = source
         self.columns = columns
 
     def execute(self):
-        input_rows = self.source.execute()
-        projected_rows = []
-        for row in input_rows:
-            new_row = {}
-            for col in self.columns:
-                new_row[col] = row[col]
-            projected_rows.append(new_row)
+        return list(self.iterate())
 
-        return projected_rows
+    def iterate(self):
+        for chunk in checked_chunks(self.source.iterate()):
+            for row in chunk:
+                new_row = {}
+                for col in self.columns:
+                    new_row[col] = row[col]
+                yield new_row
 
     def __str__(self, level=0):
         return f"SelectPlan(\n{indent(level)}projection={self.columns},\n{indent(level)}source={self.source.__str__(level + 1)}\n{indent(level - 1)})"
 
 
+class OrderKey:
+    """Sort key of a row for an ORDER BY list, a class so it can be pickled for parallel workers"""
+
+    def __init__(self, order_by):
+        self.order_by = [(column, direction.upper() == 'DESC') for column, direction in order_by]
+
+    def __call__(self, row):
+        key = []
+        for column, reverse in self.order_by:
+            value = row.get(column)
+            # Put None at the end for ASC, at the start for DESC
+            key.append((value is None, value) if not reverse else (value is not None, Descending(value)))
+        return tuple(key)
+
+
+class Descending:
+    """Sort key part ordering its value in reverse, so ASC and DESC columns can be mixed in one key"""
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return self.value is not None and other.value < self.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+
 class Sort(PlanNode):
+    explain_attributes = ('order_by',)
+
     def __init__(self, source, order_by):
         super().__init__()
         self.source = source
@@ -116,18 +145,14 @@ class Sort(PlanNode):
 
     def execute(self):
         rows = self.source.execute()
-
-        for column, direction in reversed(self.order_by):
-            reverse = direction.upper() == 'DESC'
-
-            def sort_key(row):
-                value = row.get(column)
-                # Put None at the end for ASC, at the start for DESC
-                return (value is None, value) if not reverse else (value is not None, value)
-
-            rows.sort(key=sort_key, reverse=False)  # reverse handled in key
+        current.guard.add_rows(len(rows))
+        # One sort by the combined key gives the same order as stable sorts from the last key to the first
+        rows.sort(key=OrderKey(self.order_by))
         return rows
 
+    def materialized_rows(self, stats):
+        return stats[self].rows_out
+
     def __str__(self, level=0):
         return f"SortPlan(\n{indent(level)}keys={self.order_by},\n{indent(level)}source={self.source.__str__(level + 1)}\n{indent(level - 1)})"
 
@@ -140,18 +165,27 @@ class CrossJoin(PlanNode):
 
     def execute(self):
         """This is an extremely naive and naive and dangerous approach. I would have made it better if i had the time"""
+        return list(self.iterate())
 
-        left_data = self.left.execute()
+    def iterate(self):
+        """Streams the left side, only the right side is materialized"""
+        guard = current.guard
         right_data = self.right.execute()
+        guard.add_rows(len(right_data))
 
         # Perform cross join (Cartesian product)
-        result = []
-        for left_row in left_data:
+        produced = 0
+        for left_row in self.left.iterate():
             for right_row in right_data:
                 # Combine the rows from left and right into one row (merged)
-                merged_row = {**left_row, **right_row}
-                result.append(merged_row)
-        return result
+                yield {**left_row, **right_row}
+            produced += len(right_data)
+            if produced >= CHECK_INTERVAL:
+                guard.add_rows(produced)
+                produced = 0
+
+    def materialized_rows(self, stats):
+        return stats[self.right].rows_out
 
     def __str__(self, level=0):
         return f"CrossJoinPlan(\n{indent(level)}left={self.left},\n{indent(level)}right={self.right}\n{indent(level - 1)})"
@@ -0,0 +1,16 @@
+from DataManager import data_manager
+from PlanNodes.BasePlanNode import PlanNode
+
+
+class ShowTableStats(PlanNode):
+    explain_attributes = ('table',)
+
+    def __init__(self, table=None):
+        super().__init__()
+        self.table = table
+
+    def execute(self):
+        return [stats.as_dict() for stats in data_manager.table_stats(self.table)]
+
+    def __str__(self, level=0):
+        return f"ShowTableStatsPlan(table={self.table})"
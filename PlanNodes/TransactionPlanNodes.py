@@ -0,0 +1,26 @@
+from DataManager import data_manager
+from PlanNodes.BasePlanNode import PlanNode
+
+
+class Begin(PlanNode):
+    def execute(self):
+        data_manager.transaction_manager.begin()
+
+    def __str__(self, level=0):
+        return "BeginPlan()"
+
+
+class Commit(PlanNode):
+    def execute(self):
+        data_manager.transaction_manager.commit()
+
+    def __str__(self, level=0):
+        return "CommitPlan()"
+
+
+class Rollback(PlanNode):
+    def execute(self):
+        data_manager.transaction_manager.rollback()
+
+    def __str__(self, level=0):
+        return "RollbackPlan()"
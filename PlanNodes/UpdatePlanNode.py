@@ -1,70 +1,74 @@
+import ReferentialActions
 from DataManager import data_manager
-from Exceptions import ExecutingError
+from Exceptions import ExecutingError, IntegrityError
+from Metrics import check_scans
 from PlanNodes.BasePlanNode import PlanNode
+from StatementGuard import checked_chunks
 from utility import indent
 
 
 class Update(PlanNode):
+    explain_attributes = ('table_name', 'assignments')
+
     def __init__(self, source, assignments, table_name):
         super().__init__()
         self.source = source
-        self.assignments = assignments  # list of (column, new_value)
+        self.assignments = assignments  # list of (column, Literal)
         self.table_name = table_name
 
     def execute(self):
+        """
+        Updates the rows of the source as a set: all new rows are computed first, then every constraint is
+        checked with one hash pass, the referential actions of changed keys are propagated (see
+        ReferentialActions) and the rows are replaced in one pass over every table.
+        Inside a transaction the checks are deferred to COMMIT.
+        """
+        self._lock_for_write(self.table_name)
         rows = self.source.execute()
         table = data_manager.get_tables_data(self.table_name)
-        constraints = data_manager.get_constraint_for_table(self.table_name)
+        assignments = {column: literal.value for column, literal in self.assignments}
 
         updated_rows = []
+        for chunk in checked_chunks(rows):
+            for row in chunk:
+                updated_row = row.copy()
+                updated_row.update(assignments)
+                updated_rows.append(updated_row)
 
-        for row in rows:
-            original_row = row.copy()
-            updated_row = row.copy()
-
-            for column, new_value in self.assignments:
-                old_value = original_row[column]
-
-                # Apply assignments
-                updated_row[column] = new_value
-
-                for constraint in constraints[column]:
-                    # checks uniqueness
-                    if constraint.type in ("PRIMARY KEY", "UNIQUE"):
-                        if self._violates_unique_constraint(column, updated_row, table, updated_rows, original_row):
-                            raise ExecutingError(f"Update violates {constraint.type} constraint on column {column}")
-
-                    # checks if foreign key blocks the update
-                    if constraint.type == "FOREIGN KEY" and column in updated_row:
-                        self._validate_foreign_key(constraint, updated_row[column])
+        if updated_rows and not data_manager.in_transaction():
+            self._check_constraints(rows, updated_rows, assignments, table)
 
-                for fk in data_manager.foreign_key_manager.get_columns_foreign_keys(column):
-                    # Someone else points to this column
-                    ref_table, ref_col = fk.referencing_column.split(".")
-                    referencing_rows = data_manager.get_tables_data(ref_table)
+        changes = ReferentialActions.propagate(self.table_name, updated_rows=list(zip(rows, updated_rows)))
+        ReferentialActions.apply(changes)
+        return updated_rows
 
-                    for r in referencing_rows:
-                        if r.get(column) == old_value:
-                            raise ExecutingError(f"Cannot update '{column}' from {old_value} to {new_value}: it is referenced in '{r}'")
-
-            updated_rows.append(updated_row)
-
-        # Apply updates to the actual table
-        for i, row in enumerate(rows):
-            idx = table.index(row)
-            table[idx] = updated_rows[i]
-
-    def _violates_unique_constraint(self, col, new_row, table, updated_rows, original_row):
-        for existing_row in table:
-            if existing_row == original_row:
-                continue  # skip self
-            if existing_row.get(col) == new_row.get(col):
-                return True
-        for new_updated_row in updated_rows:
-            if new_updated_row.get(col) == new_row.get(col):
-                return True
-
-        return False
+    def _check_constraints(self, rows, updated_rows, assignments, table):
+        constraints = data_manager.get_constraint_for_table(self.table_name)
+        unchanged_rows = None
+
+        def unchanged_values(column):
+            """Values of a column in the rows the statement doesn't update"""
+            nonlocal unchanged_rows
+            if unchanged_rows is None:
+                updated_ids = {id(row) for row in rows}
+                unchanged_rows = [row for row in table if id(row) not in updated_ids]
+            return {row.get(column) for row in unchanged_rows}
+
+        for column, new_value in assignments.items():
+            for constraint in constraints[column]:
+                # The new values must be unique among themselves and among the rows left unchanged, NULLs never collide
+                if constraint.type in ("PRIMARY KEY", "UNIQUE") and new_value is not None:
+                    check_scans.unique += 1
+                    if len(updated_rows) > 1 or new_value in unchanged_values(column):
+                        raise IntegrityError(f"Update violates {constraint.type} constraint on column {column}")
+
+                # The new value must exist in the referenced column
+                if constraint.type == "FOREIGN KEY" and data_manager.enforce_foreign_keys:
+                    referenced_values = self._get_referenced_values(constraint)
+                    if constraint.arg1 in assignments:  # self referencing foreign key updated together with its key
+                        referenced_values = unchanged_values(constraint.arg1) | {assignments[constraint.arg1]}
+                    if new_value not in referenced_values:
+                        raise IntegrityError(f"Violation of FOREIGN KEY constraint: no matching value in {constraint.arg1} for {new_value}")
 
     def __str__(self, level=0):
         return f"UpdatePlan(\n{indent(level)}assignments={self.assignments},\n{indent(level)}source={self.source.__str__(level + 1)}\n{indent(level - 1)})"
@@ -0,0 +1,160 @@
+import struct
+
+from Exceptions import RegretDBError, DatabaseError, ProgrammingError, ExecutingError, DeadlockError, IntegrityError, \
+    InterfaceError, NotSupportedError, ProtocolError, StatementCanceledError, StatementTimeoutError, RowLimitError, \
+    MemoryBudgetError
+
+"""
+Binary protocol of the network server (Server.py) and its client (Client.py).
+
+Every message is a frame:
+
+    length (uint32) | message type (uint8) | request id (uint32) | body
+
+The length counts everything after itself, the body is one encoded value (usually a tuple).
+Values are encoded with a one byte tag:
+
+    N           None
+    T / F       True / False
+    I int64     integers, larger ones are sent as L length text
+    D float64   floats
+    S length    utf-8 text
+    B length    bytes
+    A count     tuple/list, followed by its items
+
+Requests of a connection are answered in order, so a client can send several requests before reading
+any response (pipelining). A SELECT is answered with COLUMNS, any number of ROWS batches and DONE,
+every other statement with DONE only. A failed request is answered with ERROR.
+"""
+
+# Requests
+EXECUTE = 1            # (sql, parameters or None)
+PREPARE = 2            # (sql,)
+EXECUTE_PREPARED = 3   # (handle, parameters or None)
+CLOSE_PREPARED = 4     # (handle,)
+EXECUTEMANY = 5        # (sql, [parameters, ...])
+
+# Responses
+COLUMNS = 16           # (column names,)
+ROWS = 17              # (row tuples,)
+DONE = 18              # (rowcount,)
+PREPARED = 19          # (handle,)
+ERROR = 20             # (exception class name, message)
+
+HEADER = struct.Struct('!IBI')
+LENGTH = struct.Struct('!I')
+INT = struct.Struct('!q')
+FLOAT = struct.Struct('!d')
+INT_MIN, INT_MAX = -(1 << 63), (1 << 63) - 1
+
+# Exceptions passed to the client, any other exception is sent as its closest base class in this table
+ERRORS = {cls.__name__: cls for cls in (DeadlockError, StatementTimeoutError, StatementCanceledError, RowLimitError,
+                                        MemoryBudgetError, ExecutingError, IntegrityError, InterfaceError,
+                                        NotSupportedError, ProgrammingError, DatabaseError, RegretDBError)}
+
+
+def encode_value(value, out):
+    """Appends the encoding of value to the bytearray out"""
+    if value is None:
+        out += b'N'
+    elif value is True:
+        out += b'T'
+    elif value is False:
+        out += b'F'
+    elif isinstance(value, int):
+        if INT_MIN <= value <= INT_MAX:
+            out += b'I'
+            out += INT.pack(value)
+        else:
+            data = str(value).encode()
+            out += b'L'
+            out += LENGTH.pack(len(data))
+            out += data
+    elif isinstance(value, float):
+        out += b'D'
+        out += FLOAT.pack(value)
+    elif isinstance(value, str):
+        data = value.encode()
+        out += b'S'
+        out += LENGTH.pack(len(data))
+        out += data
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        out += b'B'
+        out += LENGTH.pack(len(value))
+        out += value
+    elif isinstance(value, (tuple, list)):
+        out += b'A'
+        out += LENGTH.pack(len(value))
+        for item in value:
+            encode_value(item, out)
+    else:
+        raise ProtocolError(f"Can't encode value of type {type(value).__name__}")
+
+
+def decode_value(data, pos=0):
+    """Decodes the value at pos, returns (value, position after the value)"""
+    tag = data[pos]
+    pos += 1
+    if tag == 78:  # N
+        return None, pos
+    if tag == 84:  # T
+        return True, pos
+    if tag == 70:  # F
+        return False, pos
+    if tag == 73:  # I
+        return INT.unpack_from(data, pos)[0], pos + 8
+    if tag == 68:  # D
+        return FLOAT.unpack_from(data, pos)[0], pos + 8
+
+    length = LENGTH.unpack_from(data, pos)[0]
+    pos += 4
+    if tag == 83:  # S
+        return str(data[pos:pos + length], 'utf-8'), pos + length
+    if tag == 66:  # B
+        return bytes(data[pos:pos + length]), pos + length
+    if tag == 76:  # L
+        return int(str(data[pos:pos + length], 'ascii')), pos + length
+    if tag == 65:  # A
+        items = []
+        for _ in range(length):
+            item, pos = decode_value(data, pos)
+            items.append(item)
+        return tuple(items), pos
+    raise ProtocolError(f"Unknown value tag {tag!r}")
+
+
+def encode_frame(message_type, request_id, body):
+    out = bytearray(HEADER.pack(0, message_type, request_id))
+    encode_value(body, out)
+    LENGTH.pack_into(out, 0, len(out) - LENGTH.size)
+    return out
+
+
+def read_frame(stream):
+    """Reads one frame from a binary file-like object, returns (message type, request id, body)
+       or None when the stream ended"""
+    prefix = stream.read(LENGTH.size)
+    if not prefix:
+        return None
+    if len(prefix) < LENGTH.size:
+        raise ProtocolError("Connection closed in the middle of a frame")
+    length = LENGTH.unpack(prefix)[0]
+    payload = stream.read(length)
+    if len(payload) < length:
+        raise ProtocolError("Connection closed in the middle of a frame")
+    message_type, request_id = payload[0], int.from_bytes(payload[1:5], 'big')
+    body, _ = decode_value(payload, 5)
+    return message_type, request_id, body
+
+
+def encode_error(error):
+    """Returns the (class name, message) body of an ERROR frame"""
+    for cls in type(error).__mro__:
+        if cls.__name__ in ERRORS and ERRORS[cls.__name__] is cls:
+            return cls.__name__, str(error)
+    return RegretDBError.__name__, f"{type(error).__name__}: {error}"
+
+
+def decode_error(body):
+    name, message = body
+    return ERRORS.get(name, RegretDBError)(message)
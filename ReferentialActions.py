@@ -0,0 +1,164 @@
+from collections import defaultdict
+
+from DataManager import data_manager
+from Exceptions import ExecutingError, IntegrityError
+from LockManager import SHARED, EXCLUSIVE
+from Metrics import check_scans
+from StatementGuard import current, CHECK_INTERVAL
+
+"""
+Referential actions of foreign keys:
+
+    CREATE TABLE orders (id NUMBER PRIMARY KEY,
+                         user_id NUMBER FOREIGN KEY REFERENCES users(id) ON DELETE CASCADE ON UPDATE SET NULL)
+
+When a DELETE or UPDATE removes a key value still referenced by a foreign key, RESTRICT (the default)
+rejects the statement, CASCADE deletes the referencing rows or changes their foreign key to the new value
+and SET NULL sets their foreign key to NULL.
+
+Actions are propagated breadth-first over the foreign key graph: the rows the statement deletes or
+changes are the first level, the referencing rows they affect through every foreign key the next one.
+A level costs one anti-join per foreign key, the removed key values are collected in a dictionary and the
+referencing table is scanned once, whatever the number of rows. The changes of all tables are collected
+first and written at the end with one pass per table. A row reached twice is changed once and deleting
+it wins over changing it, so cycles in the graph end.
+
+Inside a transaction RESTRICT is checked at COMMIT like the other foreign key checks, cascades are
+applied by the statement.
+"""
+
+ACTIONS = ('CASCADE', 'SET NULL', 'RESTRICT')
+DELETED = object()  # new value of a key whose row is deleted
+
+
+class Changes:
+    """Rows of a table deleted or replaced by a statement and its cascades"""
+    __slots__ = ('deleted', 'updated')
+
+    def __init__(self, deleted=(), updated=()):
+        self.deleted = {id(row): row for row in deleted}
+        self.updated = {id(row): (row, new_row) for row, new_row in updated}  # id(old row) -> (old row, new row)
+
+    def current_row(self, row):
+        """The row as the changes leave it, None if it's deleted"""
+        if id(row) in self.deleted:
+            return None
+        entry = self.updated.get(id(row))
+        return entry[1] if entry is not None else row
+
+
+def propagate(table_name, deleted_rows=(), updated_rows=()):
+    """
+    Changes of a statement deleting `deleted_rows` or replacing rows of a table ([(old row, new row), ...]
+    in `updated_rows`) and of the referential actions they trigger, {table: Changes}.
+    Raises if a RESTRICT foreign key references a removed value.
+    """
+    changes = {table_name: Changes(deleted_rows, updated_rows)}
+    if not data_manager.enforce_foreign_keys or not data_manager.foreign_key_manager.is_table_referenced(table_name):
+        return changes
+
+    referencing_fks = defaultdict(list)
+    for fk in data_manager.foreign_key_manager.foreign_keys:
+        referencing_fks[fk.referenced_column.split('.')[0]].append(fk)
+    check_restrict = not data_manager.in_transaction()
+
+    level = {table_name: (list(deleted_rows), list(updated_rows))}
+    while level:
+        current.guard.check()
+        next_level = defaultdict(lambda: ([], []))
+        for table, (deleted, updated) in level.items():
+            for fk in referencing_fks[table]:
+                _propagate_foreign_key(fk, deleted, updated, changes, next_level, check_restrict)
+        level = next_level
+    return changes
+
+
+def _propagate_foreign_key(fk, deleted, updated, changes, next_level, check_restrict):
+    """Applies the action of a foreign key to the rows referencing removed values of its referenced column"""
+    referenced_table = fk.referenced_column.split('.')[0]
+    column = fk.referenced_column
+
+    removed = {}  # removed key -> new key, DELETED when its row is deleted
+    for row in deleted:
+        value = row.get(column)
+        if value is not None:
+            removed[value] = DELETED
+    for row, new_row in updated:
+        value = row.get(column)
+        if value is not None and new_row.get(column) != value:
+            removed[value] = new_row.get(column)
+    if not removed:
+        return
+
+    # Values the remaining rows still hold aren't removed, unless the column is unique
+    constraints = data_manager.get_constraint_for_table(referenced_table)
+    if not any(constraint.type in ('PRIMARY KEY', 'UNIQUE') for constraint in constraints[column]):
+        table_changes = changes[referenced_table]
+        for row in data_manager.get_tables_data(referenced_table):
+            row = table_changes.current_row(row)
+            if row is not None:
+                removed.pop(row.get(column), None)
+        if not removed:
+            return
+
+    referencing_table = fk.referencing_column.split('.')[0]
+    referencing_column = fk.referencing_column
+    data_manager.lock_manager.acquire(referencing_table, SHARED)
+    table_changes = changes.setdefault(referencing_table, Changes())
+    next_deleted, next_updated = next_level[referencing_table]
+
+    check_scans.foreign_key += 1
+    for row in data_manager.get_tables_data(referencing_table):
+        current_row = table_changes.current_row(row)
+        if current_row is None:
+            continue
+        value = current_row.get(referencing_column)
+        if value is None or value not in removed:
+            continue
+
+        new_value = removed[value]
+        action = fk.on_delete if new_value is DELETED else fk.on_update
+        if action == 'RESTRICT':
+            if check_restrict:
+                if new_value is DELETED:
+                    deleted_row = next(deleted_row for deleted_row in deleted if deleted_row.get(column) == value)
+                    raise ExecutingError(f"Cannot delete row {deleted_row}: it is referenced by {current_row}")
+                raise ExecutingError(f"Cannot update '{column}' from {value} to {new_value}: it is referenced in '{current_row}'")
+            continue
+
+        if action == 'CASCADE' and new_value is DELETED:
+            table_changes.deleted[id(row)] = row
+            table_changes.updated.pop(id(row), None)
+            next_deleted.append(current_row)
+            continue
+
+        if action == 'SET NULL':
+            new_value = None
+            if any(constraint.type in ('NOT NULL', 'PRIMARY KEY') for constraint in
+                   data_manager.get_constraint_for_table(referencing_table)[referencing_column]):
+                raise IntegrityError(f"Cannot set {referencing_column} to NULL: the column is NOT NULL")
+        if current_row is row:
+            current_row = row.copy()
+            table_changes.updated[id(row)] = (row, current_row)
+        current_row[referencing_column] = new_value
+        next_updated.append((row, current_row))
+
+
+def apply(changes):
+    """Writes the changes of every table, deleted rows first, then the new rows in one pass over the table"""
+    guard = current.guard
+    for table_name, table_changes in changes.items():
+        if not table_changes.deleted and not table_changes.updated:
+            continue
+        data_manager.lock_manager.acquire(table_name, EXCLUSIVE)
+        if table_changes.deleted:
+            guard.check()
+            data_manager.delete_rows(table_name, list(table_changes.deleted.values()))
+        if table_changes.updated:
+            updated = table_changes.updated
+            for index, row in enumerate(data_manager.get_tables_data(table_name)):
+                if not index % CHECK_INTERVAL:
+                    guard.check()
+                entry = updated.get(id(row))
+                if entry is not None:
+                    data_manager.replace_row(table_name, index, entry[1])
@@ -1,82 +1,366 @@
+import os
+from time import perf_counter
+
+from ASTNodes.AlterNodes import AlterAddStmt, AlterDropStmt, AlterRenameStmt, AlterModifyStmt
+from ASTNodes.CreateNode import CreateStmt
+from ASTNodes.DropNode import DropStmt
+from ASTNodes.ExplainNode import ExplainStmt
+from ASTNodes.InsertNode import InsertStmt
+from ASTNodes.SelectNode import SelectStmt
+from ASTNodes.ShowNode import ShowTableStatsStmt
+from Cursor import Cursor, Visualize
 from DataManager import data_manager
+from Exceptions import ProgrammingError, ExecutingError
 from ExecutionPlanner import ExecutionPlanner
-from LALR import Parser
+from LALR import Parser, Tokenizer, FastTokenizer
+from Metrics import StatementMetrics, MultiSink
+from PlanCache import PlanCache, CacheEntry
+from PlanNodes.ExplainPlanNode import EXPLAIN_COLUMNS
+from StatementGuard import StatementGuard, run_guarded
+
+# Statements changing the schema, they are never cached and they invalidate all cached plans
+DDL_STATEMENTS = (CreateStmt, DropStmt, AlterAddStmt, AlterDropStmt, AlterRenameStmt, AlterModifyStmt)
 
 
 # Things that will NOT be supported:
-# JOINS, FUNCTIONS, SUB-QUERIES, DATA SIZE (e.g VARCHAR(100))
+# JOINS, FUNCTIONS (except the aggregates COUNT, SUM, MIN, MAX and AVG), SUB-QUERIES, DATA SIZE (e.g VARCHAR(100))
 # Statement optimizations, indexes
 # It supports only 1 process, it won't detect metadata changes happening outside the process
-# It is not async safe :D
+# Threads should use their own RegretDB instance: SELECTs read MVCC snapshots, writers take per-table locks
 
 class RegretDB:
-    def __init__(self):
-        self.parser = Parser()
-        self.planner = ExecutionPlanner()
+    def __init__(self, plan_cache_size=128, fast_lexer=False, parallel_workers=0, parallel_threshold=50000,
+                 parallel_executor='auto', metrics=None, slow_query_log=None, statement_timeout=None,
+                 max_intermediate_rows=None):
+        self.parser = Parser(FastTokenizer() if fast_lexer else Tokenizer())
+        self.planner = ExecutionPlanner(parallel_workers, parallel_threshold, parallel_executor)
+        self.plan_cache = PlanCache(plan_cache_size)
+        self.slow_query_log = slow_query_log  # SlowQueryLog, see SlowQueryLog.py
+        if slow_query_log is not None:
+            metrics = MultiSink(metrics, slow_query_log) if metrics is not None else slow_query_log
+        self.metrics = metrics  # MetricsSink receiving the StatementMetrics of every statement, see Metrics.py
+        self.statement_timeout = statement_timeout  # seconds a statement may run, see StatementGuard.py
+        self.max_intermediate_rows = max_intermediate_rows  # rows joins and sorts of a statement may produce
+        self.guard = None  # StatementGuard of the statement started last
         # self.data_manager = DataManager()
         self.statement = None
         self.plan = None
 
         self.data = {}
 
-    def execute_order_66(self, sql_stmt):
+    def execute_order_66(self, sql_stmt, tokens=None):
         """May the 4th be with you"""
-        self.statement = self.parser.parse(sql_stmt)
-        self.statement.set_sql_text(sql_stmt)
-        # print(self.statement)
-        self.statement.verify()
-        self.plan = self.planner.plan(self.statement)
-        self.plan.execute()
+        cursor = self.execute(sql_stmt, tokens=tokens)
+        if cursor.returns_rows:
+            Visualize(cursor).visualize_table()
 
         # self.statement = None
         # self.plan = None
 
+    def execute(self, sql_stmt, parameters=None, tokens=None):
+        """Executes a statement and returns a Cursor, rows of a SELECT are produced lazily while fetching.
+           `parameters` is a sequence of values for the '?' placeholders of the statement."""
+        if self.metrics is None:
+            return self._execute(sql_stmt, parameters, tokens, None)
+
+        metrics = StatementMetrics(sql_stmt)
+        try:
+            cursor = self._execute(sql_stmt, parameters, tokens, metrics)
+        except Exception as e:
+            metrics.error = type(e).__name__
+            self.metrics.record(metrics.finish())
+            raise
+        if not isinstance(self.statement, SelectStmt):
+            metrics.rows = cursor.rowcount
+            self.metrics.record(metrics.finish())
+        return cursor
+
+    def _execute(self, sql_stmt, parameters, tokens, metrics):
+        if tokens is None:
+            tokens = self.parser.tokenize(sql_stmt)
+        if parameters is not None:
+            tokens = self.parser.bind_parameters(tokens, parameters)
+        if metrics is not None:
+            metrics.statement = tokens[0].type if tokens else None
+            metrics.lap('tokenize')
+        entry = self.prepare(sql_stmt, tokens, metrics)
+        guard = self.guard = self._new_guard()
+
+        if isinstance(self.statement, SelectStmt):
+            return self._open_cursor(entry, metrics, guard)
+        if isinstance(self.statement, ExplainStmt):
+            # EXPLAIN ANALYZE runs like the explained statement, under its locks and in its transaction,
+            # a SELECT outside a transaction reads an MVCC snapshot like its cursor would
+            snapshot = None
+            if self.plan.analyze and self.plan.is_query and not data_manager.transaction_manager.is_owner():
+                snapshot = data_manager.version_manager.acquire_snapshot()
+            self.plan.set_snapshot(snapshot)
+            try:
+                rows = self.run_statement(run_guarded, guard, self.plan.execute)
+            finally:
+                if snapshot is not None:
+                    data_manager.version_manager.release_snapshot(snapshot)
+            cursor = Cursor(rows, EXPLAIN_COLUMNS, rowcount=len(rows))
+        elif isinstance(self.statement, ShowTableStatsStmt):
+            rows = self.run_statement(self.plan.execute)
+            cursor = Cursor(rows, self.statement.columns, rowcount=len(rows))
+        else:
+            result = self.run_statement(run_guarded, guard, self.plan.execute)
+            cursor = Cursor(rowcount=len(result) if result is not None else -1)
+        if metrics is not None:
+            metrics.lap('execute')
+        return cursor
+
+    def _new_guard(self):
+        return StatementGuard(self.statement_timeout, self.max_intermediate_rows)
+
+    def cancel(self):
+        """Cancels the statement started last, e.g. from another thread. The statement fails with
+           StatementCanceledError at its next check, a SELECT when its next row is fetched."""
+        guard = self.guard
+        if guard is not None:
+            guard.cancel()
+
+    def _open_cursor(self, entry, metrics=None, guard=None):
+        """Opens a cursor over the plan of a SELECT, reading an MVCC snapshot"""
+        version_manager = data_manager.version_manager
+        if data_manager.transaction_manager.is_owner():
+            snapshot = None  # a transaction reads its own uncommitted changes
+        else:
+            snapshot = version_manager.acquire_snapshot()
+        self.plan.set_snapshot(snapshot)
+
+        if entry:
+            # The cached plan can't be re-bound while this cursor is still reading from it
+            entry.in_use = True
+
+        rows = self.plan.iterate()
+        if metrics is not None:
+            # Scans are counted only while rows are produced, the thread may run other statements meanwhile
+            metrics.pause()
+            rows = self._measured_rows(rows, metrics)
+
+        def on_close():
+            if entry:
+                entry.in_use = False
+            if snapshot is not None:
+                version_manager.release_snapshot(snapshot)
+            if metrics is not None:
+                self.metrics.record(metrics.finish())
+
+        return Cursor(rows, self.statement.columns, on_close=on_close, guard=guard)
+
+    @staticmethod
+    def _measured_rows(rows, metrics):
+        """Counts the rows of a SELECT and the time spent producing them, not the time the caller spends between fetches"""
+        metrics.rows = 0
+        metrics.phases['execute'] = 0.0
+        rows = iter(rows)
+        while True:
+            metrics.resume()
+            start = perf_counter()
+            try:
+                row = next(rows)
+            except StopIteration:
+                return
+            except Exception as e:
+                metrics.error = type(e).__name__
+                raise
+            finally:
+                metrics.phases['execute'] += perf_counter() - start
+                metrics.pause()
+            metrics.rows += 1
+            yield row
+
+    def run_statement(self, func, *args):
+        """Runs a writing statement atomically, a failing statement undoes only its own changes.
+           Table locks taken by the plan are held for the statement (or the whole transaction)"""
+        transaction_manager = data_manager.transaction_manager
+        savepoint = transaction_manager.savepoint()
+        try:
+            result = func(*args)
+        except Exception as e:
+            transaction_manager.abort_statement(savepoint, e)
+            raise
+        transaction_manager.end_statement()
+        return result
+
+    def executemany(self, sql_stmt, seq_of_parameters):
+        """Executes a statement once for every parameter sequence, returns the number of affected rows.
+           The statement is tokenized once and planned once (through the plan cache), INSERTs are
+           applied as a single batch with their constraints checked across all rows."""
+        metrics = StatementMetrics(sql_stmt) if self.metrics is not None else None
+        try:
+            rowcount = self._executemany(sql_stmt, seq_of_parameters, metrics)
+        except Exception as e:
+            if metrics is not None:
+                metrics.error = type(e).__name__
+                self.metrics.record(metrics.finish())
+            raise
+        if metrics is not None:
+            metrics.rows = rowcount
+            self.metrics.record(metrics.finish())
+        return rowcount
+
+    def _executemany(self, sql_stmt, seq_of_parameters, metrics):
+        tokens = self.parser.tokenize(sql_stmt)
+        if metrics is not None:
+            metrics.statement = tokens[0].type if tokens else None
+            metrics.lap('tokenize')
+        rowcount = 0
+        insert_plan = None
+        batch = []
+        guard = self.guard = self._new_guard()
+        for parameters in seq_of_parameters:
+            self.prepare(sql_stmt, self.parser.bind_parameters(tokens, parameters), metrics)
+
+            if isinstance(self.statement, SelectStmt):
+                raise ProgrammingError("executemany() can't be used with SELECT statements")
+            if isinstance(self.statement, InsertStmt):
+                insert_plan = self.plan
+                batch.append(self.plan.row_values())
+                continue
+
+            result = self.run_statement(run_guarded, guard, self.plan.execute)
+            rowcount += len(result) if result is not None else 0
+            if metrics is not None:
+                metrics.lap('execute')
+
+        if batch:
+            rowcount += len(self.run_statement(run_guarded, guard, insert_plan.execute_batch, batch))
+            if metrics is not None:
+                metrics.lap('execute')
+        return rowcount
+
+    def prepare(self, sql_stmt, tokens, metrics=None):
+        """Parses, verifies and plans a tokenized statement or takes its plan from the plan cache.
+           Sets self.statement and self.plan and returns the cache entry (None if the statement isn't cached)"""
+        key = self.plan_cache.make_key(tokens, self.parser.tokenizer.literal_types, self.parser.literal_from_token)
+
+        entry = self.plan_cache.get(key, data_manager.schema_version) if key else None
+        if metrics is not None:
+            metrics.key = key
+        if entry:
+            # Re-binding literals of the cached plan, the key guarantees the same token types on the same positions
+            for pos, literal in entry.bindings:
+                literal.value = self.parser.literal_from_token(tokens[pos]).value
+            self.statement = entry.statement
+            self.statement.set_sql_text(sql_stmt)
+            self.plan = entry.plan
+            if metrics is not None:
+                metrics.cached = True
+                metrics.lap('plan')
+        else:
+            self.statement = self.parser.parse(sql_stmt, tokens)
+            self.statement.set_sql_text(sql_stmt)
+            if metrics is not None:
+                metrics.lap('parse')
+            if isinstance(self.statement, DDL_STATEMENTS) and data_manager.in_transaction():
+                raise ExecutingError("Schema changes are not allowed inside a transaction")
+            # print(self.statement)
+            self.statement.verify()
+            if metrics is not None:
+                metrics.lap('verify')
+            self.plan = self.planner.plan(self.statement)
+            if key and self._is_cacheable(tokens):
+                entry = CacheEntry(self.statement, self.plan, self.parser.bindings, data_manager.schema_version)
+                self.plan_cache.put(key, entry)
+            if metrics is not None:
+                metrics.lap('plan')
+        if metrics is not None:
+            metrics.plan = self.plan
+
+        if isinstance(self.statement, DDL_STATEMENTS):
+            data_manager.bump_schema_version()
+        return entry
+
+    def execute_script(self, script):
+        """Executes ';' separated statements one after another, returns the number of executed statements.
+           `script` is the script text, a path or a text file-like object, files are read lazily."""
+        if isinstance(script, os.PathLike):
+            with open(script, encoding='utf-8') as file:
+                return self.execute_script(file)
+
+        count = 0
+        for sql_stmt, tokens in self.parser.tokenizer.tokenize_statements(script):
+            self.execute_order_66(sql_stmt, tokens=tokens)
+            count += 1
+        return count
+
+    def _is_cacheable(self, tokens):
+        """A plan can be cached only if every literal in the statement was bound to a Literal of the plan"""
+        if isinstance(self.statement, DDL_STATEMENTS + (ExplainStmt, ShowTableStatsStmt)):
+            return False
+        literal_types = self.parser.tokenizer.literal_types
+        literal_positions = [pos for pos, token in enumerate(tokens) if token.type in literal_types]
+        return literal_positions == [pos for pos, _ in self.parser.bindings]
+
+    def plan_cache_stats(self):
+        return self.plan_cache.stats()
+
+    def slow_query_report(self, n=10, by='total'):
+        """Statement fingerprints with the most total time (or `by` another SlowQueryLog.top() key)"""
+        if self.slow_query_log is None:
+            raise ProgrammingError("The slow query log is not enabled")
+        return self.slow_query_log.top(n, by)
+
+    def table_stats(self, table_name=None):
+        """Estimated memory use of a table or of every table, see MemoryStats.py"""
+        return [stats.as_dict() for stats in data_manager.table_stats(table_name)]
+
+    def set_memory_budget(self, budget, action='reject'):
+        data_manager.set_memory_budget(budget, action)
+
+    def lock_stats(self):
+        return data_manager.lock_manager.stats()
+
 
 # todo enforce FOREIGN key
-# Example usage:
-db_engine = RegretDB()
-sql = "CREATE TABLE users (id NUMBER PRIMARY KEY, name TEXT default 'ALICE')"
-db_engine.execute_order_66(sql)
-# sql = "SELECT users.name FROM users, orders WHERE True"
-sql = "CREATE TABLE orders (id NUMBER PRIMARY KEY, user_id NUMBER FOREIGN KEY REFERENCES users(id))"
-db_engine.execute_order_66(sql)
-# sql = "CREATE TABLE ala (id NUMBER PRIMARY KEY DEFAULT 1, user_id NUMBER FOREIGN KEY REFERENCES users(id))"
-# db_engine.execute_order_66(sql)
-# print(data_manager.table_columns)
-sql = "INSERT INTO users (id) VALUES (1)"
-db_engine.execute_order_66(sql)
-sql = "INSERT INTO users (id) VALUES (7)"
-db_engine.execute_order_66(sql)
-sql = "INSERT INTO orders (id, user_id) VALUES (1, 1)"
-db_engine.execute_order_66(sql)
-sql = "INSERT INTO orders (id, user_id) VALUES (2, 7)"
-db_engine.execute_order_66(sql)
-
-sql = "INSERT INTO users (name, id) VALUES ('Ash', 2)"
-db_engine.execute_order_66(sql)
-sql = "INSERT INTO users (name, id) VALUES ('Laura', 3)"
-db_engine.execute_order_66(sql)
-sql = "INSERT INTO users (name, id) VALUES ('Hughie', 4)"
-db_engine.execute_order_66(sql)
-sql = "INSERT INTO users (name, id) VALUES ('Leyla', 5)"
-db_engine.execute_order_66(sql)
-
-# print(data_manager.column_constraints)
-# print(data_manager.tables)
-# sql = "SELECT * FROM orders"
-# db_engine.execute_order_66(sql)
-sql = "UPDATE orders SET user_id=5 where user_id=1"
-db_engine.execute_order_66(sql)
-# sql = "UPDATE users SET id=10 where id=5"
-# db_engine.execute_order_66(sql)
-# sql = "SELECT * FROM orders "
-# db_engine.execute_order_66(sql)
-
-sql = "DELETE FROM users where id=5"
-# sql = "SELECT * FROM orders"
-db_engine.execute_order_66(sql)
-
-sql = "SELECT * FROM users"
-db_engine.execute_order_66(sql)
-# print(data_manager.foreign_key_manager)
-# print(data_manager.foreign_key_manager.get_columns_foreign_keys('users.id'))
+if __name__ == "__main__":
+    # Example usage:
+    db_engine = RegretDB()
+    sql = "CREATE TABLE users (id NUMBER PRIMARY KEY, name TEXT default 'ALICE')"
+    db_engine.execute_order_66(sql)
+    # sql = "SELECT users.name FROM users, orders WHERE True"
+    sql = "CREATE TABLE orders (id NUMBER PRIMARY KEY, user_id NUMBER FOREIGN KEY REFERENCES users(id))"
+    db_engine.execute_order_66(sql)
+    # sql = "CREATE TABLE ala (id NUMBER PRIMARY KEY DEFAULT 1, user_id NUMBER FOREIGN KEY REFERENCES users(id))"
+    # db_engine.execute_order_66(sql)
+    # print(data_manager.table_columns)
+    sql = "INSERT INTO users (id) VALUES (1)"
+    db_engine.execute_order_66(sql)
+    sql = "INSERT INTO users (id) VALUES (7)"
+    db_engine.execute_order_66(sql)
+    sql = "INSERT INTO orders (id, user_id) VALUES (1, 1)"
+    db_engine.execute_order_66(sql)
+    sql = "INSERT INTO orders (id, user_id) VALUES (2, 7)"
+    db_engine.execute_order_66(sql)
+
+    sql = "INSERT INTO users (name, id) VALUES ('Ash', 2)"
+    db_engine.execute_order_66(sql)
+    sql = "INSERT INTO users (name, id) VALUES ('Laura', 3)"
+    db_engine.execute_order_66(sql)
+    sql = "INSERT INTO users (name, id) VALUES ('Hughie', 4)"
+    db_engine.execute_order_66(sql)
+    sql = "INSERT INTO users (name, id) VALUES ('Leyla', 5)"
+    db_engine.execute_order_66(sql)
+
+    # print(data_manager.column_constraints)
+    # print(data_manager.tables)
+    # sql = "SELECT * FROM orders"
+    # db_engine.execute_order_66(sql)
+    sql = "UPDATE orders SET user_id=5 where user_id=1"
+    db_engine.execute_order_66(sql)
+    # sql = "UPDATE users SET id=10 where id=5"
+    # db_engine.execute_order_66(sql)
+    # sql = "SELECT * FROM orders "
+    # db_engine.execute_order_66(sql)
+
+    sql = "DELETE FROM users where id=5"
+    # sql = "SELECT * FROM orders"
+    db_engine.execute_order_66(sql)
+
+    sql = "SELECT * FROM users"
+    db_engine.execute_order_66(sql)
+    # print(data_manager.foreign_key_manager)
+    # print(data_manager.foreign_key_manager.get_columns_foreign_keys('users.id'))
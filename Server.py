@@ -0,0 +1,151 @@
+import argparse
+import socket
+import socketserver
+
+import Protocol
+from DataManager import data_manager
+from Exceptions import ProgrammingError
+from RegretDB import RegretDB
+
+"""
+Network server sharing one database between processes:
+
+    python -m Server --host 127.0.0.1 --port 6666
+    python -m Server --unix /tmp/regretdb.sock
+
+Every connection is served by its own thread and RegretDB, so statements of different connections run
+concurrently under the table locks, and a transaction belongs to the connection which started it.
+The protocol is described in Protocol.py, Client.py is the client library.
+"""
+
+DEFAULT_PORT = 6666
+
+
+class ConnectionHandler(socketserver.StreamRequestHandler):
+    """Serves the requests of one connection in order, until the client disconnects"""
+
+    def setup(self):
+        super().setup()
+        if self.request.family != getattr(socket, 'AF_UNIX', None):
+            self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.engine = RegretDB(**self.server.engine_options)
+        self.prepared = {}  # handle -> (sql, tokens)
+        self.next_handle = 1
+
+    def handle(self):
+        try:
+            while True:
+                frame = Protocol.read_frame(self.rfile)
+                if frame is None:
+                    return
+                message_type, request_id, body = frame
+                try:
+                    self.dispatch(message_type, request_id, body)
+                except Exception as e:
+                    self.send(Protocol.ERROR, request_id, Protocol.encode_error(e))
+                self.wfile.flush()
+        except (ConnectionError, Protocol.ProtocolError):
+            return
+        finally:
+            # A transaction left open by a client which went away must not keep its locks
+            if data_manager.in_transaction():
+                self.engine.execute('ROLLBACK')
+
+    def dispatch(self, message_type, request_id, body):
+        if message_type == Protocol.EXECUTE:
+            sql_stmt, parameters = body
+            self.execute(request_id, sql_stmt, parameters)
+        elif message_type == Protocol.EXECUTE_PREPARED:
+            handle, parameters = body
+            if handle not in self.prepared:
+                raise ProgrammingError(f"Unknown prepared statement handle {handle}")
+            sql_stmt, tokens = self.prepared[handle]
+            self.execute(request_id, sql_stmt, parameters, tokens)
+        elif message_type == Protocol.PREPARE:
+            sql_stmt, = body
+            handle = self.next_handle
+            self.next_handle += 1
+            self.prepared[handle] = (sql_stmt, self.engine.parser.tokenize(sql_stmt))
+            self.send(Protocol.PREPARED, request_id, (handle,))
+        elif message_type == Protocol.CLOSE_PREPARED:
+            handle, = body
+            self.prepared.pop(handle, None)
+            self.send(Protocol.DONE, request_id, (-1,))
+        elif message_type == Protocol.EXECUTEMANY:
+            sql_stmt, seq_of_parameters = body
+            self.send(Protocol.DONE, request_id, (self.engine.executemany(sql_stmt, seq_of_parameters),))
+        else:
+            raise Protocol.ProtocolError(f"Unknown request type {message_type}")
+
+    def execute(self, request_id, sql_stmt, parameters, tokens=None):
+        cursor = self.engine.execute(sql_stmt, parameters, tokens)
+        if not cursor.returns_rows:
+            self.send(Protocol.DONE, request_id, (cursor.rowcount,))
+            return
+
+        # Rows are streamed in batches, the client starts reading before the result is complete
+        columns = tuple(cursor.columns)
+        self.send(Protocol.COLUMNS, request_id, (columns,))
+        batch_size = self.server.batch_size
+        rowcount = 0
+        try:
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if rows:
+                    self.send(Protocol.ROWS, request_id, ([tuple(row.get(column) for column in columns) for row in rows],))
+                    self.wfile.flush()
+                    rowcount += len(rows)
+                if len(rows) < batch_size:
+                    break
+        finally:
+            cursor.close()
+        self.send(Protocol.DONE, request_id, (rowcount,))
+
+    def send(self, message_type, request_id, body):
+        self.wfile.write(Protocol.encode_frame(message_type, request_id, body))
+
+
+class RegretDBServerMixin:
+    daemon_threads = True
+
+    def __init__(self, address, batch_size=500, **engine_options):
+        self.batch_size = batch_size  # rows per ROWS frame
+        self.engine_options = engine_options  # passed to the RegretDB of every connection
+        super().__init__(address, ConnectionHandler)
+
+
+class TCPServer(RegretDBServerMixin, socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+
+
+if hasattr(socketserver, 'ThreadingUnixStreamServer'):
+    class UnixServer(RegretDBServerMixin, socketserver.ThreadingUnixStreamServer):
+        pass
+
+
+def make_server(address, **options):
+    """Creates a server listening on (host, port) or on the path of a Unix domain socket"""
+    if isinstance(address, str):
+        return UnixServer(address, **options)
+    return TCPServer(address, **options)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="RegretDB network server")
+    arg_parser.add_argument('--host', default='127.0.0.1')
+    arg_parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    arg_parser.add_argument('--unix', help="path of a Unix domain socket, used instead of --host/--port")
+    arg_parser.add_argument('--batch-size', type=int, default=500, help="rows per streamed batch")
+    args = arg_parser.parse_args()
+
+    address = args.unix if args.unix else (args.host, args.port)
+    with make_server(address, batch_size=args.batch_size) as server:
+        print(f"RegretDB listening on {address}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
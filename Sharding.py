@@ -0,0 +1,463 @@
+import heapq
+import multiprocessing
+import threading
+import zlib
+
+import Protocol
+from ASTNodes.CreateNode import CreateStmt
+from ASTNodes.DeleteNode import DeleteStmt
+from ASTNodes.DropNode import DropStmt
+from ASTNodes.InsertNode import InsertStmt
+from ASTNodes.SelectNode import SelectStmt
+from ASTNodes.TransactionNode import TransactionStmt
+from ASTNodes.UpdateNode import UpdateStmt
+from Cursor import Cursor
+from DataManager import data_manager
+from Exceptions import ProgrammingError, ExecutingError, IntegrityError, NotSupportedError
+from Operators.LogicalOperators import AND, EG
+from PlanNodes.AggregatePlanNodes import TableCount
+from PlanNodes.BasePlanNode import PlanNode
+from PlanNodes.SelectPlanNodes import TableScan, RowsScan, OrderKey
+from RegretDB import RegretDB, DDL_STATEMENTS
+from TokenTypes import Literal
+
+"""
+Hash partitioned tables spread over worker processes:
+
+    db = ShardedRegretDB(shards=4)
+    db.execute("CREATE TABLE users (id NUMBER PRIMARY KEY, name TEXT)")              # sharded by id
+    db.execute("CREATE TABLE orders (id NUMBER PRIMARY KEY, user_id NUMBER)", shard_key='user_id')
+    db.execute("CREATE TABLE countries (code TEXT, name TEXT)")                      # no key, replicated
+    db.execute("SELECT * FROM users WHERE id = ?", (7,)).fetchall()                  # runs on one shard
+
+Every shard is a process with its own DataManager holding the rows whose shard key hashes to it.
+Tables are sharded by their PRIMARY KEY unless another shard key is given, tables without either are
+replicated, every shard holds all of their rows. The coordinator (this process) keeps the schema in its
+own data_manager, without any rows, and:
+- routes INSERTs and statements pinned to a shard key value by their WHERE (key = value) to one shard,
+- scatters other SELECT/UPDATE/DELETE statements to all shards and gathers the results,
+  sorted results are merged with heapq.merge, joins and aggregates run here on the rows gathered from
+  the shards (COUNT(*) of a whole table sums the counts of the shards),
+- checks foreign keys and uniqueness of columns other than the shard key across shards, shards only
+  check what they can see locally (their foreign key checks are turned off),
+- runs statements changing several shards in a transaction on each of them, committed only when all
+  of them succeeded.
+Explicit transactions spanning shards are not supported. A coordinator serializes its statements,
+it must be the only one writing to its shards.
+"""
+
+
+def shard_of(value, shards):
+    """Shard owning a shard key value, stable across processes unlike hash()"""
+    return zlib.crc32(repr(value).encode()) % shards
+
+
+class ShardWorker:
+    """Runs in a shard process, its methods are called by the coordinator"""
+
+    def __init__(self, engine_options):
+        data_manager.enforce_foreign_keys = False
+        self.engine = RegretDB(**engine_options)
+
+    def execute(self, sql_stmt, parameters):
+        cursor = self.engine.execute(sql_stmt, parameters)
+        if cursor.returns_rows:
+            return cursor.columns, cursor.fetchall()
+        return None, cursor.rowcount
+
+    def executemany(self, sql_stmt, seq_of_parameters):
+        return self.engine.executemany(sql_stmt, seq_of_parameters)
+
+    def prepare_statement(self, sql_stmt, parameters):
+        """First phase of a statement changing several shards: runs it in a transaction and validates it"""
+        self.engine.execute('BEGIN')
+        try:
+            rowcount = self.engine.execute(sql_stmt, parameters).rowcount
+            data_manager.transaction_manager.validate()
+        except Exception:
+            self.rollback()
+            raise
+        return rowcount
+
+    def commit(self):
+        self.engine.execute('COMMIT')
+
+    def rollback(self):
+        if data_manager.in_transaction():
+            self.engine.execute('ROLLBACK')
+
+    def preview(self, sql_stmt, parameters):
+        """Returns the rows an UPDATE or DELETE would change, without changing them"""
+        tokens = self.engine.parser.tokenize(sql_stmt)
+        if parameters is not None:
+            tokens = self.engine.parser.bind_parameters(tokens, parameters)
+        self.engine.prepare(sql_stmt, tokens)
+        return [dict(row) for row in self.engine.run_statement(self.engine.plan.source.execute)]
+
+    def existing(self, table_name, column, values):
+        values = set(values)
+        return {row.get(column) for row in data_manager.get_tables_data(table_name) if row.get(column) in values}
+
+    def scan(self, table_name):
+        return list(data_manager.get_tables_data(table_name))
+
+    def table_sizes(self):
+        return {table_name: len(data_manager.get_tables_data(table_name)) for table_name in data_manager.version_manager.versions}
+
+
+def serve_shard(connection, engine_options):
+    worker = ShardWorker(engine_options)
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            return
+        if message is None:
+            return
+        method, args = message
+        try:
+            connection.send(('ok', getattr(worker, method)(*args)))
+        except Exception as e:
+            connection.send(('error', Protocol.encode_error(e)))
+
+
+class ShardedRegretDB:
+    def __init__(self, shards=4, **engine_options):
+        context = multiprocessing.get_context('spawn')
+        self.connections = []
+        self.processes = []
+        for i in range(shards):
+            connection, child_connection = context.Pipe()
+            process = context.Process(target=serve_shard, args=(child_connection, engine_options),
+                                      name=f"regretdb-shard-{i}", daemon=True)
+            process.start()
+            child_connection.close()
+            self.connections.append(connection)
+            self.processes.append(process)
+
+        # Schema of all tables, no rows. Its plans are rewritten for joins, so they must not be cached
+        self.engine = RegretDB(**{**engine_options, 'plan_cache_size': 0})
+        self.shard_keys = {}  # table -> qualified shard key column, None for replicated tables
+        self.lock = threading.Lock()
+        self.closed = False
+
+    @property
+    def shards(self):
+        return len(self.connections)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def execute(self, sql_stmt, parameters=None, shard_key=None, replicated=False):
+        """Executes a statement and returns a Cursor. `shard_key` (a column name) and `replicated`
+           only apply to CREATE TABLE."""
+        with self.lock:
+            if self.closed:
+                raise ProgrammingError("Database is closed")
+            tokens = self.engine.parser.tokenize(sql_stmt)
+            if parameters is not None:
+                tokens = self.engine.parser.bind_parameters(tokens, parameters)
+            self.engine.prepare(sql_stmt, tokens)
+            statement = self.engine.statement
+
+            if isinstance(statement, SelectStmt):
+                return self._select(statement, sql_stmt, parameters)
+            if isinstance(statement, InsertStmt):
+                if statement.conflict_action:
+                    raise NotSupportedError("INSERT ... ON CONFLICT is not supported on sharded tables")
+                return Cursor(rowcount=self._insert(statement, sql_stmt, parameters))
+            if isinstance(statement, UpdateStmt):
+                return Cursor(rowcount=self._update(statement, sql_stmt, parameters))
+            if isinstance(statement, DeleteStmt):
+                return Cursor(rowcount=self._delete(statement, sql_stmt, parameters))
+            if isinstance(statement, DDL_STATEMENTS):
+                self._ddl(statement, sql_stmt, parameters, shard_key, replicated)
+                return Cursor()
+            if isinstance(statement, TransactionStmt):
+                raise NotSupportedError("Transactions spanning shards are not supported")
+            raise NotSupportedError(f"{type(statement).__name__} is not supported on sharded tables")
+
+    def executemany(self, sql_stmt, seq_of_parameters):
+        """INSERTs are checked as one batch and sent to every shard as one executemany"""
+        seq_of_parameters = list(seq_of_parameters)
+        with self.lock:
+            tokens = self.engine.parser.tokenize(sql_stmt)
+            rows_by_shard = {}
+            table_name = None
+            rows = []
+            for parameters in seq_of_parameters:
+                self.engine.prepare(sql_stmt, self.engine.parser.bind_parameters(tokens, parameters))
+                statement = self.engine.statement
+                if not isinstance(statement, InsertStmt):
+                    break
+                if statement.conflict_action:
+                    raise NotSupportedError("INSERT ... ON CONFLICT is not supported on sharded tables")
+                table_name = statement.table
+                row = dict(zip(statement.columns, [literal.value for literal in statement.values]))
+                rows.append(row)
+                for shard in self._shards_for_row(table_name, row):
+                    rows_by_shard.setdefault(shard, []).append(parameters)
+            else:
+                if not rows:
+                    return 0
+                self._check_insert(table_name, rows)
+                shards = list(rows_by_shard)
+                counts = self._call(shards, 'executemany', [(sql_stmt, rows_by_shard[shard]) for shard in shards])
+                return len(rows) if self.shard_keys[table_name] is None else sum(counts)
+
+        return sum(max(self.execute(sql_stmt, parameters).rowcount, 0) for parameters in seq_of_parameters)
+
+    def shard_stats(self):
+        """Rows per table on every shard"""
+        with self.lock:
+            return self._call(range(self.shards), 'table_sizes')
+
+    def close(self):
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            for connection in self.connections:
+                try:
+                    connection.send(None)
+                except OSError:
+                    pass
+            for process in self.processes:
+                process.join()
+            for connection in self.connections:
+                connection.close()
+
+    # Calls to the shards
+    def _call(self, shards, method, args=()):
+        """Calls a method on shards, all of them run it at the same time.
+           `args` is one tuple for all shards or a list with a tuple per shard"""
+        shards = list(shards)
+        for i, shard in enumerate(shards):
+            self.connections[shard].send((method, args[i] if isinstance(args, list) else args))
+
+        # Every response is read before raising, so the pipes stay in sync
+        results = []
+        error = None
+        for shard in shards:
+            status, value = self.connections[shard].recv()
+            if status == 'error' and error is None:
+                error = Protocol.decode_error(value)
+            results.append(value)
+        if error is not None:
+            raise error
+        return results
+
+    def _run_atomic(self, shards, sql_stmt, parameters):
+        """Runs a statement on several shards, it's committed on all of them or none"""
+        try:
+            counts = self._call(shards, 'prepare_statement', (sql_stmt, parameters))
+        except Exception:
+            self._call(shards, 'rollback')
+            raise
+        self._call(shards, 'commit')
+        return counts
+
+    def _run(self, shards, sql_stmt, parameters):
+        if len(shards) == 1:
+            return [self._call(shards, 'execute', (sql_stmt, parameters))[0][1]]
+        return self._run_atomic(shards, sql_stmt, parameters)
+
+    # Routing
+    def _shards_for_row(self, table_name, row):
+        key = self.shard_keys[table_name]
+        if key is None:
+            return range(self.shards)
+        return [shard_of(row.get(key), self.shards)]
+
+    def _target_shards(self, table_name, where_expr):
+        """Shards holding the rows matched by a WHERE, one shard when it pins the shard key"""
+        key = self.shard_keys[table_name]
+        if key is not None:
+            value = self._pinned_value(where_expr, key)
+            if value is not None:
+                return [shard_of(value, self.shards)]
+        return list(range(self.shards))
+
+    def _pinned_value(self, expression, key):
+        """Value of `key = value` in a WHERE made of ANDs, None if there isn't one"""
+        if isinstance(expression, AND):
+            value = self._pinned_value(expression.left, key)
+            return value if value is not None else self._pinned_value(expression.right, key)
+        if isinstance(expression, EG):
+            for column, literal in ((expression.left, expression.right), (expression.right, expression.left)):
+                if column == key and isinstance(literal, Literal):
+                    return literal.value
+        return None
+
+    def _existing(self, table_name, column, values):
+        """Values of a column present in any shard"""
+        values = {value for value in values if value is not None}
+        if not values:
+            return set()
+        key = self.shard_keys[table_name]
+        if key is None:
+            return self._call([0], 'existing', (table_name, column, values))[0]
+        if key != column:
+            return set().union(*self._call(range(self.shards), 'existing', (table_name, column, values)))
+
+        values_by_shard = {}
+        for value in values:
+            values_by_shard.setdefault(shard_of(value, self.shards), set()).add(value)
+        shards = list(values_by_shard)
+        found = self._call(shards, 'existing', [(table_name, column, values_by_shard[shard]) for shard in shards])
+        return set().union(*found)
+
+    # Statements
+    def _ddl(self, statement, sql_stmt, parameters, shard_key, replicated):
+        key = None
+        if isinstance(statement, CreateStmt):
+            columns = [column for column, _, _ in statement.columns]
+            if shard_key is not None:
+                key = f"{statement.name}.{shard_key}"
+                if key not in columns:
+                    raise ProgrammingError(f"Shard key '{shard_key}' is not a column of table '{statement.name}'")
+            elif not replicated:
+                key = next((column for column, _, constraints in statement.columns
+                            if any(constraint.type == 'PRIMARY KEY' for constraint in constraints)), None)
+            if replicated:
+                key = None
+            for column, _, constraints in statement.columns:
+                for constraint in constraints:
+                    if constraint.type == 'FOREIGN KEY' and any(action != 'RESTRICT' for action in constraint.arg2 or ()):
+                        raise NotSupportedError(f"ON DELETE/ON UPDATE actions of foreign key {column} are not supported on sharded tables")
+
+        self.engine.run_statement(self.engine.plan.execute)
+        self._call(range(self.shards), 'execute', (sql_stmt, parameters))
+
+        if isinstance(statement, CreateStmt):
+            self.shard_keys[statement.name] = key
+        elif isinstance(statement, DropStmt):
+            self.shard_keys.pop(statement.table, None)
+
+    def _select(self, statement, sql_stmt, parameters):
+        if isinstance(self.engine.plan, TableCount):
+            if self.shard_keys[statement.tables[0]] is None:
+                # Every shard holds the whole replicated table
+                columns, rows = self._call([0], 'execute', (sql_stmt, parameters))[0]
+                return Cursor(rows, columns)
+            counts = self._call(range(self.shards), 'execute', (sql_stmt, parameters))
+            total = sum(rows[0][statement.columns[0]] for _, rows in counts)
+            return Cursor([{column: total for column in statement.columns}], statement.columns)
+        if len(statement.tables) > 1 or statement.is_aggregate:
+            # Groups may span shards, they are aggregated here
+            return self._select_joined(statement)
+
+        table_name = statement.tables[0]
+        if self.shard_keys[table_name] is None:
+            shards = [0]
+        else:
+            shards = self._target_shards(table_name, statement.where_expr)
+        results = self._call(shards, 'execute', (sql_stmt, parameters))
+        columns = results[0][0]
+        if statement.order_by and len(results) > 1:
+            # Every shard sorted its rows
+            rows = heapq.merge(*(rows for _, rows in results), key=OrderKey(statement.order_by))
+        else:
+            rows = (row for _, rows in results for row in rows)
+        return Cursor(rows, columns)
+
+    def _select_joined(self, statement):
+        """Gathers the rows of every table and runs the plan here"""
+        rows_by_table = {}
+        for table_name in statement.tables:
+            shards = [0] if self.shard_keys[table_name] is None else range(self.shards)
+            rows_by_table[table_name] = [row for rows in self._call(shards, 'scan', (table_name,)) for row in rows]
+
+        plan = self.engine.plan
+        if isinstance(plan, TableScan):
+            plan = RowsScan(plan.table, rows_by_table[plan.table])
+        self._replace_scans(plan, rows_by_table)
+        return Cursor(plan.iterate(), statement.columns)
+
+    def _replace_scans(self, node, rows_by_table):
+        for name in ('source', 'left', 'right'):
+            child = getattr(node, name, None)
+            if isinstance(child, TableScan):
+                setattr(node, name, RowsScan(child.table, rows_by_table[child.table]))
+            elif isinstance(child, PlanNode):
+                self._replace_scans(child, rows_by_table)
+
+    def _insert(self, statement, sql_stmt, parameters):
+        row = dict(zip(statement.columns, [literal.value for literal in statement.values]))
+        self._check_insert(statement.table, [row])
+        self._run(list(self._shards_for_row(statement.table, row)), sql_stmt, parameters)
+        return 1
+
+    def _update(self, statement, sql_stmt, parameters):
+        table_name = statement.table
+        key = self.shard_keys[table_name]
+        shards = self._target_shards(table_name, statement.where_expr)
+        if any(column == key for column, _ in statement.assignments):
+            raise NotSupportedError(f"Can't update the shard key {key}, the rows would have to move between shards")
+
+        rows = self._preview(table_name, shards, sql_stmt, parameters)
+        constraints = data_manager.get_constraint_for_table(table_name)
+        for column, literal in statement.assignments:
+            new_value = literal.value
+            for constraint in constraints[column]:
+                if constraint.type in ('PRIMARY KEY', 'UNIQUE') and key is not None and new_value is not None:
+                    unchanged = len(rows) == 1 and rows[0].get(column) == new_value
+                    if len(rows) > 1 or (not unchanged and self._existing(table_name, column, [new_value])):
+                        raise IntegrityError(f"Update violates {constraint.type} constraint on column {column}")
+                if constraint.type == 'FOREIGN KEY' and rows and new_value is not None:
+                    self._check_referenced(constraint.arg1, [new_value])
+
+            old_values = {row.get(column) for row in rows if row.get(column) != new_value}
+            for fk in data_manager.foreign_key_manager.get_foreign_keys_referencing(column):
+                referencing_table = fk.referencing_column.split('.')[0]
+                referenced = self._existing(referencing_table, fk.referencing_column, old_values)
+                if referenced:
+                    raise ExecutingError(f"Cannot update '{column}' from {referenced.pop()} to {new_value}: it is referenced by {fk.referencing_column}")
+
+        counts = self._run(shards, sql_stmt, parameters)
+        return counts[0] if key is None else sum(counts)
+
+    def _delete(self, statement, sql_stmt, parameters):
+        table_name = statement.table
+        shards = self._target_shards(table_name, statement.where_expr)
+        rows = self._preview(table_name, shards, sql_stmt, parameters)
+        for fk in data_manager.foreign_key_manager.foreign_keys:
+            if fk.referenced_column.split('.')[0] != table_name:
+                continue
+            referencing_table = fk.referencing_column.split('.')[0]
+            referenced = self._existing(referencing_table, fk.referencing_column, {row.get(fk.referenced_column) for row in rows})
+            if referenced:
+                raise ExecutingError(f"Cannot delete rows of {table_name}: {fk.referenced_column} {referenced.pop()} is referenced by {fk.referencing_column}")
+
+        counts = self._run(shards, sql_stmt, parameters)
+        return counts[0] if self.shard_keys[table_name] is None else sum(counts)
+
+    def _preview(self, table_name, shards, sql_stmt, parameters):
+        if self.shard_keys[table_name] is None:
+            shards = [0]
+        return [row for rows in self._call(shards, 'preview', (sql_stmt, parameters)) for row in rows]
+
+    def _check_insert(self, table_name, rows):
+        """Uniqueness of columns other than the shard key and foreign keys, checked across shards"""
+        key = self.shard_keys[table_name]
+        for column, constraints in data_manager.get_constraint_for_table(table_name).items():
+            for constraint in constraints:
+                if constraint.type in ('PRIMARY KEY', 'UNIQUE') and key is not None and column != key:
+                    values = [row.get(column) for row in rows if row.get(column) is not None]
+                    if len(set(values)) < len(values) or self._existing(table_name, column, values):
+                        raise IntegrityError(f"Violation of {constraint} constraint on column {column}, it must be unique.")
+
+                if constraint.type == 'FOREIGN KEY':
+                    values = {row.get(column) for row in rows}
+                    # Self referencing foreign keys may point to rows of the same batch
+                    values -= {row.get(constraint.arg1) for row in rows}
+                    self._check_referenced(constraint.arg1, values)
+
+    def _check_referenced(self, referenced_column, values):
+        values = {value for value in values if value is not None}
+        missing = values - self._existing(referenced_column.split('.')[0], referenced_column, values)
+        if missing:
+            raise IntegrityError(f"Violation of FOREIGN KEY constraint: no matching value in {referenced_column} for {missing.pop()}")
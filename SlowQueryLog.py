@@ -0,0 +1,122 @@
+import datetime
+import hashlib
+import json
+import logging
+import threading
+from logging.handlers import RotatingFileHandler
+
+from Metrics import MetricsSink
+
+"""
+Slow query log:
+
+    db = RegretDB(slow_query_log=SlowQueryLog('slow.log', threshold=0.05))
+    ...
+    db.slow_query_report(10)     # the 10 statement fingerprints with the most total time
+
+Statements running longer than `threshold` seconds are appended to a rotating file as one JSON object
+per line, with their fingerprint, per-phase timings, rows scanned and returned and the plan tree.
+The fingerprint is the statement with its literals replaced by '?', statements differing only in their
+literals or parameters share it, `id` is a short hash of it.
+
+Time spent by every statement, slow or not, is aggregated per fingerprint for the report.
+"""
+
+
+class FingerprintStats:
+    __slots__ = ('fingerprint', 'statement', 'count', 'slow', 'errors', 'total', 'max', 'rows', 'rows_scanned')
+
+    def __init__(self, fingerprint, statement):
+        self.fingerprint = fingerprint
+        self.statement = statement
+        self.count = 0
+        self.slow = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.rows_scanned = 0
+
+    def as_dict(self):
+        return {
+            'id': fingerprint_id(self.fingerprint),
+            'fingerprint': self.fingerprint,
+            'statement': self.statement,
+            'count': self.count,
+            'slow': self.slow,
+            'errors': self.errors,
+            'total_ms': self.total * 1000,
+            'avg_ms': self.total * 1000 / self.count,
+            'max_ms': self.max * 1000,
+            'rows': self.rows,
+            'rows_scanned': self.rows_scanned,
+        }
+
+
+def fingerprint_id(fingerprint):
+    return hashlib.blake2b(fingerprint.encode('utf-8'), digest_size=8).hexdigest()
+
+
+class SlowQueryLog(MetricsSink):
+    def __init__(self, path, threshold=0.1, max_bytes=10 * 1024 * 1024, backup_count=5, max_fingerprints=10000):
+        self.threshold = threshold  # seconds
+        self.max_fingerprints = max_fingerprints  # fingerprints seen after this many aren't aggregated
+        self.fingerprints = {}  # fingerprint -> FingerprintStats
+        self.__lock = threading.Lock()
+
+        self.handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8', delay=True)
+        self.handler.setFormatter(logging.Formatter('%(message)s'))
+        # A logger of its own, not registered in the logging module, so it doesn't affect the application's logging
+        self.logger = logging.Logger('regretdb.slow_query_log', logging.INFO)
+        self.logger.propagate = False
+        self.logger.addHandler(self.handler)
+
+    def record(self, metrics):
+        duration = metrics.total
+        fingerprint = metrics.fingerprint
+        slow = duration >= self.threshold
+
+        with self.__lock:
+            stats = self.fingerprints.get(fingerprint)
+            if stats is None and len(self.fingerprints) < self.max_fingerprints:
+                stats = self.fingerprints[fingerprint] = FingerprintStats(fingerprint, metrics.statement)
+            if stats is not None:
+                stats.count += 1
+                stats.slow += slow
+                stats.errors += metrics.error is not None
+                stats.total += duration
+                stats.max = max(stats.max, duration)
+                stats.rows += max(metrics.rows, 0)
+                stats.rows_scanned += metrics.rows_scanned
+
+        if slow:
+            self.logger.info(json.dumps(self._entry(metrics, fingerprint, duration), default=str))
+
+    def _entry(self, metrics, fingerprint, duration):
+        return {
+            'time': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='milliseconds'),
+            'id': fingerprint_id(fingerprint),
+            'fingerprint': fingerprint,
+            'sql': metrics.sql,
+            'statement': metrics.statement,
+            'duration_ms': duration * 1000,
+            'phases_ms': {phase: seconds * 1000 for phase, seconds in metrics.phases.items()},
+            'rows': metrics.rows,
+            'rows_scanned': metrics.rows_scanned,
+            'cached': metrics.cached,
+            'error': metrics.error,
+            'plan': str(metrics.plan) if metrics.plan is not None else None,
+        }
+
+    def top(self, n=10, by='total'):
+        """Fingerprints with the largest `by` ('total', 'max', 'count', 'slow' or 'rows_scanned'), largest first"""
+        with self.__lock:
+            ranked = sorted(self.fingerprints.values(), key=lambda stats: getattr(stats, by), reverse=True)
+            return [stats.as_dict() for stats in ranked[:n]]
+
+    def reset(self):
+        with self.__lock:
+            self.fingerprints.clear()
+
+    def close(self):
+        self.handler.close()
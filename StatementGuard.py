@@ -0,0 +1,98 @@
+import threading
+from itertools import islice
+from time import perf_counter
+
+from Exceptions import StatementCanceledError, StatementTimeoutError, RowLimitError
+
+"""
+Timeouts and cancellation of running statements:
+
+    db = RegretDB(statement_timeout=2.0, max_intermediate_rows=10_000_000)
+    db.cancel()     # from another thread, stops the statement db is running
+
+Cancellation is cooperative: the loops of the plan nodes (Filter, Project, joins, Sort, Update,
+Delete) check the statement's guard every CHECK_INTERVAL rows, which raises once the statement was
+canceled or ran past its deadline. A failing statement undoes its changes like any other failing statement.
+Joins and sorts add the rows they produce or hold to the guard, a plan producing more than
+max_intermediate_rows is aborted before it exhausts the memory.
+
+The guard of the statement running on a thread is `current.guard`. Rows of a SELECT are produced while
+they are fetched, so the cursor makes the guard current around every fetch. Only the time spent
+producing rows counts towards the timeout, not the time the caller spends between fetches.
+"""
+
+CHECK_INTERVAL = 1024  # rows between checks
+
+
+class StatementGuard:
+    def __init__(self, timeout=None, max_rows=None):
+        self.timeout = timeout  # seconds, None for no limit
+        self.max_rows = max_rows  # intermediate rows, None for no limit
+        self.remaining = timeout
+        self.deadline = None  # perf_counter() deadline while the statement runs
+        self.rows = 0
+        self.canceled = False
+
+    def start(self):
+        if self.remaining is not None:
+            self.deadline = perf_counter() + self.remaining
+
+    def stop(self):
+        if self.deadline is not None:
+            self.remaining = self.deadline - perf_counter()
+            self.deadline = None
+
+    def cancel(self):
+        """Makes the next check() raise, safe to call from any thread"""
+        self.canceled = True
+
+    def check(self):
+        if self.canceled:
+            raise StatementCanceledError("Statement canceled")
+        if self.deadline is not None and perf_counter() > self.deadline:
+            raise StatementTimeoutError(f"Statement timed out after {self.timeout} seconds")
+
+    def add_rows(self, count):
+        """Counts rows a join produced or a sort holds, then checks the guard"""
+        self.rows += count
+        if self.max_rows is not None and self.rows > self.max_rows:
+            raise RowLimitError(f"Statement aborted, it produced more than {self.max_rows} intermediate rows")
+        self.check()
+
+
+NO_GUARD = StatementGuard()  # current outside of statements run by RegretDB, never raises
+
+
+class CurrentGuard(threading.local):
+    """Guard of the statement running on this thread"""
+
+    def __init__(self):
+        self.guard = NO_GUARD
+
+
+current = CurrentGuard()
+
+
+def run_guarded(guard, func, *args):
+    """Runs func with guard as the current guard of this thread"""
+    previous = current.guard
+    current.guard = guard
+    guard.start()
+    try:
+        return func(*args)
+    finally:
+        guard.stop()
+        current.guard = previous
+
+
+def checked_chunks(rows, size=CHECK_INTERVAL):
+    """Splits rows into lists of `size` rows and checks the current guard before each of them,
+       cheaper than counting rows one by one in the loops of the plan nodes"""
+    guard = current.guard
+    rows = iter(rows)
+    while True:
+        guard.check()
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
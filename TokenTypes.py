@@ -25,9 +25,11 @@ class Constraint:
     def __init__(self, type, arg1=None, arg2=None):
         self.type = type  # PRIMARY KEY, NOT NULL, FOREIGN KEY, UNIQUE, DEFAULT
         self.arg1 = arg1  # Used in default and in foreign key
-        self.arg2 = arg2  # Used in foreign key on update
+        self.arg2 = arg2  # (ON DELETE action, ON UPDATE action) of a foreign key
 
     def __str__(self):
+        if self.arg2 and self.arg2 != ('RESTRICT', 'RESTRICT'):
+            return f"{self.type}({self.arg1} ON DELETE {self.arg2[0]} ON UPDATE {self.arg2[1]})"
         if self.arg1:
             return f"{self.type}({self.arg1})"
         return f"{self.type}"
@@ -42,3 +44,21 @@ class Constraint:
         pass
 
 
+
+class Aggregate:
+    FUNCTIONS = ('COUNT', 'SUM', 'MIN', 'MAX', 'AVG')
+
+    def __init__(self, function, column):
+        self.function = function  # one of FUNCTIONS
+        self.column = column  # column name, '*' for COUNT(*)
+
+    @property
+    def name(self):
+        """Name of the result column, e.g. COUNT(*) or SUM(users.age)"""
+        return f"{self.function}({self.column})"
+
+    def __str__(self):
+        return self.name
+
+    def __repr__(self):
+        return self.name
@@ -0,0 +1,172 @@
+import threading
+
+from Exceptions import ExecutingError, IntegrityError, DeadlockError
+from LockManager import SHARED
+from Metrics import check_scans
+
+"""
+Explicit transactions (BEGIN / COMMIT / ROLLBACK).
+
+Every row change made through DataManager is recorded in an in-memory undo log, undoing the log in
+reverse order restores the tables exactly. Outside of a transaction the log covers a single statement:
+
+self.undo_log = [
+    ('INSERT', 'table_name', index),            # undo: delete the row at index
+    ('UPDATE', 'table_name', index, old_row),   # undo: put old_row back at index
+    ('DELETE', 'table_name', index, old_row),   # undo: re-insert old_row at index
+    ('TABLE', 'table_name', old_rows),          # undo: swap the old list of rows back (bulk operations)
+    ...
+]
+
+Uniqueness and foreign key checks are skipped by the plan nodes inside a transaction, COMMIT validates
+all touched tables in bulk and rolls the whole transaction back if a constraint is violated.
+
+Every thread runs its own statement or transaction (see Transaction), the tables it touches are protected
+by the locks of LockManager, which are released when the statement or the transaction ends.
+Readers of MVCC snapshots don't take any locks.
+"""
+
+
+class Transaction:
+    """State of the statement or transaction running in one thread"""
+
+    def __init__(self):
+        self.active = False  # explicit transaction started by BEGIN
+        self.undo_log = []
+        self.touched_tables = set()
+
+
+class TransactionManager:
+    def __init__(self, data_manager):
+        self.data_manager = data_manager
+        self.local = threading.local()
+
+    @property
+    def current(self):
+        transaction = getattr(self.local, 'transaction', None)
+        if transaction is None:
+            transaction = self.local.transaction = Transaction()
+        return transaction
+
+    @property
+    def active(self):
+        return self.current.active
+
+    def begin(self):
+        if self.active:
+            raise ExecutingError("A transaction is already in progress")
+        self.current.active = True
+
+    def is_owner(self):
+        """Checks if the current thread runs a transaction"""
+        return self.active
+
+    def commit(self):
+        if not self.active:
+            raise ExecutingError("No transaction in progress")
+        try:
+            self.validate()
+        except IntegrityError as e:
+            self.rollback()
+            raise IntegrityError(f"{e.message}, transaction rolled back")
+        self.data_manager.version_manager.commit()
+        self._end()
+
+    def rollback(self):
+        if not self.active:
+            raise ExecutingError("No transaction in progress")
+        self.rollback_to((0, 0))
+        self._end()
+
+    def end_statement(self):
+        """Called after every successful statement, outside of a transaction it commits the statement"""
+        if not self.active:
+            self.data_manager.version_manager.commit()
+            self._end()
+
+    def abort_statement(self, savepoint, error):
+        """Called after a failed statement, undoes its changes.
+           A deadlock victim loses its whole transaction, otherwise the transaction would keep its locks"""
+        if isinstance(error, DeadlockError) and self.active:
+            self.rollback()
+            return
+        self.rollback_to(savepoint)
+        if not self.active:
+            self._end()
+
+    def savepoint(self):
+        return len(self.current.undo_log), self.data_manager.version_manager.savepoint()
+
+    def rollback_to(self, savepoint):
+        """Undoes changes logged after the savepoint, in reverse order"""
+        undo_savepoint, version_savepoint = savepoint
+        undo_log = self.current.undo_log
+        self.data_manager.version_manager.rollback_to(version_savepoint)
+        while len(undo_log) > undo_savepoint:
+            action, table_name, *args = undo_log.pop()
+            if action == 'TABLE':
+                self.data_manager.set_table_rows(table_name, args[0])
+                continue
+
+            table = self.data_manager.get_tables_data(table_name)
+            if action == 'INSERT':
+                del table[args[0]]
+            elif action == 'UPDATE':
+                table[args[0]] = args[1]
+            elif action == 'DELETE':
+                table.insert(args[0], args[1])
+
+    def _end(self):
+        self.local.transaction = Transaction()
+        self.data_manager.lock_manager.release_all()
+        self.data_manager.collect_garbage_if_needed()
+
+    # Undo logging, called by DataManager before a change is applied
+    def log(self, action, table_name, *args):
+        transaction = self.current
+        transaction.undo_log.append((action, table_name, *args))
+        transaction.touched_tables.add(table_name)
+
+    def validate(self):
+        """Checks uniqueness and foreign keys of all touched tables with one hash pass per column"""
+        touched_tables = self.current.touched_tables
+        lock_manager = self.data_manager.lock_manager
+        for table_name in touched_tables:
+            constraints = self.data_manager.get_constraint_for_table(table_name)
+            rows = self.data_manager.get_tables_data(table_name)
+            for column, column_constraints in constraints.items():
+                if any(constraint.type in ('PRIMARY KEY', 'UNIQUE') for constraint in column_constraints):
+                    check_scans.unique += 1
+                    seen = set()
+                    # NULLs never collide, like in the checks of Insert and Update outside transactions
+                    for row in rows:
+                        value = row.get(column)
+                        if value is None:
+                            continue
+                        if value in seen:
+                            raise IntegrityError(f"Violation of UNIQUE constraint on column {column}, duplicate value {value}")
+                        seen.add(value)
+
+        if not self.data_manager.enforce_foreign_keys:
+            return
+
+        # Foreign keys pointing from or to a touched table
+        referenced_values = {}
+        for fk in self.data_manager.foreign_key_manager.foreign_keys:
+            referencing_table = fk.referencing_column.split('.')[0]
+            referenced_table = fk.referenced_column.split('.')[0]
+            if referencing_table not in touched_tables and referenced_table not in touched_tables:
+                continue
+            lock_manager.acquire(referencing_table, SHARED)
+            lock_manager.acquire(referenced_table, SHARED)
+
+            if fk.referenced_column not in referenced_values:
+                check_scans.foreign_key += 1
+                referenced_values[fk.referenced_column] = {row.get(fk.referenced_column) for row in self.data_manager.get_tables_data(referenced_table)}
+            values = referenced_values[fk.referenced_column]
+
+            check_scans.foreign_key += 1
+            for row in self.data_manager.get_tables_data(referencing_table):
+                value = row.get(fk.referencing_column)
+                if value is not None and value not in values:
+                    raise IntegrityError(f"Violation of FOREIGN KEY constraint: no matching value in {fk.referenced_column} for {value}")
@@ -0,0 +1,187 @@
+import threading
+from collections import Counter
+
+"""
+Multi-version concurrency control.
+
+Next to the live row lists used by writers, every table keeps a list of row versions. A version is created
+when a row is inserted (or replaced by an UPDATE) and ended when the row is deleted (or replaced):
+
+self.versions = {
+    'table_name': [RowVersion(row, begin, end), ...],
+    ...
+}
+
+begin and end are commit timestamps, UNCOMMITTED (0) while the writing transaction is still running,
+end is None for versions which were not ended yet and begin is DEAD (-1) for rolled back versions.
+A reader takes a snapshot (the last commit timestamp) and sees exactly the versions committed before it,
+so SELECTs never lock anything while a writer commits.
+Old versions no snapshot can see anymore are reclaimed table by table by collect_table(), see
+DataManager.collect_garbage().
+"""
+
+UNCOMMITTED = 0
+DEAD = -1
+
+
+class RowVersion:
+    __slots__ = ('row', 'begin', 'end')
+
+    def __init__(self, row, begin=UNCOMMITTED, end=None):
+        self.row = row
+        self.begin = begin
+        self.end = end
+
+    def is_visible(self, snapshot):
+        return 0 < self.begin <= snapshot and not (self.end and 0 < self.end <= snapshot)
+
+    def __repr__(self):
+        return f"RowVersion({self.row}, begin={self.begin}, end={self.end})"
+
+
+class VersionManager:
+    def __init__(self, gc_threshold=10000):
+        self.commit_ts = 0
+        self.versions = {}
+        self.current_versions = {}  # {'table_name': {id(live row): RowVersion}}
+        self.row_counts = {}  # {'table_name': (committed rows, commit timestamp of the last change)}
+        self.local = threading.local()  # pending changes of the write transaction running in each thread
+        self.commit_lock = threading.Lock()
+        self.garbage = 0  # versions ended or rolled back since the last collection
+        self.gc_threshold = gc_threshold
+        self.snapshots = Counter()  # snapshot -> number of readers using it
+        # Reentrant: the finalizer of an abandoned cursor may release its snapshot from any point of the thread
+        self.snapshot_lock = threading.RLock()
+
+    def add_table(self, table_name):
+        self.versions[table_name] = []
+        self.current_versions[table_name] = {}
+        self.row_counts[table_name] = (0, 0)
+
+    def drop_table(self, table_name):
+        self.versions.pop(table_name, None)
+        self.current_versions.pop(table_name, None)
+        self.row_counts.pop(table_name, None)
+
+    def get_versions(self, table_name):
+        return self.versions[table_name]
+
+    @property
+    def pending(self):
+        """[('BEGIN' | 'END', 'table_name', RowVersion), ...] of the current thread's write transaction"""
+        pending = getattr(self.local, 'pending', None)
+        if pending is None:
+            pending = self.local.pending = []
+        return pending
+
+    # Called by DataManager for every row change
+    def on_insert(self, table_name, row):
+        version = RowVersion(row)
+        self.versions[table_name].append(version)
+        self.current_versions[table_name][id(row)] = version
+        self.pending.append(('BEGIN', table_name, version))
+
+    def on_delete(self, table_name, row):
+        version = self.current_versions[table_name].pop(id(row))
+        version.end = UNCOMMITTED
+        self.pending.append(('END', table_name, version))
+
+    def on_truncate(self, table_name):
+        """Ends the versions of all live rows of a table"""
+        current = self.current_versions[table_name]
+        self.current_versions[table_name] = {}
+        pending = self.pending
+        for version in current.values():
+            version.end = UNCOMMITTED
+            pending.append(('END', table_name, version))
+
+    # Snapshots
+    def acquire_snapshot(self):
+        with self.snapshot_lock:
+            snapshot = self.commit_ts
+            self.snapshots[snapshot] += 1
+        return snapshot
+
+    def release_snapshot(self, snapshot):
+        with self.snapshot_lock:
+            self.snapshots[snapshot] -= 1
+            if not self.snapshots[snapshot]:
+                del self.snapshots[snapshot]
+
+    # Commit / rollback of the pending changes
+    def savepoint(self):
+        return len(self.pending)
+
+    def commit(self):
+        pending = self.pending
+        if not pending:
+            return
+        # Commits of concurrent transactions are stamped one at a time so timestamps stay in commit order
+        with self.commit_lock:
+            ts = self.commit_ts + 1
+            deltas = {}
+            for action, table_name, version in pending:
+                if action == 'BEGIN':
+                    version.begin = ts
+                    deltas[table_name] = deltas.get(table_name, 0) + 1
+                else:
+                    version.end = ts
+                    deltas[table_name] = deltas.get(table_name, 0) - 1
+                    self.garbage += 1
+            for table_name, delta in deltas.items():
+                if table_name in self.row_counts:
+                    self.row_counts[table_name] = (self.row_counts[table_name][0] + delta, ts)
+            # Publishing the timestamp only after all versions are stamped, so readers see the commit at once
+            self.commit_ts = ts
+        self.local.pending = []
+
+    def rollback_to(self, savepoint):
+        pending = self.pending
+        dead = 0
+        while len(pending) > savepoint:
+            action, table_name, version = pending.pop()
+            if action == 'BEGIN':
+                version.begin = DEAD
+                dead += 1
+                self.current_versions[table_name].pop(id(version.row), None)
+            else:
+                version.end = None
+                self.current_versions[table_name][id(version.row)] = version
+        if dead:
+            with self.commit_lock:
+                self.garbage += dead
+
+    def committed_count(self, table_name, snapshot):
+        """Number of rows visible in a snapshot, None if the table changed after it"""
+        count, changed = self.row_counts[table_name]
+        return count if changed <= snapshot else None
+
+    def needs_collection(self):
+        return self.garbage >= self.gc_threshold
+
+    def oldest_snapshot(self):
+        with self.snapshot_lock:
+            return min(self.snapshots) if self.snapshots else self.commit_ts
+
+    def collect_table(self, table_name, oldest):
+        """Drops the versions of a table invisible to every snapshot, returns the number of reclaimed versions.
+           The caller must keep writers off the table, the list is rebuilt and swapped in so running readers
+           keep iterating the old one"""
+        versions = self.versions.get(table_name)
+        if versions is None:
+            return 0
+        alive = [version for version in versions
+                 if version.begin != DEAD and not (version.end and 0 < version.end <= oldest)]
+        self.versions[table_name] = alive
+        reclaimed = len(versions) - len(alive)
+        with self.commit_lock:
+            self.garbage = max(0, self.garbage - reclaimed)
+        return reclaimed
+
+    def stats(self):
+        return {
+            'commit_ts': self.commit_ts,
+            'versions': sum(len(versions) for versions in self.versions.values()),
+            'garbage': self.garbage,
+            'active_snapshots': sum(self.snapshots.values()),
+        }
@@ -28,3 +28,7 @@ def indent(level=0):
 
 def parse_boolean(boolean_str):
     return boolean_str.upper() == "TRUE"
+
+def is_word_char(ch):
+    """Checks if a character is a regex word character (\\w)"""
+    return ch.isalnum() or ch == '_'